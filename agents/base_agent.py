@@ -1,4 +1,6 @@
-import ollama
+from llm_api import chat
+from negotiation_engine.prompt_builder import TOKEN_BUDGETS, PromptBuilder, estimate_tokens
+from negotiation_engine.routing import router
 
 PERSONA_TEMPLATES = {
     "Aggressive": "You are an aggressive negotiator aiming for quick high-profit deals.",
@@ -8,26 +10,53 @@ PERSONA_TEMPLATES = {
 }
 
 class BaseAgent:
-    def __init__(self, persona, role):
+    def __init__(self, persona, role, backend=None):
         self.persona = persona
         self.role = role  # 'buyer' or 'seller'
+        self.backend = backend  # LLM backend name; None uses NEGOTIATOR_LLM_BACKEND
+
+    # Keys build_context() derives from the product record; the summary uses them directly
+    SUMMARY_SKIP = {"Price (INR/kg)", "Total Price (INR)", "Product Type", "Origin", "Base Market Price",
+                    "Order Size (kg)", "Attributes", "Quality Grade", "name", "category", "origin"}
+    # Free-text fields that add the least to a price negotiation go last so they are trimmed first
+    SUMMARY_LAST = {"description", "Description", "Notes", "notes"}
+
+    def context_fields(self, context):
+        """Headline description plus extra 'key: value' fields, most useful first."""
+        product_type = context.get("Product Type", context.get("category", context.get("name", "product")))
+        summary = (f"{product_type} - {context.get('Variety', 'standard')} ({context.get('Grade', 'standard')} grade) "
+                   f"from {context.get('Origin', context.get('origin', 'unknown origin'))}")
+        if context.get("Season"):
+            summary += f" in {context['Season']}"
+        extras, last = [], []
+        seen = {str(v) for v in (product_type, context.get("Variety"), context.get("Grade"),
+                                 context.get("Origin"), context.get("Season")) if v}
+        for key, value in context.items():
+            if key in self.SUMMARY_SKIP or key in ("Variety", "Grade", "Season"):
+                continue
+            if isinstance(value, str) and value and value not in seen:
+                seen.add(value)
+                (last if key in self.SUMMARY_LAST else extras).append(f"{key}: {value}")
+        return summary, extras + last
 
     def get_context_summary(self, context):
-        summary = f"{context['Product Type']} - {context['Variety']} ({context['Grade']} grade) from {context['Origin']} in {context['Season']},"
-        for key in context.keys():
-            if key not in summary and key not in ["Price (INR/kg)", "Total Price (INR)"]:
-                if isinstance(context[key], str) and context[key] not in summary:
-                    summary += f" {key}: {context[key]},"
-        return summary.strip(',')
+        summary, extras = self.context_fields(context)
+        return ", ".join([summary] + extras)
 
     def respond(self, message, context):
         system_prompt = PERSONA_TEMPLATES.get(self.persona, "You are a negotiator.") + f" You are playing the role of a {self.role}."
+        summary, extras = self.context_fields(context)
+        # The message is sent verbatim, so the context gets whatever budget it leaves
+        budget = max(40, TOKEN_BUDGETS["agent"] - estimate_tokens(system_prompt + " " + message))
+        builder = PromptBuilder("agent", budget=budget)
+        builder.add("context", f"Context: {', '.join([summary] + extras)}", required=True,
+                    shorter=[f"Context: {', '.join([summary] + extras[:len(extras) // 2])}", f"Context: {summary}"])
+        context_text, _ = builder.build()
         try:
-            result = ollama.chat(model='llama3', messages=[
+            return chat([
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Context: {self.get_context_summary(context)}"},
+                {"role": "user", "content": context_text},
                 {"role": "user", "content": message}
-            ])
-            return result['message']['content']
+            ], model=router.model_for(self.role, "chat", self.persona), backend=self.backend)
         except Exception as e:
             return f"[ERROR] LLaMA Response Failed: {e}"
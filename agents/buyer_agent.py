@@ -1,9 +1,14 @@
 from llm_api import ask_llama3
-import re
+from negotiation_engine.persona_params import persona_params
+from negotiation_engine.session import find_price
+from negotiation_engine.trace import NULL_TRACER
 
 class BuyerAgent:
-    def __init__(self, persona="Diplomatic"):
+    def __init__(self, persona="Diplomatic", adaptive=True, max_rounds=20, params=None):
         self.personality = {"personality_type": persona}
+        self.param_source = params or persona_params  # a PersonaParams; the tuner passes candidates here
+        self.adaptive = adaptive  # switch persona to match the seller's tone
+        self.max_rounds = max_rounds
         self.round_num = 0
         self.target_price = None
         self.last_offer_from_seller = None
@@ -15,13 +20,18 @@ class BuyerAgent:
         self.softening_detected = False
         self.intent_log = []
         self.negotiation_outcome = {}
+        self.market_price = None
+        self.buyer_offer_history = []
+        self.converged = False       # convergence ended the negotiation (walk-away or accepted midpoint)
+        self.midpoint_offered = False
+        self.llm_calls_saved = 0
+        self.tracer = NULL_TRACER
 
     # ---------------------------
     # UTILITY FUNCTIONS
     # ---------------------------
     def extract_price(self, msg: str) -> int:
-        match = re.search(r"₹(\d{4,5})\s*per\s*quintal", msg)
-        return int(match.group(1)) if match else None
+        return find_price(msg)
 
     def classify_buyer_intent(self, msg: str) -> str:
         msg = msg.lower()
@@ -52,26 +62,26 @@ class BuyerAgent:
             "Collaborative": "Diplomatic",
             "Neutral": "Balanced"
         }
+        if not self.adaptive:
+            return
         seller_style = self.detect_seller_style(seller_text)
         new_persona = style_to_persona.get(seller_style, self.personality["personality_type"])
         if new_persona != self.personality["personality_type"]:
-            print(f"🔄 Switching buyer persona from {self.personality['personality_type']} to {new_persona} based on seller tone.")
+            self.tracer.emit("persona_switch", role="buyer", old=self.personality["personality_type"], new=new_persona)
             self.personality["personality_type"] = new_persona
 
     # ---------------------------
     # PERSONA MARGIN & COUNTER LOGIC
     # ---------------------------
+    def params(self) -> dict:
+        """Thresholds for the current persona (see negotiation_engine/persona_params.py)."""
+        return self.param_source.buyer(self.personality["personality_type"])
+
     def get_margin_pct_for_persona(self) -> float:
-        persona_margins = {
-            "Assertive": 1.0,  # More aggressive target
-            "Strategic": 0.80,
-            "Balanced": 0.70,
-            "Diplomatic": 0.69
-        }
-        return persona_margins.get(self.personality["personality_type"], 0.01)
+        return self.params()["margin_pct"]
 
     def get_margin_for_persona(self, product_name=None) -> int:
-        base_margin = int(self.get_margin_pct_for_persona() * self.last_offer_from_seller)
+        base_margin = int(self.get_margin_pct_for_persona() * (self.last_offer_from_seller or 0))
         if product_name and product_name.lower() in ["cardamom", "mango", "saffron"]:
             base_margin += 50
         return base_margin
@@ -112,15 +122,53 @@ class BuyerAgent:
                 if drop_pct >= 0.03:
                     self.softening_detected = True
 
+    # ---------------------------
+    # CONVERGENCE LOGIC
+    # ---------------------------
+    def get_convergence_tolerance(self) -> float:
+        return self.params()["convergence_tolerance"]
+
+    def settlement_band(self):
+        """(lowest price the seller accepts, highest the buyer pays): the rule seller's accept_ratio and market."""
+        if not self.market_price:
+            return None
+        return self.market_price * self.param_source.seller()["accept_ratio"], self.market_price
+
+    def settled(self, price):
+        """The negotiation closed at `price`; if the seller took our midpoint, convergence ended it."""
+        if self.midpoint_offered and self.buyer_offer_history and price == self.buyer_offer_history[-1]:
+            self.converged = True
+            self.llm_calls_saved = max(0, self.params()["max_counters"] - self.counter_attempts)
+
+    def detect_convergence(self, window: int = 3) -> bool:
+        """True when the seller/buyer gap stayed within the persona tolerance for the last `window` rounds.
+
+        Both sides re-quoting fixed prices with a wide gap between them is a
+        stalemate, not convergence, and is left to the counter limit.
+        """
+        if len(self.seller_offer_history) < window or len(self.buyer_offer_history) < window:
+            return False
+        tolerance = self.get_convergence_tolerance()
+        sellers = self.seller_offer_history[-window:]
+        buyers = self.buyer_offer_history[-window:]
+        if not all(sellers) or not all(buyers):
+            return False
+        # Each seller offer answers the buyer counter made one round earlier
+        return all(abs(s - b) / s <= tolerance for s, b in zip(sellers, buyers))
+
     # ---------------------------
     # PERSONA TONE
     # ---------------------------
     def get_persona_tone_prefix(self) -> str:
         tone_map = {
+            "Aggressive": "Firmly,",
             "Assertive": "Frankly speaking,",
+            "Analytical": "Based on market analysis,",
             "Strategic": "Considering the bigger picture,",
             "Balanced": "Keeping all factors in mind,",
-            "Diplomatic": "With utmost respect and cooperation,"
+            "Diplomatic": "With utmost respect and cooperation,",
+            "Wildcard": "Let’s shake things up,",
+            "Adaptive": "With careful consideration,"
         }
         return tone_map.get(self.personality["personality_type"], "")
 
@@ -138,6 +186,7 @@ class BuyerAgent:
 
         # Always set target_price to a dynamic percentage based on persona
         if self.round_num == 1 and base_price:
+            self.market_price = base_price
             target_reduction = self.get_margin_pct_for_persona() * 0.05  # Adjust target based on persona
             self.target_price = int(base_price * (1 - target_reduction))  # E.g., 95% for Diplomatic, 90% for Assertive
 
@@ -150,23 +199,47 @@ class BuyerAgent:
 
         buyer_intent = self.classify_buyer_intent(message)
         self.intent_log.append((self.round_num, buyer_intent))
-        print(f"🧠 Buyer Intent Detected (Round {self.round_num}): {buyer_intent} (💭 Thinking...)")
+        self.tracer.emit("intent", round=self.round_num, intent=buyer_intent, sellerPrice=seller_price)
+
+        if self.round_num >= self.max_rounds:
+            self.walk_away_triggered = True
+            return f"{self.get_persona_tone_prefix()} we’ve reached {self.max_rounds} rounds without a deal. 🚪 Walking away."
 
         if seller_price is not None:
+            params = self.params()
             # Only accept if price is below target and after at least 2 rounds
             if seller_price <= self.target_price and self.round_num >= 2:
                 self.negotiation_outcome["final_price"] = seller_price
                 return f"{self.get_persona_tone_prefix()} this price of ₹{seller_price} per quintal ensures profit. 💰 Deal finalized!"
 
-            # Walk away if price remains above target after 5 attempts
-            if self.counter_attempts >= 7 and seller_price > self.target_price:
+            # Walk away if price remains above target after max_counters attempts
+            if self.counter_attempts >= params["max_counters"] and seller_price > self.target_price:
                 self.walk_away_triggered = True
                 return f"{self.get_persona_tone_prefix()} your price of ₹{seller_price} remains unprofitable. 🚪 Walking away."
 
+            # The gap has stayed within tolerance: settle at the midpoint if both sides can accept it,
+            # otherwise stop circling. Either way no more rounds are spent.
+            band = self.settlement_band()
+            if band and self.detect_convergence():
+                midpoint = int((seller_price + self.buyer_offer_history[-1]) / 2)
+                seller_floor, buyer_ceiling = band
+                if not seller_floor <= midpoint <= buyer_ceiling:
+                    self.converged = True
+                    self.llm_calls_saved = max(0, params["max_counters"] - self.counter_attempts)
+                    self.walk_away_triggered = True
+                    return (f"{self.get_persona_tone_prefix()} we keep circling ₹{midpoint}, and no price between "
+                            f"our offers works for both of us. 🚪 Walking away.")
+                # The seller accepts this; the deal closes on its turn (see settled)
+                self.midpoint_offered = True
+                self.counter_attempts += 1
+                self.buyer_offer_history.append(midpoint)
+                return f"{self.get_persona_tone_prefix()} we’re close — would you meet me in the middle at ₹{midpoint} per quintal? 🤝"
+
             # Aggressive counter-offer strategy
-            discount_factor = 0.85 if self.softening_detected else 0.87  # More aggressive discounts
-            counter_offer = max(int(seller_price * discount_factor), self.target_price * 0.90)
+            discount_factor = params["soft_discount"] if self.softening_detected else params["discount"]
+            counter_offer = max(int(seller_price * discount_factor), int(self.target_price * params["floor_ratio"]))
             self.counter_attempts += 1
+            self.buyer_offer_history.append(counter_offer)
 
             if self.suspect_inflation:
                 return f"{self.get_persona_tone_prefix()} I’ve noticed a price increase. Let’s settle at ₹{counter_offer} per quintal. 📉"
@@ -1,17 +1,82 @@
-from llm_api import ask_llama3
+from llm_api import ask_llama3_json, latency_tracker
+from negotiation_engine.offers import OFFER_FORMAT_HINT, OFFER_SCHEMA, render_offer, validate_offer
+from negotiation_engine.persona_params import persona_params
+from negotiation_engine.prompt_builder import PromptBuilder, shorten_quote
+from negotiation_engine.reply_templates import ReplyTemplates, reply_templates
+from negotiation_engine.routing import router
+from negotiation_engine.trace import NULL_TRACER
+
+SELLER_PERSONAS = ["Analytical", "Aggressive", "Collaborative", "Neutral"]
 
 class SellerAgent:
-    def __init__(self, persona="Analytical", min_margin=0.10, max_rounds=15):
+    def __init__(self, persona="Analytical", min_margin=None, max_rounds=15, rule_only=False, backend=None,
+                 params=None):
         self.persona = persona
-        self.min_margin = min_margin
+        self.param_source = params or persona_params  # a PersonaParams; the tuner passes candidates here
+        self.backend = backend  # LLM backend name; None uses NEGOTIATOR_LLM_BACKEND
+        self.min_margin = self.param_source.seller(persona)["min_margin"] if min_margin is None else min_margin
         self.max_rounds = max_rounds
+        self.rule_only = rule_only  # answer from the computed numbers without calling the LLM
         self.current_round = 0
         self.accepted = False
+        self.last_buyer_offer = None
+        self.stalled_rounds = 0     # consecutive rounds the buyer's offer barely moved
+        self.conceding = False      # stalemate seen: counter with late_inflation from now on
+        self.last_reply_mode = "llm"
+        self.last_prompt_tokens = 0
+        self.prompt_tokens_total = 0
+        self.last_trimmed = []
+        self.tracer = NULL_TRACER
 
-    def respond(self, message: str, context: dict) -> str:
+    def detect_buyer_style(self, text: str) -> str:
+        text = text.lower()
+        if "firm" in text or "final" in text or "no lower" in text:
+            return "Aggressive"
+        elif "market" in text or "fair" in text or "value" in text:
+            return "Analytical"
+        elif "compromise" in text or "meet halfway" in text or "reasonable" in text:
+            return "Collaborative"
+        else:
+            return "Neutral"
+
+    def switch_persona(self, buyer_text: str):
+        """Only the Adaptive persona mirrors the buyer's tone."""
+        if self.persona != "Adaptive":
+            return
+        style_to_persona = {
+            "Aggressive": "Assertive",
+            "Analytical": "Strategic",
+            "Collaborative": "Diplomatic",
+            "Neutral": "Balanced"
+        }
+        new_persona = style_to_persona.get(self.detect_buyer_style(buyer_text), "Analytical")
+        if new_persona != self.persona:
+            self.tracer.emit("persona_switch", role="seller", old=self.persona, new=new_persona)
+            self.persona = new_persona
+
+    def track_stalemate(self, buyer_offer, params: dict):
+        """Concede early once the buyer stops moving.
+
+        Countering a firm buyer with early_inflation re-quotes the same gap every
+        round (the buyer discounts, the seller re-inflates), so neither side's
+        acceptance rule can ever fire.
+        """
+        if buyer_offer and self.last_buyer_offer:
+            moved = abs(buyer_offer - self.last_buyer_offer) / self.last_buyer_offer
+            self.stalled_rounds = self.stalled_rounds + 1 if moved < params["stalemate_move"] else 0
+            if params["stalemate_rounds"] and self.stalled_rounds >= params["stalemate_rounds"]:
+                if not self.conceding:
+                    self.tracer.emit("seller_concedes", round=self.current_round, buyerOffer=buyer_offer)
+                self.conceding = True
+        self.last_buyer_offer = buyer_offer or self.last_buyer_offer
+
+    def plan_turn(self, message: str, context: dict) -> dict:
+        """Decide this round's move and assemble its prompt, without calling the LLM."""
         self.current_round += 1
+        self.accepted = False  # set again below only if this turn accepts
+        self.switch_persona(message)
 
-        product = context.get("Product", "unknown product")
+        product = context.get("Product", context.get("name", "unknown product"))
         variety = context.get("Variety", "")
         origin = context.get("Origin", context.get("Market", ""))
         order_size = context.get("Order Size (kg)", 100)
@@ -29,45 +94,166 @@ class SellerAgent:
 
         attr_summary = ", ".join([f"{k}: {v}" for k, v in attributes.items()]) if attributes else "no special attributes"
 
-        prompt = (
-            f"You are an {self.persona} seller offering {order_size}kg of {quality} grade {product} ({variety}) "
-            f"from {origin}. The product has {attr_summary}. "
+        builder = PromptBuilder("seller")
+        builder.add(
+            "intro",
+            f"You are an {self.persona} seller offering {order_size}kg of {quality} grade {product} ({variety}) from {origin}.",
+            priority=5, required=True,
+            shorter=[f"You are an {self.persona} seller of {product}."]
+        )
+        builder.add(
+            "attributes",
+            f"The product has {attr_summary}.",
+            priority=1,
+            shorter=["The product is export grade."] if attributes.get("export_grade") else None
         )
+        prompt = ""
 
         # Decision logic
-        if base_price and buyer_offer:
+        params = self.param_source.seller(self.persona)
+        self.track_stalemate(buyer_offer, params)
+        decision = "inquiry"
+        reply_price = None
+        if self.current_round >= self.max_rounds:
+            decision = "walk_away"
+            prompt += f"After {self.max_rounds} rounds, no agreement has been reached. Politely walk away from the deal. "
+        elif base_price and buyer_offer:
             target_price = base_price * (1 + margin)
-            accept_threshold = base_price * 1.10
+            accept_threshold = base_price * params["accept_ratio"]
 
             if buyer_offer >= accept_threshold:
                 self.accepted = True
+                decision = "accept"
+                reply_price = buyer_offer
                 prompt += (
                     f"The buyer has offered ₹{buyer_offer:.0f}, which meets your acceptance threshold of ₹{accept_threshold:.0f}. "
                     "Accept the offer confidently."
                 )
-            elif self.current_round > 12 and buyer_offer < base_price * 1.05:
+            elif self.current_round > params["seller_walk_round"] and buyer_offer < base_price * params["seller_walk_ratio"]:
+                decision = "walk_away"
+                reply_price = base_price * params["seller_walk_ratio"]
                 prompt += (
-                    f"The buyer has repeatedly offered below ₹{base_price * 1.05:.0f} even after 12 rounds. "
+                    f"The buyer has repeatedly offered below ₹{reply_price:.0f} even after {params['seller_walk_round']} rounds. "
                     "Politely walk away from the deal."
                 )
             else:
-                inflation_rate = 0.15 if self.current_round <= 8 else 0.05
+                early = self.current_round <= params["inflation_switch_round"] and not self.conceding
+                inflation_rate = params["early_inflation"] if early else params["late_inflation"]
                 counter_offer = int(buyer_offer * (1 + inflation_rate))
+                decision = "counter"
+                reply_price = counter_offer
                 prompt += (
                     f"The buyer has offered ₹{buyer_offer:.0f}. Counter with ₹{counter_offer:.0f} "
                     f"based on a {int(inflation_rate * 100)}% inflation strategy. "
                 )
         elif base_price:
             target_price = base_price * (1 + margin)
+            decision = "opening"
+            reply_price = target_price
             prompt += f"Based on market price ₹{base_price:.0f}, your target price is ₹{target_price:.0f} per quintal. "
 
-        prompt += (
-            f"The buyer says: '{message}'. "
-            "Respond with a smart price offer or counter-offer. Be concise and confident."
+        builder.add("decision", prompt, priority=10, required=True)
+        builder.add(
+            "buyer_message",
+            f"The buyer says: '{message}'.",
+            priority=2,
+            shorter=[f"The buyer says: '{shorten_quote(message, 40)}'.", f"The buyer says: '{shorten_quote(message, 15)}'."]
         )
+        builder.add("closing", "Respond with a smart price offer or counter-offer. Be concise and confident. "
+                    + OFFER_FORMAT_HINT, priority=10, required=True)
 
-        return ask_llama3(prompt)
+        return {
+            "decision": decision,
+            "price": reply_price,
+            "product": product,
+            "order_size": order_size,
+            "base_price": base_price,
+            "instruction": prompt,
+            "builder": builder,
+            # Numbers a stored reply template may be re-rendered with
+            "values": {"price": reply_price, "offer": buyer_offer, "market": base_price, "quantity": order_size}
+        }
+
+    def respond(self, message: str, context: dict) -> str:
+        turn = self.plan_turn(message, context)
+        decision, reply_price, builder = turn["decision"], turn["price"], turn["builder"]
+        product, order_size, base_price = turn["product"], turn["order_size"], turn["base_price"]
+
+        if self.rule_only:
+            self.last_reply_mode = "rule"
+            self.last_prompt_tokens = 0
+            return self.rule_based_reply(decision, reply_price, product, order_size)
+
+        # Latency SLO breached: skip the LLM and answer from the computed numbers
+        if not latency_tracker.should_use_llm():
+            self.last_reply_mode = "degraded"
+            self.last_prompt_tokens = 0
+            self.tracer.emit("seller_decision", round=self.current_round, decision=decision,
+                             price=reply_price, mode="degraded")
+            return self.rule_based_reply(decision, reply_price, product, order_size)
+
+        # Looked up before the template check (the model is part of the template key), counted only on an LLM call
+        model = router.model_for("seller", decision, self.persona, count=False)
+        template_key = ReplyTemplates.key(self.persona, product, model, decision, turn["instruction"])
+        reused = reply_templates.reuse(template_key, turn["values"], base_price)
+        if reused is not None:
+            # Same persona, product and decision as an earlier LLM reply: re-render it with this round's prices
+            self.last_reply_mode = "template"
+            self.last_prompt_tokens = 0
+            self.tracer.emit("seller_decision", round=self.current_round, decision=decision,
+                             price=reply_price, mode="template")
+            return reused
+
+        self.last_reply_mode = "llm"
+        router.count("seller", decision, model)
+        prompt, tokens = builder.build()
+        self.last_prompt_tokens = tokens
+        self.prompt_tokens_total += tokens
+        self.last_trimmed = builder.trimmed
+        self.tracer.emit("seller_decision", round=self.current_round, decision=decision, price=reply_price,
+                         mode="llm", model=model, promptTokens=tokens, trimmed=builder.trimmed)
+        try:
+            offer = ask_llama3_json(prompt, OFFER_SCHEMA, lambda data: validate_offer(data, base_price), model=model,
+                                    backend=self.backend)
+        except TimeoutError:
+            # Already recorded as a latency sample; answer this round from the computed numbers
+            self.last_reply_mode = "degraded"
+            self.tracer.emit("llm_timeout", round=self.current_round, model=model)
+            return self.rule_based_reply(decision, reply_price, product, order_size)
+        if offer is None:
+            # Still unusable after the repair retry: answer from the computed numbers
+            self.last_reply_mode = "rule"
+            self.tracer.emit("invalid_llm_offer", round=self.current_round)
+            return self.rule_based_reply(decision, reply_price, product, order_size)
+        reply_templates.store(template_key, offer, turn["values"])
+        return render_offer(offer)
+
+    def rule_based_reply(self, decision: str, price, product: str, order_size) -> str:
+        """Deterministic reply used while the LLM is over its latency SLO or returns no usable offer."""
+        if decision == "accept":
+            return f"I accept your offer of ₹{price:.0f} per quintal. Deal confirmed."
+        if decision == "walk_away":
+            if price:
+                return f"Offers below ₹{price:.0f} per quintal don't work for us, so I must politely walk away."
+            return "We couldn't reach an agreement, so I must politely walk away."
+        if decision == "counter":
+            return f"I can offer ₹{price:.0f} per quintal, considering the quality and current market."
+        if decision == "opening":
+            return f"My offer for {order_size}kg of {product} is ₹{price:.0f} per quintal."
+        return "Please share your offer per quintal so we can proceed."
+
+    def replay(self, reply: str, mode: str = "llm") -> str:
+        """Use a precomputed reply for this round (e.g. a warmed-up opening turn), keeping the mode it was made in."""
+        self.current_round += 1
+        self.accepted = False
+        self.last_reply_mode = mode
+        self.last_prompt_tokens = 0
+        return reply
 
     def reset(self):
         self.current_round = 0
         self.accepted = False
+        self.last_buyer_offer = None
+        self.stalled_rounds = 0
+        self.conceding = False
+        self.last_reply_mode = "llm"
@@ -1,10 +1,23 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import json
+import os
+import threading
 import time
-import re
 from agents.buyer_agent import BuyerAgent
 from agents.seller_agent import SellerAgent
 from negotiation_engine.logger import log_round
+from negotiation_engine.encoding import response_options, encode_response
+from negotiation_engine.batch import batch_options, expand_jobs, run_batch, BATCH_MAX_JOBS
+from llm_api import get_backend, hedger, latency_tracker, model_stats, structured_stats
+from negotiation_engine.warmup import warmup_state, WARMUP_ENABLED
+from negotiation_engine.session import NegotiationSession, build_context
+from negotiation_engine.session_state import SessionExpired, SessionStore, StaleSession
+from negotiation_engine.trace import trace_registry
+from negotiation_engine.basket import BasketNegotiation, BASKET_MAX_LINES
+from negotiation_engine.admission import admission, AdmissionRejected
+from negotiation_engine.routing import router
+from negotiation_engine.reply_templates import reply_templates
+from negotiation_engine.memory import memory_monitor
 
 app = Flask(__name__)
 
@@ -12,6 +25,54 @@ app = Flask(__name__)
 with open('products.json', 'r') as f:
     products_data = json.load(f)
 
+MAX_NEGOTIATION_SECONDS = 180  # wall-clock budget before /negotiate falls back
+
+# Latest prices published by data/ingest_daemon.py (replaced atomically, so always complete)
+MARKET_SNAPSHOT_FILE = os.path.join("data", "market_snapshot.json")
+_market_snapshot = {"mtime": None, "data": {}}
+
+def load_market_snapshot():
+    try:
+        mtime = os.stat(MARKET_SNAPSHOT_FILE).st_mtime
+    except FileNotFoundError:
+        return {}
+    if mtime != _market_snapshot["mtime"]:
+        with open(MARKET_SNAPSHOT_FILE, "r", encoding="utf-8") as f:
+            _market_snapshot["data"] = json.load(f)
+        _market_snapshot["mtime"] = mtime
+    return _market_snapshot["data"]
+
+# Paused interactive sessions. Without NEGOTIATOR_SESSION_DIR they live in this worker only and the least
+# recently used beyond NEGOTIATOR_MAX_SESSIONS expire (410); with it every worker reads and writes the shared files
+session_store = SessionStore(
+    lambda name: build_context(find_product(name)),
+    max_sessions=int(os.environ.get("NEGOTIATOR_MAX_SESSIONS", 10000)),
+    spill_dir=os.environ.get("NEGOTIATOR_SESSION_DIR")
+)
+
+# Running totals for early stopping on converged offers
+convergence_stats = {"negotiations": 0, "converged": 0, "llmCallsSaved": 0}
+_stats_lock = threading.Lock()
+
+def convergence_summary(buyer, round_num, max_rounds):
+    """Per-negotiation convergence fields for the summary; also updates the running totals."""
+    calls_saved = min(buyer.llm_calls_saved, max(0, max_rounds - round_num)) if buyer.converged else 0
+    with _stats_lock:
+        convergence_stats["negotiations"] += 1
+        convergence_stats["converged"] += int(buyer.converged)
+        convergence_stats["llmCallsSaved"] += calls_saved
+    return {"converged": buyer.converged, "llmCallsSaved": calls_saved}
+
+def client_id():
+    """Fair-queuing lane: an explicit X-Client-Id (e.g. per batch tool) or the caller's address."""
+    return request.headers.get("X-Client-Id") or request.remote_addr
+
+@app.errorhandler(AdmissionRejected)
+def server_busy(rejected):
+    response = jsonify({"error": f"Server busy ({rejected.reason}), please retry.", "retryAfter": rejected.retry_after})
+    response.headers["Retry-After"] = str(rejected.retry_after)
+    return response, 429
+
 @app.route("/")
 def index():
     products = [product["name"] for product in products_data]
@@ -20,169 +81,183 @@ def index():
 @app.route("/negotiate", methods=["POST"])
 def negotiate():
     data = request.get_json()
-    buyer_persona = data.get("buyerPersona", "Diplomatic")
-    seller_persona = data.get("sellerPersona", "Analytical")
-    selected_product = data.get("product")
-
-    # Filter product based on selection
-    context = next((p for p in products_data if p["name"] == selected_product), None)
-    if not context:
+    options = response_options(data, request.args)
+    with admission.admit(client_id()):
+        payload = run_negotiation(
+            data.get("product"),
+            data.get("buyerPersona", "Diplomatic"),
+            data.get("sellerPersona", "Analytical")
+        )
+    if payload is None:
         return jsonify({"error": "No data found for selected product."}), 400
+    return encode_response(payload, options, request)
 
-    context["Order Size (kg)"] = context.get("quantity", 100)
-    context["Product Type"] = context.get("category", context["name"])
-    context["Origin"] = context.get("origin", "")
-    context["Base Market Price"] = context.get("base_market_price", 0)
-    context["Attributes"] = context.get("attributes", {})
+@app.route("/negotiate/batch", methods=["POST"])
+def negotiate_batch():
+    data = request.get_json() or {}
+    jobs = expand_jobs(data)
+    if not jobs:
+        return jsonify({"error": "No jobs given."}), 400
+    if len(jobs) > BATCH_MAX_JOBS:
+        return jsonify({"error": f"Batch too large: {len(jobs)} jobs (max {BATCH_MAX_JOBS})."}), 400
 
-    seller = SellerAgent(persona=seller_persona)
-    buyer = BuyerAgent(persona=buyer_persona)
+    try:
+        concurrency, deadline = batch_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    client = client_id()
+    start = time.time()
 
-    messages = []
-    round_num = 1
-    max_rounds = 15
-    min_required_rounds = 4
-    start_time = time.time()
-    max_duration = 180
-    opening_price = None
-    final_price = None
-
-    def deal_reached(buyer_msg, seller_msg):
-        keywords = ["finalize", "agreed", "let's proceed", "deal", "confirmed", "move forward"]
-        return any(kw in buyer_msg.lower() for kw in keywords) or any(kw in seller_reply.lower() for kw in keywords)
-
-    def extract_final_price(messages):
-        for msg in reversed(messages):
-            if msg["sender"] in ["Buyer", "Seller"]:
-                match = re.search(r"₹(\d{4,5})\s*per\s*quintal", msg["text"])
-                if match:
-                    return int(match.group(1))
-        return None
+    def run_job(job):
+        # Jobs queue in the caller's lane, so a large batch only delays its own jobs,
+        # and never wait for admission past the batch's own deadline
+        with admission.admit(client, max_wait=max(0, start + deadline - time.time())):
+            payload = run_negotiation(job["product"], job["buyerPersona"], job["sellerPersona"])
+        if payload is None:
+            raise ValueError("No data found for selected product.")
+        return payload["summary"]
+
+    def stream():
+        for record in run_batch(jobs, run_job, concurrency=concurrency, deadline=deadline):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+@app.route("/negotiate/basket", methods=["POST"])
+def negotiate_basket():
+    """Negotiate several products with one buyer; the seller answers all open lines in one LLM call per round."""
+    data = request.get_json() or {}
+    names = data.get("products") or []
+    if not names or len(names) > BASKET_MAX_LINES:
+        return jsonify({"error": f"Give between 1 and {BASKET_MAX_LINES} products."}), 400
+    if len(set(names)) != len(names):
+        return jsonify({"error": "Each product can appear in the basket only once."}), 400
+    products = {p["name"]: p for p in products_data}
+    unknown = [name for name in names if name not in products]
+    if unknown:
+        return jsonify({"error": f"No data found for: {', '.join(unknown)}."}), 400
+
+    buyer_persona = data.get("buyerPersona", "Diplomatic")
+    seller_persona = data.get("sellerPersona", "Analytical")
+    tracer = trace_registry.start(basket=names, buyerPersona=buyer_persona, sellerPersona=seller_persona)
+    basket = BasketNegotiation([build_context(products[name]) for name in names], buyer_persona, seller_persona,
+                               tracer=tracer, max_rounds=SESSION_MAX_ROUNDS, min_rounds=SESSION_MIN_ROUNDS)
+    with admission.admit(client_id()):
+        payload = basket.run(opening_message, deadline=time.time() + MAX_NEGOTIATION_SECONDS)
+    for line in basket.lines:
+        session = line.session
+        log_round(session.context, session.buyer.personality["personality_type"], seller_persona, session.round_num)
+    return encode_response(payload, response_options(data, request.args), request)
+
+def opening_message(context):
+    return f"What’s your offer for {context['Order Size (kg)']}kg of {context.get('Variety', '')} {context['Product Type']} from {context['Origin']}?"
 
-    def extract_opening_price(messages):
-        for msg in messages:
-            if msg["sender"] == "Seller":
-                match = re.search(r"₹(\d{4,5})\s*per\s*quintal", msg["text"])
-                if match:
-                    return int(match.group(1))
+def find_product(name):
+    return next((p for p in products_data if p["name"] == name), None)
+
+def run_negotiation(selected_product, buyer_persona, seller_persona):
+    """Run one full negotiation and return the response payload, or None for an unknown product."""
+    product = find_product(selected_product)
+    if not product:
         return None
+    context = build_context(product)
 
-    # Round 1: Buyer initiates with price inquiry
-    message = f"What’s your offer for {context['Order Size (kg)']}kg of {context.get('Variety', '')} {context['Product Type']} from {context['Origin']}?"
-    messages.append({"sender": "Buyer", "text": message})
-
-    while time.time() - start_time < max_duration and round_num <= max_rounds:
-        seller_reply = seller.respond(message, context)
-        messages.append({"sender": "Seller", "text": f"📣 {seller_reply}"})
-
-        if round_num == 1:
-            opening_price = extract_opening_price(messages)
-
-        buyer.switch_persona(seller_reply)
-        message = buyer.respond(seller_reply, context)
-        messages.append({"sender": "Buyer", "text": f"🛒 {message}"})
-
-        # 🚪 Walk-away logic
-        if buyer.walk_away_triggered:
-            messages.append({"sender": "System", "text": "🚪 Buyer walked away — negotiation ended."})
-            log_round(context, buyer.personality["personality_type"], seller.persona, round_num)
-            return jsonify({
-                "context": context,
-                "messages": messages,
-                "rounds": {"current": round_num, "max": max_rounds},
-                "finalPrice": None,
-                "buyerPersona": buyer.personality,
-                "marginUsed": buyer.get_margin_for_persona(context["name"]),
-                "summary": {
-                    "openingPrice": opening_price,
-                    "finalPrice": None,
-                    "marketPrice": context["Base Market Price"],
-                    "margin": None,
-                    "marginType": "Walkaway",
-                    "buyerPersona": buyer.personality["personality_type"],
-                    "sellerPersona": seller.persona,
-                    "totalRounds": round_num,
-                    "regret": False,
-                    "walkedAway": True
-                }
-            })
-
-        if deal_reached(message, seller_reply):
-            if round_num < min_required_rounds:
-                messages.append({"sender": "System", "text": f"⛔ Deal attempt blocked — minimum {min_required_rounds} rounds required."})
-                round_num += 1
-                continue
-
-            messages.append({"sender": "System", "text": "🤝 Deal reached — negotiation ended."})
-            final_price = extract_final_price(messages)
-            buyer.log_regret(final_price, float(context["Base Market Price"]))  # Ensure float for consistency
-            log_round(context, buyer.personality["personality_type"], seller.persona, round_num)
-
-            margin = context["Base Market Price"] - final_price if final_price else 0
-            margin_type = "Profit" if margin > 0 else "Loss"
-            buyer_profit_percent = (margin / context["Base Market Price"]) * 100 if context["Base Market Price"] else 0
-            seller_margin = final_price - (context["Base Market Price"] * 0.9)  # Assuming 90% as seller's base
-            seller_profit_percent = (seller_margin / context["Base Market Price"]) * 100 if context["Base Market Price"] else 0
-
-            return jsonify({
-                "context": context,
-                "messages": messages,
-                "rounds": {"current": round_num, "max": max_rounds},
-                "finalPrice": final_price,
-                "buyerPersona": buyer.personality,
-                "marginUsed": buyer.get_margin_for_persona(context["name"]),
-                "summary": {
-                    "openingPrice": opening_price,
-                    "finalPrice": final_price,
-                    "marketPrice": context["Base Market Price"],
-                    "margin": abs(round(margin, 2)),
-                    "marginType": margin_type,
-                    "buyerProfitPercent": round(buyer_profit_percent, 2),
-                    "sellerProfitPercent": round(seller_profit_percent, 2),
-                    "buyerPersona": buyer.personality["personality_type"],
-                    "sellerPersona": seller.persona,
-                    "totalRounds": round_num,
-                    "regret": buyer.regret_flag,
-                    "walkedAway": False
-                }
-            })
-
-        round_num += 1
-
-    messages.append({"sender": "System", "text": "⏳ Fallback triggered — negotiation ended."})
-    final_price = extract_final_price(messages)
-    opening_price = opening_price or extract_opening_price(messages)
-    buyer.log_regret(final_price, float(context["Base Market Price"]))  # Ensure float for consistency
-    log_round(context, buyer.personality["personality_type"], seller.persona, round_num)
-
-    margin = context["Base Market Price"] - final_price if final_price else 0
-    margin_type = "Profit" if margin > 0 else "Loss"
-    buyer_profit_percent = (margin / context["Base Market Price"]) * 100 if context["Base Market Price"] else 0
-    seller_margin = final_price - (context["Base Market Price"] * 0.9)  # Assuming 90% as seller's base
-    seller_profit_percent = (seller_margin / context["Base Market Price"]) * 100 if context["Base Market Price"] else 0
+    max_rounds = 15
+    tracer = trace_registry.start(product=context["name"], buyerPersona=buyer_persona, sellerPersona=seller_persona)
+    session = NegotiationSession(
+        context, BuyerAgent(persona=buyer_persona), SellerAgent(persona=seller_persona),
+        max_rounds=max_rounds, min_rounds=4, max_seconds=MAX_NEGOTIATION_SECONDS,
+        tracer=tracer, opening_cache=warmup_state.opening_turn
+    )
+    session.start(opening_message(context))
+    for _ in session.turns():
+        pass
 
-    return jsonify({
+    buyer, round_num = session.buyer, session.round_num
+    log_round(context, buyer.personality["personality_type"], session.seller.persona, round_num)
+    payload = {
+        "traceId": tracer.trace_id,
         "context": context,
-        "messages": messages,
+        "messages": session.messages,
         "rounds": {"current": round_num, "max": max_rounds},
-        "finalPrice": final_price,
+        "finalPrice": session.final_price,
         "buyerPersona": buyer.personality,
         "marginUsed": buyer.get_margin_for_persona(context["name"]),
-        "summary": {
-            "openingPrice": opening_price,
-            "finalPrice": final_price,
-            "marketPrice": context["Base Market Price"],
-            "margin": abs(round(margin, 2)),
-            "marginType": margin_type,
-            "buyerProfitPercent": round(buyer_profit_percent, 2),
-            "sellerProfitPercent": round(seller_profit_percent, 2),
-            "buyerPersona": buyer.personality["personality_type"],
-            "sellerPersona": seller.persona,
-            "totalRounds": round_num,
-            "regret": buyer.regret_flag,
-            "walkedAway": False
-        }
-    })
+        "summary": {**session.summary(), **convergence_summary(buyer, round_num, max_rounds)}
+    }
+    memory_monitor.record(session, payload)
+    return payload
+
+# ---------------------------
+# RESUMABLE SESSIONS
+# ---------------------------
+SESSION_MAX_ROUNDS = 15
+SESSION_MIN_ROUNDS = 4
+
+def session_payload(session, new_messages):
+    return {
+        "sessionId": session.session_id,
+        "product": session.product,
+        "status": session.status,
+        "round": session.round_num,
+        "openingPrice": session.opening_price,
+        "finalPrice": session.final_price,
+        "messages": new_messages
+    }
+
+@app.route("/session", methods=["POST"])
+def start_session():
+    data = request.get_json() or {}
+    product = find_product(data.get("product"))
+    if not product:
+        return jsonify({"error": "No data found for selected product."}), 400
+    context = build_context(product)
+
+    session = NegotiationSession(
+        context,
+        BuyerAgent(persona=data.get("buyerPersona", "Diplomatic")),
+        SellerAgent(persona=data.get("sellerPersona", "Analytical")),
+        max_rounds=SESSION_MAX_ROUNDS, min_rounds=SESSION_MIN_ROUNDS
+    )
+    session.set_tracer(trace_registry.start(session.session_id, product=product["name"], session=True))
+    new_messages = session.start(opening_message(context)) + session.step()
+    session_store.save(session)
+    return jsonify(session_payload(session, new_messages)), 201
+
+@app.errorhandler(SessionExpired)
+def session_expired(e):
+    return jsonify({"error": "Session expired; start a new one."}), 410
+
+@app.errorhandler(StaleSession)
+def stale_session(e):
+    return jsonify({"error": "Session was updated by another request; reload it and retry."}), 409
+
+@app.route("/session/<session_id>", methods=["GET"])
+def get_session(session_id):
+    session = session_store.load(session_id)
+    if not session:
+        return jsonify({"error": "Unknown session."}), 404
+    return jsonify(session_payload(session, session.messages))
+
+@app.route("/session/<session_id>/step", methods=["POST"])
+def step_session(session_id):
+    """Play one round. With {"message": ...} a human plays the buyer; otherwise the BuyerAgent does."""
+    session = session_store.load(session_id)
+    if not session:
+        return jsonify({"error": "Unknown session."}), 404
+    if not session.is_open:
+        return jsonify({"error": f"Session already ended ({session.status})."}), 409
+
+    data = request.get_json(silent=True) or {}
+    tracer = trace_registry.get_or_start(session_id, product=session.product, session=True)
+    session.set_tracer(tracer)
+    new_messages = session.step(data.get("message") or None)
+    if session.is_open:
+        new_messages += session.step()
+
+    tracer.emit("step", round=session.round_num, status=session.status, human=bool(data.get("message")))
+    session_store.save(session)
+    return jsonify(session_payload(session, new_messages))
 
 @app.route("/health")
 def health_check():
@@ -191,5 +266,43 @@ def health_check():
     except Exception as e:
         return f"❌ Error: {str(e)}", 500
 
+@app.route("/market")
+def market_prices():
+    return jsonify(load_market_snapshot())
+
+@app.route("/stats")
+def stats():
+    with _stats_lock:
+        convergence = dict(convergence_stats)
+    return jsonify({
+        "convergence": convergence,
+        "llmLatency": latency_tracker.stats(),
+        "structuredOutput": dict(structured_stats),
+        "hedging": hedger.stats(),
+        "llmBackend": get_backend().stats(),
+        "models": {"routing": router.stats(), "calls": {m: dict(v) for m, v in model_stats.items()}},
+        "sessions": session_store.stats(),
+        "traces": trace_registry.stats(),
+        "admission": admission.stats(),
+        "replyTemplates": reply_templates.stats(),
+        "memory": memory_monitor.stats()
+    })
+
+@app.route("/debug/trace/<trace_id>")
+def debug_trace(trace_id):
+    tracer = trace_registry.get(trace_id)
+    if not tracer:
+        return jsonify({"error": "Unknown or expired trace."}), 404
+    return jsonify(tracer.snapshot())
+
+@app.route("/ready")
+def readiness_check():
+    report = warmup_state.report()
+    return jsonify(report), 200 if report["ready"] else 503
+
+# Optional warm-up (NEGOTIATOR_WARMUP=1): load the model and precompute opening seller turns
+if WARMUP_ENABLED:
+    warmup_state.start(products_data, build_context, opening_message)
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -5,6 +5,9 @@ from datetime import datetime
 import os
 import random
 import time
+import argparse
+from price_store import normalize_price, append_rows
+from http_cache import HttpCache
 
 # Updated working URLs for scraping commodity prices from commodityonline.com
 COMMODITY_URLS = {
@@ -17,6 +20,9 @@ COMMODITY_URLS = {
 }
 
 OUTPUT_FILE = r"C:\\Users\\aravi\\Music\\ai_negotiator\\data\\negotiation_market_data.csv"
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+http_cache = HttpCache()
 
 def get_headers():
     """Generate random headers to mimic a real browser."""
@@ -88,125 +94,177 @@ def generate_dummy_data(product: str) -> list:
     print(f"⚠️ Using dummy data for {product} due to scraping failure.")
     return data
 
-def scrape_prices(product: str, url: str, retries: int = 3) -> list:
-    """Scrape prices from commodityonline.com with retries and fallback."""
-    attempt = 0
-    while attempt < retries:
-        try:
-            headers = get_headers()
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Different parsing logic depending on product and page structure
-
-            # For Cardamom and Coconut (Kerala / Dehradoon)
-            if product == "Cardamom" and "cardamoms/kerala" in url:
-                table = soup.find("table", class_="table")
-                data = []
-                if table:
-                    for tr in table.find_all("tr")[1:]:
-                        tds = tr.find_all("td")
-                        if len(tds) >= 4:
-                            row = {
-                                "Date": datetime.today().strftime('%Y-%m-%d'),
-                                "Product": "Cardamom",
-                                "Variety": "N/A",
-                                "State": "Kerala",
-                                "District": "N/A",
-                                "Market": tds[0].text.strip(),
-                                "Min Price (Rs/quintal)": tds[2].text.strip().replace("Rs ", "").replace("/ Kg", "").strip(),
-                                "Max Price (Rs/quintal)": tds[1].text.strip().replace("Rs ", "").replace("/ Kg", "").strip()
-                            }
-                            data.append(row)
-                    if data:
-                        return data
-
-            if product == "Coconut" and "coconut/uttrakhand/dehradoon" in url:
-                # Coconut prices on specific page
-                summary_section = soup.find("div", class_="market-price-summary")
-                data = []
-                if summary_section:
-                    avg_price_text = summary_section.find("li", class_="mb-1").find("p").text.strip()
-                    prices = [float(s) for s in avg_price_text.split() if s.replace('.', '', 1).isdigit()]
-                    if prices:
-                        row = {
-                            "Date": datetime.today().strftime('%Y-%m-%d'),
-                            "Product": "Coconut",
-                            "Variety": "N/A",
-                            "State": "Uttrakhand",
-                            "District": "Dehradoon",
-                            "Market": "Dehradoon",
-                            "Min Price (Rs/quintal)": prices[1],
-                            "Max Price (Rs/quintal)": prices[0]
-                        }
-                        data.append(row)
-                        return data
-
-            # For Coffee (Karnataka) with different table class
-            if product == "Coffee" and "state/karnataka" in url:
-                table = soup.find("table", class_="table table-list")
-                data = []
-                if table:
-                    tbody = table.find("tbody")
-                    if tbody:
-                        for tr in tbody.find_all("tr"):
-                            tds = tr.find_all("td")
-                            if len(tds) >= 8:
-                                row = {
-                                    "Date": tds[1].text.strip(),
-                                    "Product": tds[0].text.strip(),
-                                    "Variety": "N/A",
-                                    "State": "Karnataka",
-                                    "District": tds[2].text.strip(),
-                                    "Market": tds[3].text.strip(),
-                                    "Min Price (Rs/quintal)": tds[6].text.strip().replace("₹ ", "").replace("/ Quintal", ""),
-                                    "Max Price (Rs/quintal)": tds[8].text.strip().replace("₹ ", "").replace("/ Quintal", "")
-                                }
-                                if row["Product"].lower() == "coffee":
-                                    data.append(row)
-                        if data:
-                            return data
-
-            # For Turmeric, Mango, Potato — generic commodityonline.com tables
-            # These pages have tables with class 'table table-bordered table-striped'
-            table = soup.find("table", class_="table table-bordered table-striped")
-            data = []
-            if table:
-                for tr in table.find_all("tr")[1:]:
+def parse_prices(product: str, url: str, html: str) -> list:
+    """Parse one commodityonline.com page into price rows; returns [] if nothing matched."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Different parsing logic depending on product and page structure
+
+    # For Cardamom and Coconut (Kerala / Dehradoon)
+    if product == "Cardamom" and "cardamoms/kerala" in url:
+        table = soup.find("table", class_="table")
+        data = []
+        if table:
+            for tr in table.find_all("tr")[1:]:
+                tds = tr.find_all("td")
+                if len(tds) >= 4:
+                    row = {
+                        "Date": datetime.today().strftime('%Y-%m-%d'),
+                        "Product": "Cardamom",
+                        "Variety": "N/A",
+                        "State": "Kerala",
+                        "District": "N/A",
+                        "Market": tds[0].text.strip(),
+                        "Min Price (Rs/quintal)": normalize_price(tds[2].text.strip()),
+                        "Max Price (Rs/quintal)": normalize_price(tds[1].text.strip())
+                    }
+                    data.append(row)
+            if data:
+                return data
+
+    if product == "Coconut" and "coconut/uttrakhand/dehradoon" in url:
+        # Coconut prices on specific page
+        summary_section = soup.find("div", class_="market-price-summary")
+        data = []
+        if summary_section:
+            avg_price_text = summary_section.find("li", class_="mb-1").find("p").text.strip()
+            prices = [float(s) for s in avg_price_text.split() if s.replace('.', '', 1).isdigit()]
+            if prices:
+                row = {
+                    "Date": datetime.today().strftime('%Y-%m-%d'),
+                    "Product": "Coconut",
+                    "Variety": "N/A",
+                    "State": "Uttrakhand",
+                    "District": "Dehradoon",
+                    "Market": "Dehradoon",
+                    "Min Price (Rs/quintal)": prices[1],
+                    "Max Price (Rs/quintal)": prices[0]
+                }
+                data.append(row)
+                return data
+
+    # For Coffee (Karnataka) with different table class
+    if product == "Coffee" and "state/karnataka" in url:
+        table = soup.find("table", class_="table table-list")
+        data = []
+        if table:
+            tbody = table.find("tbody")
+            if tbody:
+                for tr in tbody.find_all("tr"):
                     tds = tr.find_all("td")
-                    if len(tds) >= 7:
-                        # Structure: Market | Variety | Min | Max | ...
-                        # Date and state/district may not be explicitly present; we assign today and N/A for these
-                        min_price = tds[4].text.strip().replace("₹ ", "").replace("/ Quintal", "").replace(",", "")
-                        max_price = tds[5].text.strip().replace("₹ ", "").replace("/ Quintal", "").replace(",", "")
+                    if len(tds) >= 8:
                         row = {
-                            "Date": datetime.today().strftime('%Y-%m-%d'),
-                            "Product": product,
-                            "Variety": tds[1].text.strip() if len(tds) > 1 else "N/A",
-                            "State": "N/A",
-                            "District": "N/A",
-                            "Market": tds[0].text.strip(),
-                            "Min Price (Rs/quintal)": min_price,
-                            "Max Price (Rs/quintal)": max_price
+                            "Date": tds[1].text.strip(),
+                            "Product": tds[0].text.strip(),
+                            "Variety": "N/A",
+                            "State": "Karnataka",
+                            "District": tds[2].text.strip(),
+                            "Market": tds[3].text.strip(),
+                            "Min Price (Rs/quintal)": normalize_price(tds[6].text.strip()),
+                            "Max Price (Rs/quintal)": normalize_price(tds[8].text.strip())
                         }
-                        data.append(row)
+                        if row["Product"].lower() == "coffee":
+                            data.append(row)
                 if data:
                     return data
 
+    # For Turmeric, Mango, Potato — generic commodityonline.com tables
+    # These pages have tables with class 'table table-bordered table-striped'
+    table = soup.find("table", class_="table table-bordered table-striped")
+    data = []
+    if table:
+        for tr in table.find_all("tr")[1:]:
+            tds = tr.find_all("td")
+            if len(tds) >= 7:
+                # Structure: Market | Variety | Min | Max | ...
+                # Date and state/district may not be explicitly present; we assign today and N/A for these
+                min_price = normalize_price(tds[4].text.strip())
+                max_price = normalize_price(tds[5].text.strip())
+                row = {
+                    "Date": datetime.today().strftime('%Y-%m-%d'),
+                    "Product": product,
+                    "Variety": tds[1].text.strip() if len(tds) > 1 else "N/A",
+                    "State": "N/A",
+                    "District": "N/A",
+                    "Market": tds[0].text.strip(),
+                    "Min Price (Rs/quintal)": min_price,
+                    "Max Price (Rs/quintal)": max_price
+                }
+                data.append(row)
+        if data:
+            return data
+
+    return []
+
+def record_fixture(product: str, html: str):
+    """Save a fetched page so parsers can be run and benchmarked offline."""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with open(os.path.join(FIXTURES_DIR, f"{product}.html"), "w", encoding="utf-8") as f:
+        f.write(html)
+
+def scrape_prices(product: str, url: str, retries: int = 3, record: bool = False, fallback: bool = True) -> tuple:
+    """Scrape prices from commodityonline.com with retries and fallback.
+
+    Returns (rows, fresh). fresh is True only for rows parsed from a page that
+    changed since its last successful parse. Rows reused for an unchanged page
+    and dummy fallback rows come back with fresh=False and must not be stored
+    again. With fallback=False a failed scrape returns ([], False) instead of dummy data.
+    """
+    attempt = 0
+    while attempt < retries:
+        try:
+            headers = get_headers()
+            fetched = http_cache.fetch(url, headers=headers, timeout=15)
+            if record:
+                record_fixture(product, fetched.text)
+
+            # Page unchanged since the last successful parse: reuse those rows
+            if not fetched.changed and fetched.rows:
+                print(f"♻️ {product} page unchanged (HTTP {fetched.status}), skipping parse.")
+                return fetched.rows, False
+
+            data = parse_prices(product, url, fetched.text)
+            if data:
+                http_cache.store_rows(url, data)
+                return data, True
+
             print(f"⚠️ No valid data found for {product} on this attempt. Retrying...")
             attempt += 1
-            time.sleep(random.uniform(5, 10))
+            if attempt < retries:
+                time.sleep(random.uniform(5, 10))
 
         except requests.RequestException as e:
             attempt += 1
             print(f"❌ Attempt {attempt}/{retries} failed for {product}: {e}")
-            time.sleep(random.uniform(5, 10))
-            if attempt == retries:
-                print(f"❌ Max retries reached for {product}. Falling back to dummy data.")
-                return generate_dummy_data(product)
+            if attempt < retries:
+                time.sleep(random.uniform(5, 10))
 
-    return generate_dummy_data(product)
+    if not fallback:
+        return [], False
+    print(f"❌ Max retries reached for {product}. Falling back to dummy data.")
+    return generate_dummy_data(product), False
+
+def parse_fixtures(bench_iterations: int = 0) -> list:
+    """Run the parsers against recorded pages; optionally time `bench_iterations` parses each."""
+    all_prices = []
+    for product, url in COMMODITY_URLS.items():
+        path = os.path.join(FIXTURES_DIR, f"{product}.html")
+        if not os.path.exists(path):
+            print(f"⚠️ No fixture for {product} at {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        rows = parse_prices(product, url, html)
+        all_prices.extend(rows)
+        if bench_iterations:
+            start = time.perf_counter()
+            for _ in range(bench_iterations):
+                parse_prices(product, url, html)
+            per_parse_ms = (time.perf_counter() - start) / bench_iterations * 1000
+            print(f"⏱️ {product}: {len(rows)} rows, {per_parse_ms:.2f} ms/parse ({len(html) / 1024:.0f} KB page)")
+        else:
+            print(f"📄 {product}: {len(rows)} rows from fixture")
+    return all_prices
 
 def save_to_csv(new_data: list):
     """Save scraped data to CSV without duplicates."""
@@ -220,18 +278,25 @@ def save_to_csv(new_data: list):
         print("⚠️ CSV file was empty. Starting fresh.")
         df_combined = df_new
 
-    df_combined.to_csv(OUTPUT_FILE, index=False)
+    # Write to a temp file and swap it in so readers never see a partial CSV
+    tmp_file = f"{OUTPUT_FILE}.tmp"
+    df_combined.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, OUTPUT_FILE)
     print(f"✅ Updated: {OUTPUT_FILE} with {len(df_combined)} rows.")
 
-def fetch_all():
+def fetch_all(record: bool = False):
     """Fetch prices for all commodities and save to CSV."""
-    all_prices = []
+    all_prices, fresh_prices = [], []
     for product, url in COMMODITY_URLS.items():
         print(f"🔍 Scraping {product} prices...")
-        prices = scrape_prices(product, url)
+        prices, fresh = scrape_prices(product, url, record=record)
         all_prices.extend(prices)
+        if fresh:
+            fresh_prices.extend(prices)
         time.sleep(random.uniform(1, 2))  # polite delay
     save_to_csv(all_prices)
+    # Only newly parsed pages are history; unchanged pages are already stored and dummy rows never are
+    print(f"🗄️ Appended {append_rows(fresh_prices)} rows to the price store.")
 
 def fetch_and_return_df():
     """Fetch all and return DataFrame."""
@@ -239,4 +304,13 @@ def fetch_and_return_df():
     return pd.read_csv(OUTPUT_FILE)
 
 if __name__ == "__main__":
-    fetch_all()
+    parser = argparse.ArgumentParser(description="Fetch live mandi prices")
+    parser.add_argument("--record", action="store_true", help="Save fetched pages as HTML fixtures")
+    parser.add_argument("--offline", action="store_true", help="Parse saved fixtures instead of fetching")
+    parser.add_argument("--bench", type=int, default=0, metavar="N", help="With --offline, time N parses per fixture")
+    args = parser.parse_args()
+
+    if args.offline:
+        parse_fixtures(args.bench)
+    else:
+        fetch_all(record=args.record)
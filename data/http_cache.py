@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_cache")
+
+
+class FetchResult:
+    def __init__(self, text: str, changed: bool, rows=None, status: int = 200):
+        self.text = text
+        self.changed = changed    # False on 304 or when the body hash matches the cached copy
+        self.rows = rows          # parsed rows cached for this exact body, if any
+        self.status = status
+
+
+class HttpCache:
+    """On-disk HTTP cache keyed by URL, with ETag / Last-Modified revalidation."""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".json", base + ".html"
+
+    def _load_meta(self, url: str):
+        meta_path, body_path = self._paths(url)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, path: str, data: bytes):
+        # Write-then-rename so a crash never leaves a truncated cache entry
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # A unique temp file per write: threads of one process may refresh the same URL at once
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=os.path.basename(path) + ".",
+                                         suffix=".tmp", delete=False) as f:
+            f.write(data)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+
+    def _save_meta(self, url: str, meta: dict):
+        meta_path, _ = self._paths(url)
+        self._write(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def read_body(self, url: str):
+        _, body_path = self._paths(url)
+        if not os.path.exists(body_path):
+            return None
+        with open(body_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def fetch(self, url: str, headers: dict = None, timeout: float = 15) -> FetchResult:
+        headers = dict(headers or {})
+        meta = self._load_meta(url)
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and meta:
+            meta["checked_at"] = time.time()
+            self._save_meta(url, meta)
+            return FetchResult(self.read_body(url), changed=False, rows=meta.get("rows"), status=304)
+        response.raise_for_status()
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        changed = not meta or meta.get("content_hash") != content_hash
+        new_meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "fetched_at": time.time(),
+            "checked_at": time.time(),
+            "rows": None if changed else meta.get("rows")
+        }
+        if changed:
+            _, body_path = self._paths(url)
+            self._write(body_path, response.text.encode("utf-8"))
+        self._save_meta(url, new_meta)
+        return FetchResult(response.text, changed=changed, rows=new_meta["rows"], status=response.status_code)
+
+    def store_rows(self, url: str, rows: list):
+        """Remember the parsed rows for the cached body so an unchanged page skips parsing."""
+        meta = self._load_meta(url)
+        if meta is not None:
+            meta["rows"] = rows
+            self._save_meta(url, meta)
@@ -0,0 +1,170 @@
+"""Long-running price ingestion with per-commodity refresh intervals.
+
+Commodities that show up more often in data/negotiation_log.txt are refreshed
+more often; failed scrapes back off exponentially. Each refresh that finds a
+changed page is appended to the price store and the latest prices are published to
+market_snapshot.json with a write-then-rename, so readers never see a partial file.
+
+    python data/ingest_daemon.py          # run forever
+    python data/ingest_daemon.py --once   # refresh everything once and exit
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from fetch_live_prices import COMMODITY_URLS, scrape_prices
+from price_store import append_rows, normalize_rows
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_FILE = os.path.join(DATA_DIR, "market_snapshot.json")
+NEGOTIATION_LOG = os.path.join(DATA_DIR, "negotiation_log.txt")
+
+BASE_INTERVAL = 6 * 3600      # refresh interval for a commodity nobody negotiates
+MIN_INTERVAL = 30 * 60        # never refresh a commodity more often than this
+USAGE_BOOST = 8               # the most-used commodity refreshes up to (1 + boost)x faster
+RETRY_BASE = 5 * 60           # first retry delay after a failed scrape
+MAX_BACKOFF = 12 * 3600
+USAGE_REFRESH = 10 * 60       # how often negotiation usage is re-counted
+
+
+def atomic_write_json(path: str, payload: dict):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str = SNAPSHOT_FILE) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def count_usage(log_path: str = NEGOTIATION_LOG) -> dict:
+    """Negotiations per commodity, matched loosely against log 'Product:' lines (Mangoes -> Mango)."""
+    usage = {commodity: 0 for commodity in COMMODITY_URLS}
+    if not os.path.exists(log_path):
+        return usage
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = re.match(r"Product:\s*([^|]+)", line)
+            if not match:
+                continue
+            product = match.group(1).strip().lower()
+            for commodity in usage:
+                if commodity.lower() in product:
+                    usage[commodity] += 1
+    return usage
+
+
+class IngestScheduler:
+    def __init__(self, commodities: dict = None, snapshot_path: str = SNAPSHOT_FILE,
+                 log_path: str = NEGOTIATION_LOG):
+        self.commodities = commodities or COMMODITY_URLS
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.snapshot = load_snapshot(snapshot_path)
+        self.failures = {commodity: 0 for commodity in self.commodities}
+        self.usage = {}
+        self.usage_counted_at = 0.0
+        self.queue = []
+        self.stop_event = threading.Event()
+
+    def refresh_interval(self, commodity: str) -> float:
+        now = time.time()
+        if now - self.usage_counted_at >= USAGE_REFRESH:
+            self.usage = count_usage(self.log_path)
+            self.usage_counted_at = now
+        top = max(self.usage.values(), default=0)
+        share = self.usage.get(commodity, 0) / top if top else 0
+        return max(MIN_INTERVAL, BASE_INTERVAL / (1 + share * USAGE_BOOST))
+
+    def backoff(self, commodity: str) -> float:
+        delay = min(MAX_BACKOFF, RETRY_BASE * 2 ** (self.failures[commodity] - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def publish(self, commodity: str, rows: list):
+        df = normalize_rows(rows)
+        if df.empty:
+            return
+        self.snapshot[commodity] = {
+            "min_price": float(df["min_price"].min()),
+            "max_price": float(df["max_price"].max()),
+            "modal_price": round(float(df["modal_price"].mean()), 2),
+            "markets": int(df["market"].nunique()),
+            "updated_at": datetime.now().isoformat(timespec="seconds")
+        }
+        atomic_write_json(self.snapshot_path, self.snapshot)
+
+    def refresh(self, commodity: str) -> float:
+        """Scrape one commodity and return the delay until its next refresh."""
+        rows, fresh = scrape_prices(commodity, self.commodities[commodity], retries=1, fallback=False)
+        if not rows:
+            self.failures[commodity] += 1
+            delay = self.backoff(commodity)
+            print(f"⏳ {commodity}: refresh failed ({self.failures[commodity]}x), retrying in {delay / 60:.0f} min")
+            return delay
+
+        self.failures[commodity] = 0
+        delay = self.refresh_interval(commodity)
+        if not fresh:
+            # Same page as last time: its rows are already in the store and the snapshot
+            print(f"♻️ {commodity}: unchanged, next refresh in {delay / 60:.0f} min")
+            return delay
+        append_rows(rows)
+        self.publish(commodity, rows)
+        print(f"✅ {commodity}: {len(rows)} rows published, next refresh in {delay / 60:.0f} min")
+        return delay
+
+    def due_from_snapshot(self, commodity: str, now: float) -> float:
+        """Resume where a previous run left off instead of refetching everything at startup."""
+        entry = self.snapshot.get(commodity)
+        if not entry:
+            return now
+        updated = datetime.fromisoformat(entry["updated_at"]).timestamp()
+        return max(now, updated + self.refresh_interval(commodity))
+
+    def run(self, once: bool = False):
+        now = time.time()
+        self.queue = [(now if once else self.due_from_snapshot(c, now), c) for c in self.commodities]
+        heapq.heapify(self.queue)
+
+        while self.queue and not self.stop_event.is_set():
+            due, commodity = self.queue[0]
+            wait = due - time.time()
+            if wait > 0:
+                self.stop_event.wait(wait)
+                continue
+            heapq.heappop(self.queue)
+            try:
+                delay = self.refresh(commodity)
+            except Exception as e:
+                self.failures[commodity] += 1
+                delay = self.backoff(commodity)
+                print(f"❌ {commodity}: unexpected error {e}")
+            if not once:
+                heapq.heappush(self.queue, (time.time() + delay, commodity))
+
+    def stop(self):
+        self.stop_event.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Staleness-aware market price ingestion")
+    parser.add_argument("--once", action="store_true", help="Refresh every commodity once and exit")
+    args = parser.parse_args()
+
+    scheduler = IngestScheduler()
+    try:
+        scheduler.run(once=args.once)
+    except KeyboardInterrupt:
+        scheduler.stop()
@@ -0,0 +1,183 @@
+"""Parquet time-series store for scraped mandi prices.
+
+Rows are normalized to numeric Rs/quintal prices and written as a Hive-partitioned
+dataset (date=YYYY-MM-DD/product=Name), so range queries only open the matching
+partitions and files are read through memory maps.
+
+    python data/price_store.py import data/negotiation_market_data.csv
+    python data/price_store.py query Cardamom --state Kerala --days 90
+"""
+import argparse
+import os
+import re
+import uuid
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_store")
+
+SCHEMA = pa.schema([
+    ("date", pa.string()),
+    ("product", pa.string()),
+    ("variety", pa.string()),
+    ("state", pa.string()),
+    ("district", pa.string()),
+    ("market", pa.string()),
+    ("min_price", pa.float64()),   # Rs/quintal
+    ("max_price", pa.float64()),   # Rs/quintal
+    ("modal_price", pa.float64()), # Rs/quintal, midpoint of min/max
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.string()), ("product", pa.string())]),
+    flavor="hive"
+)
+
+# Multipliers to convert a quoted unit to Rs/quintal (1 quintal = 100 kg)
+UNIT_TO_QUINTAL = {"kg": 100.0, "quintal": 1.0, "qtl": 1.0, "tonne": 0.1, "ton": 0.1}
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_price(value, default_unit: str = "quintal"):
+    """Parse '₹ 5,000 / Quintal', 'Rs 1200 / Kg' or 5000 into a float Rs/quintal price."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) * UNIT_TO_QUINTAL[default_unit]
+    text = str(value).lower().replace(",", "")
+    match = _NUMBER.search(text)
+    if not match:
+        return None
+    unit = default_unit
+    if "/" in text:
+        quoted = text.rsplit("/", 1)[1].strip()
+        unit = next((u for u in UNIT_TO_QUINTAL if quoted.startswith(u)), default_unit)
+    return float(match.group()) * UNIT_TO_QUINTAL[unit]
+
+
+def normalize_rows(rows: list) -> pd.DataFrame:
+    """Map scraper rows (Min/Max columns) or market CSV rows (Price Range column) onto SCHEMA."""
+    records = []
+    for row in rows:
+        if row.get("Price Range (Rs/quintal)") is not None:
+            low, _, high = str(row["Price Range (Rs/quintal)"]).partition("-")
+            min_price, max_price = normalize_price(low), normalize_price(high or low)
+        else:
+            min_price = normalize_price(row.get("Min Price (Rs/quintal)"))
+            max_price = normalize_price(row.get("Max Price (Rs/quintal)"))
+        if min_price is None and max_price is None:
+            continue
+        if min_price is None or max_price is None:
+            min_price = max_price = min_price if max_price is None else max_price
+        min_price, max_price = min(min_price, max_price), max(min_price, max_price)
+        records.append({
+            "date": _normalize_date(row.get("Date")),
+            "product": str(row.get("Product", "Unknown")).strip(),
+            "variety": str(row.get("Variety", "N/A")),
+            "state": str(row.get("State", "N/A")),
+            "district": str(row.get("District", "N/A")),
+            "market": str(row.get("Market", "N/A")),
+            "min_price": min_price,
+            "max_price": max_price,
+            "modal_price": (min_price + max_price) / 2,
+        })
+    return pd.DataFrame.from_records(records, columns=SCHEMA.names)
+
+
+def _normalize_date(value) -> str:
+    if not value:
+        return date.today().isoformat()
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d %b %Y", "%d-%b-%Y"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date().isoformat()
+        except ValueError:
+            continue
+    return date.today().isoformat()
+
+
+def append_rows(rows: list, store_dir: str = STORE_DIR) -> int:
+    """Normalize and append rows as new Parquet files; existing files are never rewritten."""
+    df = normalize_rows(rows)
+    if df.empty:
+        return 0
+    table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+    ds.write_dataset(
+        table,
+        store_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+    return table.num_rows
+
+
+def import_csv(path: str, store_dir: str = STORE_DIR) -> int:
+    df = pd.read_csv(path)
+    return append_rows(df.to_dict("records"), store_dir)
+
+
+def open_dataset(store_dir: str = STORE_DIR) -> ds.Dataset:
+    return ds.dataset(
+        store_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True)
+    )
+
+
+def query(product: str, state: str = None, market: str = None, start: str = None,
+          end: str = None, days: int = None, store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """Rows for one product in a date range; partition filters prune files before reading."""
+    if not os.path.isdir(store_dir):
+        return pd.DataFrame(columns=SCHEMA.names)
+    if days is not None:
+        start = (date.today() - timedelta(days=days)).isoformat()
+
+    condition = ds.field("product") == product
+    if start:
+        condition &= ds.field("date") >= start
+    if end:
+        condition &= ds.field("date") <= end
+    if state:
+        condition &= ds.field("state") == state
+    if market:
+        condition &= ds.field("market") == market
+
+    table = open_dataset(store_dir).to_table(filter=condition)
+    return table.to_pandas()[SCHEMA.names].sort_values("date", ignore_index=True)
+
+
+def latest_price(product: str, state: str = None, days: int = 30, store_dir: str = STORE_DIR):
+    """Mean modal price over the most recent date with data, or None."""
+    df = query(product, state=state, days=days, store_dir=store_dir)
+    if df.empty:
+        return None
+    latest = df[df["date"] == df["date"].max()]
+    return float(latest["modal_price"].mean())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mandi price store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import a scraped or market CSV")
+    imp.add_argument("csv")
+    q = sub.add_parser("query", help="Query a product's price history")
+    q.add_argument("product")
+    q.add_argument("--state")
+    q.add_argument("--market")
+    q.add_argument("--days", type=int)
+    q.add_argument("--start")
+    q.add_argument("--end")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"✅ Imported {import_csv(args.csv)} rows into {STORE_DIR}")
+    else:
+        result = query(args.product, state=args.state, market=args.market,
+                       start=args.start, end=args.end, days=args.days)
+        print(result.to_string(index=False) if not result.empty else "No rows found.")
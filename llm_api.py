@@ -1,16 +1,603 @@
 # llm_api.py
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+
 import requests
 
-def ask_llama3(prompt: str, system_prompt: str = "", model: str = "llama3:8b") -> str:
-    response = requests.post(
-        "http://localhost:11434/api/chat",
-        json={
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            "stream": False
-        }
-    )
-    return response.json()["message"]["content"].strip()
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = "30m"     # how long Ollama keeps the model loaded after a call
+DEFAULT_MODEL = "llama3:8b"
+
+# ---------------------------
+# BACKEND SETTINGS
+# ---------------------------
+LLM_BACKEND = os.environ.get("NEGOTIATOR_LLM_BACKEND", "ollama")   # ollama | llama_cpp
+# llama_cpp: "llama3:8b=/models/llama3-8b.Q4_K_M.gguf,llama3.2:1b=/models/llama3.2-1b.Q4_K_M.gguf"
+GGUF_MODELS = os.environ.get("NEGOTIATOR_GGUF_MODELS", "")
+GGUF_DEFAULT = os.environ.get("NEGOTIATOR_GGUF")   # GGUF file for model tags not listed above
+LLAMA_CPP_THREADS = int(os.environ.get("NEGOTIATOR_LLAMA_THREADS", os.cpu_count() or 4))
+LLAMA_CPP_CONTEXT = 4096      # tokens; prompts are trimmed well below this by the prompt builder
+LLAMA_CPP_MAX_TOKENS = 256    # seller replies are one or two sentences
+LLAMA_CPP_BATCH_SIZE = int(os.environ.get("NEGOTIATOR_LLAMA_BATCH", 8))
+LLAMA_CPP_BATCH_WINDOW = 0.005  # seconds a batch waits for more prompts to join
+
+# ---------------------------
+# LATENCY SLO SETTINGS
+# ---------------------------
+LATENCY_SLO_SECONDS = float(os.environ.get("NEGOTIATOR_LATENCY_SLO", 8.0))  # p95 above this switches agents to rule-based replies
+LATENCY_WINDOW = 20           # number of recent calls used for the p95
+LATENCY_MIN_SAMPLES = 5       # don't judge the SLO on fewer calls than this
+LATENCY_RECOVERY_RATIO = 0.75 # p95 must drop below SLO * ratio to leave degraded mode
+LATENCY_PROBE_INTERVAL = 15.0 # seconds between probe calls while degraded
+LLM_TIMEOUT_SECONDS = LATENCY_SLO_SECONDS * 1.25  # a call this slow already breaches the SLO; give up on it
+# The first call to a model may include loading it (tens of seconds on CPU), so it gets this
+# timeout instead, and its latency is left out of the p95
+LLM_COLD_TIMEOUT_SECONDS = float(os.environ.get("NEGOTIATOR_LLM_COLD_TIMEOUT", 300))
+
+# ---------------------------
+# HEDGING SETTINGS
+# ---------------------------
+HEDGE_ENABLED = os.environ.get("NEGOTIATOR_HEDGE", "0") == "1"
+OLLAMA_HEDGE_URL = os.environ.get("OLLAMA_HEDGE_URL")  # second backend; without one the hedge reuses OLLAMA_URL with a new seed
+HEDGE_PERCENTILE = 0.90       # hedge once the first request is slower than this share of recent calls
+HEDGE_DEFAULT_DELAY = 4.0     # seconds, until there are enough latency samples
+HEDGE_BUDGET = 0.10           # hedges allowed per structured request (at most ~10% extra backend load)
+HEDGE_BURST = 3               # hedges that can be saved up while traffic is quiet
+
+
+class LatencyTracker:
+    """Rolling window of LLM call latencies with a p95-based degradation switch."""
+
+    def __init__(self, slo_seconds=LATENCY_SLO_SECONDS, window=LATENCY_WINDOW,
+                 min_samples=LATENCY_MIN_SAMPLES, recovery_ratio=LATENCY_RECOVERY_RATIO,
+                 probe_interval=LATENCY_PROBE_INTERVAL):
+        self.slo_seconds = slo_seconds
+        self.min_samples = min_samples
+        self.recovery_ratio = recovery_ratio
+        self.probe_interval = probe_interval
+        self.samples = deque(maxlen=window)
+        self.degraded = False
+        self.last_probe = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            self._update_mode()
+
+    def p95(self):
+        with self._lock:
+            return self._p95()
+
+    def percentile(self, q: float):
+        """Latency at quantile `q` of the window, or None below `min_samples` calls."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            return self._percentile(q)
+
+    def _p95(self):
+        return self._percentile(0.95)
+
+    def _percentile(self, q: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def _update_mode(self):
+        if len(self.samples) < self.min_samples:
+            return
+        p95 = self._p95()
+        if not self.degraded and p95 > self.slo_seconds:
+            self.degraded = True
+            self.last_probe = time.time()
+        elif self.degraded and p95 < self.slo_seconds * self.recovery_ratio:
+            self.degraded = False
+
+    def should_use_llm(self) -> bool:
+        """True when callers should go to the LLM.
+
+        While degraded, one probe call is let through every `probe_interval`
+        seconds so fresh samples can bring the tracker back to normal mode.
+        """
+        with self._lock:
+            if not self.degraded:
+                return True
+            now = time.time()
+            if now - self.last_probe >= self.probe_interval:
+                self.last_probe = now
+                return True
+            return False
+
+    def mode(self) -> str:
+        return "degraded" if self.degraded else "llm"
+
+    def reset(self):
+        """Drop the latency window and leave degraded mode."""
+        with self._lock:
+            self.samples.clear()
+            self.degraded = False
+            self.last_probe = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            p95 = self._p95()
+            return {
+                "mode": "degraded" if self.degraded else "llm",
+                "p95Seconds": round(p95, 3) if p95 is not None else None,
+                "sloSeconds": self.slo_seconds,
+                "samples": len(self.samples)
+            }
+
+
+latency_tracker = LatencyTracker()
+
+
+# Per-model call counts, time and structured-output outcomes, reported by /stats and the routing benchmark
+model_stats = {}
+_model_lock = threading.Lock()
+
+
+def _count_model(model: str, key: str, amount=1):
+    with _model_lock:
+        stats = model_stats.setdefault(model, {"calls": 0, "seconds": 0.0, "structured": 0, "repaired": 0, "failed": 0})
+        stats[key] += amount
+
+
+def _chat_body(messages: list, model: str, fmt=None) -> dict:
+    body = {
+        "model": model,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    if fmt is not None:
+        body["format"] = fmt
+    return body
+
+
+# ---------------------------
+# BACKENDS
+# ---------------------------
+class OllamaBackend:
+    """The Ollama daemon over HTTP (OLLAMA_URL)."""
+
+    name = "ollama"
+    supports_hedging = True   # a hedge is a second HTTP request that can be cut off; see _hedged_chat
+
+    def __init__(self):
+        self.warm = set()   # models that have answered or been preloaded, so are known to be in memory
+
+    def is_warm(self, model: str) -> bool:
+        return model in self.warm
+
+    def timeout(self, model: str) -> float:
+        return LLM_TIMEOUT_SECONDS if self.is_warm(model) else LLM_COLD_TIMEOUT_SECONDS
+
+    def chat(self, messages: list, model: str, fmt=None) -> str:
+        timeout = self.timeout(model)
+        try:
+            response = requests.post(f"{OLLAMA_URL}/api/chat", json=_chat_body(messages, model, fmt),
+                                     timeout=timeout)
+        except requests.Timeout as e:
+            raise TimeoutError(f"Ollama did not answer within {timeout:.0f}s") from e
+        content = response.json()["message"]["content"].strip()
+        self.warm.add(model)
+        return content
+
+    def preload(self, model: str, keep_alive: str = OLLAMA_KEEP_ALIVE, timeout: float = 300):
+        """Ask Ollama to load the model into memory without generating anything."""
+        response = requests.post(
+            f"{OLLAMA_URL}/api/generate",
+            json={"model": model, "keep_alive": keep_alive},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        self.warm.add(model)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "url": OLLAMA_URL, "warm": sorted(self.warm)}
+
+
+def parse_gguf_models(spec: str) -> dict:
+    """'tag=path,tag=path' -> {tag: path}."""
+    models = {}
+    for part in filter(None, (spec or "").split(",")):
+        tag, _, path = part.partition("=")
+        models[tag.strip()] = path.strip()
+    return models
+
+
+class LlamaCppBackend:
+    """In-process CPU inference with llama.cpp (llama-cpp-python) on GGUF files.
+
+    Model tags map to GGUF files through NEGOTIATOR_GGUF_MODELS, falling back to
+    NEGOTIATOR_GGUF. Each file is loaded once and served by one worker thread,
+    which takes the prompts queued within LLAMA_CPP_BATCH_WINDOW as a batch of up
+    to LLAMA_CPP_BATCH_SIZE. Prompts in a batch are ordered so ones sharing a
+    prefix run back to back, and llama.cpp keeps the common prefix of the
+    previous prompt evaluated. There is no HTTP or JSON hop.
+    """
+
+    name = "llama_cpp"
+    supports_hedging = False   # one model in one process: a second copy would only queue behind the first
+
+    def __init__(self, models: str = GGUF_MODELS, default_path: str = GGUF_DEFAULT, threads: int = LLAMA_CPP_THREADS,
+                 context: int = LLAMA_CPP_CONTEXT, max_tokens: int = LLAMA_CPP_MAX_TOKENS,
+                 batch_size: int = LLAMA_CPP_BATCH_SIZE, batch_window: float = LLAMA_CPP_BATCH_WINDOW):
+        self.paths = parse_gguf_models(models)
+        self.default_path = default_path
+        self.threads = threads
+        self.context = context
+        self.max_tokens = max_tokens
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.workers = {}   # GGUF path -> _LlamaWorker
+        self.counters = {"prompts": 0, "batches": 0, "maxBatch": 0}
+        self._lock = threading.Lock()
+
+    def _worker(self, model: str):
+        path = self.paths.get(model, self.default_path)
+        if not path:
+            raise ValueError(f"No GGUF file for model {model}; set NEGOTIATOR_GGUF_MODELS or NEGOTIATOR_GGUF.")
+        with self._lock:
+            worker = self.workers.get(path)
+            if worker is None:
+                worker = self.workers[path] = _LlamaWorker(self, path)
+            return worker
+
+    def is_warm(self, model: str) -> bool:
+        with self._lock:
+            worker = self.workers.get(self.paths.get(model, self.default_path))
+        return worker is not None and worker.llm is not None
+
+    def chat(self, messages: list, model: str, fmt=None) -> str:
+        return self._worker(model).submit(messages, fmt).result()
+
+    def preload(self, model: str, keep_alive: str = None, timeout: float = None):
+        """Load the model's GGUF file now instead of on its first prompt."""
+        self._worker(model).load()
+
+    def count_batch(self, size: int):
+        with self._lock:
+            self.counters["prompts"] += size
+            self.counters["batches"] += 1
+            self.counters["maxBatch"] = max(self.counters["maxBatch"], size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = self.counters["batches"]
+            return {"backend": self.name, "models": {path: worker.llm is not None for path, worker in self.workers.items()},
+                    "threads": self.threads, **self.counters,
+                    "meanBatch": round(self.counters["prompts"] / batches, 2) if batches else None}
+
+
+class _LlamaWorker:
+    """One loaded GGUF model and the thread that feeds it batches of queued prompts."""
+
+    def __init__(self, backend: LlamaCppBackend, path: str):
+        self.backend = backend
+        self.path = path
+        self.llm = None
+        self.queue = queue.Queue()
+        self._load_lock = threading.Lock()
+        threading.Thread(target=self._run, name="llama-cpp", daemon=True).start()
+
+    def load(self):
+        with self._load_lock:
+            if self.llm is None:
+                try:
+                    from llama_cpp import Llama
+                except ImportError as e:
+                    raise RuntimeError("NEGOTIATOR_LLM_BACKEND=llama_cpp needs llama-cpp-python "
+                                       "(pip install llama-cpp-python).") from e
+                self.llm = Llama(model_path=self.path, n_ctx=self.backend.context, n_threads=self.backend.threads,
+                                 verbose=False)
+            return self.llm
+
+    def submit(self, messages: list, fmt) -> Future:
+        future = Future()
+        self.queue.put((messages, fmt, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.backend.batch_window
+            while len(batch) < self.backend.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            self.backend.count_batch(len(batch))
+            # Same persona/system prompt and context back to back, so each reuses the previous prompt's prefix
+            batch.sort(key=lambda item: json.dumps(item[0], ensure_ascii=False))
+            for messages, fmt, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._generate(messages, fmt))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _generate(self, messages: list, fmt) -> str:
+        kwargs = {"messages": messages, "max_tokens": self.backend.max_tokens}
+        if fmt is not None:
+            # Grammar-constrained decoding to the schema, like Ollama's `format`
+            kwargs["response_format"] = {"type": "json_object", "schema": fmt}
+        result = self.load().create_chat_completion(**kwargs)
+        return result["choices"][0]["message"]["content"].strip()
+
+
+BACKENDS = {"ollama": OllamaBackend, "llama_cpp": LlamaCppBackend}
+_backends = {}
+_backend_lock = threading.Lock()
+
+
+def get_backend(name: str = None):
+    """The backend called `name`, or the configured one (NEGOTIATOR_LLM_BACKEND)."""
+    name = name or LLM_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name}; choose one of {', '.join(BACKENDS)}.")
+    with _backend_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def _chat(messages: list, model: str, fmt=None, backend: str = None) -> str:
+    """One call on `backend`; raises TimeoutError after LLM_TIMEOUT_SECONDS (Ollama).
+
+    A call to a model that is not loaded yet waits up to LLM_COLD_TIMEOUT_SECONDS instead.
+    """
+    llm = get_backend(backend)
+    cold = not llm.is_warm(model)
+    start = time.time()
+    try:
+        return llm.chat(messages, model, fmt)
+    finally:
+        # A timed-out call counts too, so a hanging backend pushes the p95 over the SLO;
+        # a cold call mostly measures the model load, so it does not
+        elapsed = time.time() - start
+        if not cold:
+            latency_tracker.record(elapsed)
+        _count_model(model, "calls")
+        _count_model(model, "seconds", elapsed)
+
+
+def chat(messages: list, model: str = DEFAULT_MODEL, backend: str = None) -> str:
+    """Free-form chat completion on `backend` (default: NEGOTIATOR_LLM_BACKEND)."""
+    return _chat(messages, model, backend=backend)
+
+
+def ask_llama3(prompt: str, system_prompt: str = "", model: str = DEFAULT_MODEL, backend: str = None) -> str:
+    return _chat([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ], model, backend=backend)
+
+
+# Structured-output outcomes, reported by /stats
+structured_stats = {"calls": 0, "repaired": 0, "failed": 0}
+_structured_lock = threading.Lock()
+
+
+def _count(key: str):
+    with _structured_lock:
+        structured_stats[key] += 1
+
+
+def _parse(content: str, validate):
+    try:
+        return validate(json.loads(content))
+    except ValueError as e:
+        return None, f"the reply was not valid JSON ({e})"
+
+
+# ---------------------------
+# HEDGED REQUESTS
+# ---------------------------
+class _Attempt:
+    """One /api/chat request on its own connection, so a losing hedge can be cut off mid-generation."""
+
+    def __init__(self, base_url: str, body: dict, hedge: bool, timeout: float = LLM_TIMEOUT_SECONDS):
+        parts = urlsplit(base_url)
+        connection = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+        self.conn = connection(parts.hostname, parts.port, timeout=timeout)
+        self.path = parts.path.rstrip("/") + "/api/chat"
+        self.body = body
+        self.hedge = hedge
+        self.started = time.time()
+        self.cancelled = False
+
+    def run(self, results: queue.Queue):
+        try:
+            self.conn.request("POST", self.path, json.dumps(self.body), {"Content-Type": "application/json"})
+            content = json.loads(self.conn.getresponse().read())["message"]["content"].strip()
+            results.put((self, content, None))
+        except Exception as e:
+            results.put((self, None, e))
+        finally:
+            self.conn.close()
+
+    def cancel(self):
+        # Closing the socket makes Ollama stop generating for this request
+        self.cancelled = True
+        sock = self.conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class Hedger:
+    """Decides when to send a second copy of a structured request, within a budget.
+
+    The budget is a token bucket: every structured request adds `budget` tokens (up
+    to `burst`), and every hedge spends one.
+    """
+
+    def __init__(self, enabled=HEDGE_ENABLED, percentile=HEDGE_PERCENTILE, default_delay=HEDGE_DEFAULT_DELAY,
+                 budget=HEDGE_BUDGET, burst=HEDGE_BURST):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.budget = budget
+        self.burst = burst
+        self.tokens = float(burst)
+        self.counters = {"requests": 0, "hedged": 0, "hedgeWins": 0, "cancelled": 0, "budgetDenied": 0}
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        observed = latency_tracker.percentile(self.percentile)
+        return observed if observed is not None else self.default_delay
+
+    def start_request(self):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.tokens = min(self.burst, self.tokens + self.budget)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.counters["hedged"] += 1
+                return True
+            self.counters["budgetDenied"] += 1
+            return False
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "delaySeconds": round(self.delay(), 3), "budget": self.budget,
+                    "tokens": round(self.tokens, 2), **self.counters}
+
+
+hedger = Hedger()
+
+
+def _hedged_chat(messages: list, model: str, fmt, validate):
+    """First reply that passes `validate` from the request and at most one hedge.
+
+    The hedge is sent when the first request is still running after `hedger.delay()`,
+    or has failed or come back invalid. It goes to OLLAMA_HEDGE_URL when set, otherwise
+    to the same backend with a different seed. Whichever valid reply arrives first wins
+    and the other request is cancelled. Returns (content, value, error) like one
+    validated call; raises only if every request failed to connect. While the model is
+    still cold there is no hedge: a second copy would only wait for the same load.
+    """
+    hedger.start_request()
+    backend = get_backend(OllamaBackend.name)
+    cold = not backend.is_warm(model)
+    results = queue.Queue()
+    running = []
+
+    def launch(hedge: bool):
+        body = _chat_body(messages, model, fmt)
+        if hedge:
+            body["options"] = {"seed": random.randrange(2 ** 31)}
+        attempt = _Attempt((OLLAMA_HEDGE_URL if hedge else None) or OLLAMA_URL, body, hedge, backend.timeout(model))
+        running.append(attempt)
+        _count_model(model, "calls")
+        threading.Thread(target=attempt.run, args=(results,), name="llm-hedge", daemon=True).start()
+
+    launch(hedge=False)
+    can_hedge = not cold
+    last = (None, None, "no reply")
+    failure = None
+    while running:
+        try:
+            attempt, content, exc = results.get(timeout=hedger.delay() if can_hedge else None)
+        except queue.Empty:
+            # First request is slower than the hedge delay
+            can_hedge = False
+            if hedger.allow():
+                launch(hedge=True)
+            continue
+        running.remove(attempt)
+        elapsed = time.time() - attempt.started
+        if exc is not None:
+            failure = exc
+            if isinstance(exc, TimeoutError):
+                if not cold:
+                    latency_tracker.record(elapsed)
+                _count_model(model, "seconds", elapsed)
+        else:
+            backend.warm.add(model)
+            if not cold:
+                latency_tracker.record(elapsed)
+            _count_model(model, "seconds", elapsed)
+            value, error = _parse(content, validate)
+            if error is None:
+                for other in running:
+                    other.cancel()
+                hedger.count("cancelled", len(running))
+                if attempt.hedge:
+                    hedger.count("hedgeWins")
+                return content, value, None
+            last = (content, None, error)
+        if can_hedge:
+            # Failed or invalid before the delay: the hedge is the fastest second chance
+            can_hedge = False
+            if hedger.allow():
+                launch(hedge=True)
+    if last[0] is None and failure is not None:
+        raise failure
+    return last
+
+
+def ask_llama3_json(prompt: str, schema: dict, validate, system_prompt: str = "",
+                    model: str = DEFAULT_MODEL, repair_attempts: int = 1, backend: str = None):
+    """Ask for JSON constrained by `schema`; return the validated value or None.
+
+    `validate(data)` returns (value, None) or (None, reason). A rejected reply is
+    sent back with the reason for at most `repair_attempts` corrections, so a
+    bad reply costs one extra call instead of a wasted negotiation round. With
+    hedging on (NEGOTIATOR_HEDGE=1) each Ollama call may race a second copy; see _hedged_chat.
+    """
+    hedge = hedger.enabled and get_backend(backend).supports_hedging
+    _count("calls")
+    _count_model(model, "structured")
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+    for attempt in range(1 + repair_attempts):
+        if hedge:
+            content, value, error = _hedged_chat(messages, model, schema, validate)
+        else:
+            content = _chat(messages, model, fmt=schema, backend=backend)
+            value, error = _parse(content, validate)
+        if error is None:
+            if attempt:
+                _count("repaired")
+                _count_model(model, "repaired")
+            return value
+        messages += [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": f"That reply was rejected: {error}. Send the corrected JSON only."}
+        ]
+    _count("failed")
+    _count_model(model, "failed")
+    return None
+
+
+def preload_model(model: str = DEFAULT_MODEL, keep_alive: str = OLLAMA_KEEP_ALIVE, timeout: float = 300,
+                  backend: str = None):
+    """Load the model into memory without generating anything."""
+    get_backend(backend).preload(model, keep_alive=keep_alive, timeout=timeout)
@@ -0,0 +1,150 @@
+"""Admission control for negotiations.
+
+Only `limit` negotiations run at once. The limit comes from how many requests the
+LLM backend can serve in parallel. Callers over the limit wait in a short queue;
+when the queue is full, or a caller waits too long, the request is rejected and
+the app answers 429 with a Retry-After. Waiting callers are queued per client
+and slots are handed out round-robin across clients, so a batch caller with many
+jobs queued cannot starve an interactive user with one.
+
+    NEGOTIATOR_LLM_SLOTS=2 python app.py              # Ollama started with OLLAMA_NUM_PARALLEL=2
+    NEGOTIATOR_MAX_CONCURRENT=6 NEGOTIATOR_QUEUE_SIZE=20 python app.py
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Backend capacity: parallel inference slots (Ollama's OLLAMA_NUM_PARALLEL)
+LLM_SLOTS = int(os.environ.get("NEGOTIATOR_LLM_SLOTS", os.environ.get("OLLAMA_NUM_PARALLEL", 1)))
+# Buyer turns and rule-based rounds don't use the LLM, so a slot can be shared by a couple of negotiations
+NEGOTIATIONS_PER_SLOT = 2
+MAX_CONCURRENT = int(os.environ.get("NEGOTIATOR_MAX_CONCURRENT", LLM_SLOTS * NEGOTIATIONS_PER_SLOT))
+QUEUE_SIZE = int(os.environ.get("NEGOTIATOR_QUEUE_SIZE", 4 * MAX_CONCURRENT))
+QUEUE_PER_CLIENT = int(os.environ.get("NEGOTIATOR_QUEUE_PER_CLIENT", max(1, QUEUE_SIZE // 2)))
+MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("NEGOTIATOR_MAX_QUEUE_WAIT", 30))
+RETRY_AFTER_RANGE = (1, 120)   # seconds
+METRICS_WINDOW = 200           # recent waits/holds used for the reported percentiles
+
+
+class AdmissionRejected(Exception):
+    """The negotiation was not admitted; `retry_after` is a suggested wait in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, limit: int = MAX_CONCURRENT, queue_size: int = QUEUE_SIZE,
+                 per_client: int = QUEUE_PER_CLIENT, max_wait: float = MAX_QUEUE_WAIT_SECONDS):
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.per_client = per_client
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queues = OrderedDict()   # client -> deque of waiters; order is the round-robin order
+        self.queued = 0
+        self.counters = {"admitted": 0, "enqueued": 0, "rejectedQueueFull": 0, "rejectedTimeout": 0}
+        self.waits = deque(maxlen=METRICS_WINDOW)
+        self.holds = deque(maxlen=METRICS_WINDOW)
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # ADMISSION
+    # ---------------------------
+    @contextmanager
+    def admit(self, client: str, max_wait: float = None):
+        """Hold one negotiation slot for the duration of the block; raises AdmissionRejected."""
+        self.acquire(client, max_wait)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.release(time.time() - started)
+
+    def acquire(self, client: str, max_wait: float = None):
+        client = client or "anonymous"
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._lock:
+            if self.in_flight < self.limit and not self.queued:
+                self._grant(0.0)
+                return
+            lane = self.queues.get(client)
+            if self.queued >= self.queue_size or (lane and len(lane) >= self.per_client):
+                self.counters["rejectedQueueFull"] += 1
+                raise AdmissionRejected("queue full", self._retry_after(self.queued + 1))
+            waiter = {"event": threading.Event(), "granted": False, "since": time.time()}
+            self.queues.setdefault(client, deque()).append(waiter)
+            self.queued += 1
+            self.counters["enqueued"] += 1
+
+        if waiter["event"].wait(max_wait):
+            return
+        with self._lock:
+            if waiter["granted"]:   # granted between the timeout and taking the lock
+                return
+            lane = self.queues[client]
+            lane.remove(waiter)
+            if not lane:
+                del self.queues[client]
+            self.queued -= 1
+            self.counters["rejectedTimeout"] += 1
+            raise AdmissionRejected("queue wait exceeded", self._retry_after(self.queued + 1))
+
+    def release(self, held_seconds: float = None):
+        with self._lock:
+            self.in_flight -= 1
+            if held_seconds is not None:
+                self.holds.append(held_seconds)
+            if self.queues and self.in_flight < self.limit:
+                # Round-robin: serve the head of the first client's lane, then move that client to the back
+                client, lane = next(iter(self.queues.items()))
+                waiter = lane.popleft()
+                del self.queues[client]
+                if lane:
+                    self.queues[client] = lane
+                self.queued -= 1
+                waiter["granted"] = True
+                self._grant(time.time() - waiter["since"])
+                waiter["event"].set()
+
+    def _grant(self, waited: float):
+        self.in_flight += 1
+        self.counters["admitted"] += 1
+        self.waits.append(waited)
+
+    def _retry_after(self, position: int) -> int:
+        """Seconds until about `position` more negotiations have finished, from the observed hold times."""
+        hold = sum(self.holds) / len(self.holds) if self.holds else self.max_wait
+        low, high = RETRY_AFTER_RANGE
+        return int(min(high, max(low, math.ceil(hold * position / self.limit))))
+
+    # ---------------------------
+    # METRICS
+    # ---------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "inFlight": self.in_flight,
+                "queued": self.queued,
+                "queueSize": self.queue_size,
+                "queuedClients": len(self.queues),
+                **self.counters,
+                "waitP95Seconds": _p95(self.waits),
+                "holdP95Seconds": _p95(self.holds)
+            }
+
+
+def _p95(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 3)
+
+
+admission = AdmissionController()
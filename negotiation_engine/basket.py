@@ -0,0 +1,208 @@
+"""Basket negotiation: several products with one buyer in one session.
+
+Each line item is its own NegotiationSession, so pricing rules, deal checks and
+line outcomes are the same as for a single negotiation. The seller speaks for all open lines in a
+single structured LLM call per round, so a basket of N products costs about as
+many round trips as one negotiation.
+"""
+import time
+
+from agents.buyer_agent import BuyerAgent
+from agents.seller_agent import SellerAgent
+from llm_api import ask_llama3_json, latency_tracker
+from negotiation_engine.offers import OFFER_ACTIONS, render_offer, validate_offer
+from negotiation_engine.prompt_builder import TOKEN_BUDGETS, PromptBuilder, shorten_quote
+from negotiation_engine.routing import router
+from negotiation_engine.session import BUYER_PREFIX, NegotiationSession
+from negotiation_engine.trace import NULL_TRACER
+
+BASKET_MAX_LINES = 8
+BASKET_LINE_TOKENS = 90       # prompt budget added per open line on top of the seller budget
+
+BASKET_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "lines": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "product": {"type": "string"},
+                    "action": {"type": "string", "enum": OFFER_ACTIONS},
+                    "price": {"type": ["integer", "null"]},
+                    "message": {"type": "string"}
+                },
+                "required": ["product", "action", "price", "message"]
+            }
+        }
+    },
+    "required": ["lines"]
+}
+
+BASKET_FORMAT_HINT = (
+    "Reply only with JSON: {\"lines\": [{\"product\": exact product name, \"action\": one of "
+    + ", ".join(OFFER_ACTIONS) + ", \"price\": whole rupees per quintal or null, \"message\": what you say about it}]}, "
+    "one entry per product above."
+)
+
+
+def validate_basket(data, turns: dict):
+    """Return ({product: offer}, None) when every open line has a valid offer, else (None, reason)."""
+    if not isinstance(data, dict) or not isinstance(data.get("lines"), list):
+        return None, "the reply must be an object with a 'lines' array"
+    by_name = {str(line.get("product", "")).strip().lower(): line for line in data["lines"] if isinstance(line, dict)}
+    offers, problems = {}, []
+    for name, turn in turns.items():
+        line = by_name.get(name.lower())
+        if line is None:
+            problems.append(f"missing a line for '{name}'")
+            continue
+        offer, error = validate_offer(line, turn["base_price"])
+        if error:
+            problems.append(f"{name}: {error}")
+        else:
+            offers[name] = offer
+    if problems:
+        return None, "; ".join(problems)
+    return offers, None
+
+
+class BasketLine:
+    """One product in the basket, played by its own NegotiationSession."""
+
+    def __init__(self, context: dict, buyer_persona: str, seller_persona: str, tracer,
+                 max_rounds: int, min_rounds: int):
+        self.name = context["name"]
+        self.session = NegotiationSession(context, BuyerAgent(persona=buyer_persona), SellerAgent(persona=seller_persona),
+                                          max_rounds=max_rounds, min_rounds=min_rounds, tracer=tracer)
+
+    @property
+    def is_open(self) -> bool:
+        return self.session.is_open
+
+    def summary(self) -> dict:
+        session = self.session
+        return {
+            "product": self.name,
+            "status": session.status,
+            "openingPrice": session.opening_price,
+            "finalPrice": session.final_price,
+            "marketPrice": session.context.get("Base Market Price"),
+            "rounds": session.round_num,
+            "buyerPersona": session.buyer.personality["personality_type"],
+            "regret": session.buyer.regret_flag,
+            "converged": session.buyer.converged
+        }
+
+
+class BasketNegotiation:
+    def __init__(self, contexts: list, buyer_persona: str = "Diplomatic", seller_persona: str = "Analytical",
+                 tracer=NULL_TRACER, max_rounds: int = 15, min_rounds: int = 4):
+        self.tracer = tracer
+        self.lines = [BasketLine(context, buyer_persona, seller_persona, tracer, max_rounds, min_rounds)
+                      for context in contexts]
+        self.seller_persona = seller_persona
+        self.messages = []
+        self.llm_calls = 0
+        self.degraded_rounds = 0
+
+    def open_lines(self) -> list:
+        return [line for line in self.lines if line.is_open]
+
+    def seller_turn(self, lines: list) -> dict:
+        """One seller reply per open line, from a single batched LLM call when possible."""
+        turns = {}
+        for line in lines:
+            session = line.session
+            buyer_text = session.last_text("Buyer").removeprefix(BUYER_PREFIX)
+            turns[line.name] = dict(session.seller.plan_turn(buyer_text, session.context), buyer_text=buyer_text)
+
+        offers = None
+        if latency_tracker.should_use_llm():
+            builder = PromptBuilder("seller", budget=TOKEN_BUDGETS["seller"] + BASKET_LINE_TOKENS * len(lines))
+            builder.add("intro", f"You are an {self.seller_persona} seller negotiating {len(lines)} products "
+                                 "with one buyer in the same conversation.", priority=10, required=True)
+            for priority, line in enumerate(reversed(lines)):
+                turn = turns[line.name]
+                header = f"[{line.name}, {turn['order_size']}kg]"
+                builder.add(f"line:{line.name}", f"{header} {turn['instruction']}", priority=10, required=True)
+                quote = turn["buyer_text"]
+                builder.add(f"quote:{line.name}", f"{header} The buyer says: '{quote}'.", priority=priority,
+                            shorter=[f"{header} The buyer says: '{shorten_quote(quote, 25)}'."])
+            builder.add("closing", "Be concise and confident. " + BASKET_FORMAT_HINT, priority=10, required=True)
+            prompt, tokens = builder.build()
+            model = router.model_for("seller", "basket", self.seller_persona)
+            self.llm_calls += 1
+            self.tracer.emit("basket_seller_call", lines=len(lines), model=model, promptTokens=tokens,
+                             trimmed=builder.trimmed)
+            try:
+                offers = ask_llama3_json(prompt, BASKET_SCHEMA, lambda data: validate_basket(data, turns), model=model)
+                mode = "llm" if offers is not None else "rule"
+            except TimeoutError:
+                self.degraded_rounds += 1
+                mode = "degraded"
+        else:
+            self.degraded_rounds += 1
+            mode = "degraded"
+
+        replies = {}
+        for line in lines:
+            turn = turns[line.name]
+            line.session.seller.last_reply_mode = mode
+            if offers is not None:
+                replies[line.name] = render_offer(offers[line.name])
+            else:
+                replies[line.name] = line.session.seller.rule_based_reply(turn["decision"], turn["price"],
+                                                                          turn["product"], turn["order_size"])
+        return replies, mode
+
+    def record(self, line: BasketLine, messages: list):
+        self.messages.extend(dict(message, line=line.name) for message in messages)
+
+    def run(self, opening_message, deadline: float = None) -> dict:
+        """Play rounds until every line is closed; `opening_message(context)` is the buyer's first line."""
+        for line in self.lines:
+            self.record(line, line.session.start(opening_message(line.session.context)))
+
+        round_num = 0
+        while self.open_lines() and (deadline is None or time.time() < deadline):
+            round_num += 1
+            lines = self.open_lines()
+            replies, mode = self.seller_turn(lines)
+            for line in lines:
+                self.record(line, line.session.step(mode=mode, rendered=replies[line.name]))
+                if line.is_open:
+                    self.record(line, line.session.step())
+                if not line.is_open:
+                    self.tracer.emit("line_closed", product=line.name, status=line.session.status,
+                                     round=round_num, finalPrice=line.session.final_price)
+
+        timed_out = bool(self.open_lines())
+        for line in self.open_lines():
+            self.record(line, line.session.stop("timeout"))
+        end_reason = "timeout" if timed_out else "complete"
+        self.tracer.emit("end", reason=end_reason, rounds=round_num, llmCalls=self.llm_calls)
+        return self.payload(round_num, end_reason)
+
+    def payload(self, round_num: int, end_reason: str) -> dict:
+        lines = [line.summary() for line in self.lines]
+        deals = [line.session for line in self.lines if line.session.status == "deal" and line.session.final_price]
+        return {
+            "traceId": self.tracer.trace_id,
+            "messages": self.messages,
+            "lines": lines,
+            "summary": {
+                "lines": len(lines),
+                "deals": sum(line["status"] == "deal" for line in lines),
+                "walkaways": sum(line["status"] == "walkaway" for line in lines),
+                "fallbacks": sum(line["status"] == "fallback" for line in lines),
+                # Prices are per quintal; order sizes are in kg
+                "basketValue": round(sum(line.final_price * line.context["Order Size (kg)"] / 100 for line in deals), 2),
+                "marketValue": round(sum(line.context["Base Market Price"] * line.context["Order Size (kg)"] / 100
+                                         for line in deals), 2),
+                "totalRounds": round_num,
+                "sellerLlmCalls": self.llm_calls,
+                "degradedRounds": self.degraded_rounds,
+                "endReason": end_reason
+            }
+        }
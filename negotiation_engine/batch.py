@@ -0,0 +1,100 @@
+import itertools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+BATCH_MAX_CONCURRENCY = 4      # upper bound on negotiations running at once per batch
+BATCH_MAX_JOBS = 200
+BATCH_DEADLINE_SECONDS = 600   # default and upper bound for a batch's deadline
+BATCH_MIN_DEADLINE_SECONDS = 1
+
+
+def expand_jobs(data: dict) -> list:
+    """Jobs come either as an explicit list or as products x buyerPersonas x sellerPersonas."""
+    if data.get("jobs"):
+        return [
+            {
+                "product": job.get("product"),
+                "buyerPersona": job.get("buyerPersona", "Diplomatic"),
+                "sellerPersona": job.get("sellerPersona", "Analytical")
+            }
+            for job in data["jobs"]
+        ]
+    products = data.get("products", [])
+    buyer_personas = data.get("buyerPersonas", ["Diplomatic"])
+    seller_personas = data.get("sellerPersonas", ["Analytical"])
+    return [
+        {"product": p, "buyerPersona": b, "sellerPersona": s}
+        for p, b, s in itertools.product(products, buyer_personas, seller_personas)
+    ]
+
+
+def batch_options(data: dict) -> tuple:
+    """(concurrency, deadline) from the request body; raises ValueError with a message for the client.
+
+    Concurrency is clamped to 1..BATCH_MAX_CONCURRENCY and the deadline to
+    BATCH_MIN_DEADLINE_SECONDS..BATCH_DEADLINE_SECONDS.
+    """
+    try:
+        concurrency = int(data.get("concurrency", BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise ValueError("concurrency must be an integer.")
+    try:
+        deadline = float(data.get("deadline", BATCH_DEADLINE_SECONDS))
+    except (TypeError, ValueError):
+        raise ValueError("deadline must be a number of seconds.")
+    if not math.isfinite(deadline):
+        raise ValueError("deadline must be a number of seconds.")
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    deadline = max(BATCH_MIN_DEADLINE_SECONDS, min(deadline, BATCH_DEADLINE_SECONDS))
+    return concurrency, deadline
+
+
+def run_batch(jobs: list, run_job, concurrency: int = BATCH_MAX_CONCURRENCY,
+              deadline: float = BATCH_DEADLINE_SECONDS):
+    """Run `run_job(job)` for every job and yield one result dict per job as it finishes.
+
+    A failing job yields an error record without affecting the others. Jobs still
+    unfinished when the batch deadline passes are reported as timed out.
+    """
+    start = time.time()
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(jobs) or 1))
+    counts = {"ok": 0, "error": 0, "timeout": 0}
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="negotiation-batch")
+    pending = {}
+    for index, job in enumerate(jobs):
+        pending[executor.submit(_timed, run_job, job)] = index
+
+    try:
+        while pending:
+            remaining = deadline - (time.time() - start)
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                record = {"job": index, **jobs[index]}
+                try:
+                    result, elapsed = future.result()
+                    record.update({"status": "ok", "elapsed": elapsed, "result": result})
+                except Exception as e:
+                    record.update({"status": "error", "error": str(e)})
+                counts[record["status"]] += 1
+                yield record
+
+        for future, index in sorted(pending.items(), key=lambda item: item[1]):
+            future.cancel()
+            counts["timeout"] += 1
+            yield {"job": index, **jobs[index], "status": "timeout", "error": "Batch deadline exceeded."}
+    finally:
+        # Don't hold the response open for negotiations that are still running
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield {"batch": {**counts, "total": len(jobs), "elapsed": round(time.time() - start, 3)}}
+
+
+def _timed(run_job, job):
+    start = time.time()
+    result = run_job(job)
+    return result, round(time.time() - start, 3)
@@ -0,0 +1,94 @@
+import gzip
+import json
+
+from flask import Response
+
+from negotiation_engine.session import find_price
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MIN_COMPRESS_BYTES = 1024
+
+
+def response_options(data: dict, args) -> dict:
+    """Read encoding options from the JSON body, falling back to query parameters."""
+    fields = data.get("fields", args.get("fields"))
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    compact = data.get("compact", args.get("compact", False))
+    if isinstance(compact, str):
+        compact = compact.lower() in ("1", "true", "yes")
+    return {"fields": fields or None, "compact": bool(compact)}
+
+
+def compact_messages(messages: list) -> dict:
+    """Split the transcript into parallel sender/text arrays plus numeric offer arrays."""
+    senders, texts = [], []
+    offers = {"Buyer": [], "Seller": []}
+    for msg in messages:
+        senders.append(msg["sender"])
+        texts.append(msg["text"])
+        if msg["sender"] in offers:
+            offers[msg["sender"]].append(find_price(msg["text"]))
+    return {
+        "transcript": {"senders": senders, "texts": texts},
+        "offers": {"buyer": offers["Buyer"], "seller": offers["Seller"]}
+    }
+
+
+def shape_payload(payload: dict, options: dict) -> dict:
+    if options.get("compact") and "messages" in payload:
+        payload = dict(payload)
+        payload.update(compact_messages(payload.pop("messages")))
+    fields = options.get("fields")
+    if fields:
+        payload = {k: v for k, v in payload.items() if k in fields}
+    return payload
+
+
+def _accepts(header: str, token: str) -> bool:
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != token:
+            continue
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def encode_response(payload: dict, options: dict, request, status: int = 200) -> Response:
+    """Shape the payload and encode it as msgpack/JSON with gzip or brotli as negotiated."""
+    payload = shape_payload(payload, options)
+    accept = request.headers.get("Accept", "")
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+
+    if msgpack is not None and "application/msgpack" in accept:
+        body = msgpack.packb(payload, use_bin_type=True)
+        mimetype = "application/msgpack"
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        mimetype = "application/json"
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            body = brotli.compress(body)
+            headers["Content-Encoding"] = "br"
+        elif _accepts(accept_encoding, "gzip"):
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
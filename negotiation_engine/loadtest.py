@@ -0,0 +1,326 @@
+"""Load generator for the Flask service.
+
+Drives /negotiate (and optionally /health) at a fixed concurrency or arrival rate
+with weighted product/persona mixes, against a running server (--url) or the app
+in-process. --stub-llm starts a stand-in Ollama with a configurable latency and a
+fixed number of inference slots, so backend saturation can be reproduced without
+a GPU. --sweep runs several concurrency levels and reports where the
+max_duration fallback (endReason "timeout") starts firing.
+
+    python -m negotiation_engine.loadtest --in-process --stub-llm --llm-latency 0.5 --llm-slots 2 --sweep 1,2,4,8 --duration 30
+    python -m negotiation_engine.loadtest --url http://localhost:5000 --concurrency 4 --duration 120
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from agents.seller_agent import SELLER_PERSONAS
+
+PERSONAS_BUYER = ["Diplomatic", "Assertive", "Strategic", "Balanced"]
+_PROMPT_PRICE = re.compile(r"(?:Counter with|target price is|offered) ₹(\d+)")
+_BASKET_LINE = re.compile(r"\[([^,\]]+), \d+kg\] ([^\[]*)")
+_MODEL_SIZE = re.compile(r":(\d+(?:\.\d+)?)b\b")
+
+
+# ---------------------------
+# STAND-IN LLM BACKEND
+# ---------------------------
+def start_stub_llm(latency: float, jitter: float = 0.2, slots: int = 1, port: int = 0):
+    """Serve /api/chat like Ollama: replies quote the price the prompt asked for.
+
+    Requests carrying a `format` schema get a JSON offer, as Ollama would return.
+
+    Only `slots` requests are "on the GPU" at once; the rest queue, which is what
+    makes end-to-end latency grow with concurrency. `latency` is for an 8b model;
+    tags such as "llama3.2:1b" answer proportionally faster.
+    """
+    gpu = threading.Semaphore(slots)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = body.get("messages", [{}])[-1].get("content", "")
+            prices = _PROMPT_PRICE.findall(prompt)
+            price = prices[-1] if prices else "15000"
+            if "Accept the offer" in prompt:
+                action, reply = "accept", f"I accept ₹{price} per quintal. Deal confirmed."
+            else:
+                action, reply = "counter", f"I can offer ₹{price} per quintal for this quality."
+            fmt = body.get("format")
+            if fmt and "lines" in fmt.get("properties", {}):
+                lines = []
+                for name, text in _BASKET_LINE.findall(prompt):
+                    line_prices = _PROMPT_PRICE.findall(text)
+                    if "The buyer says" in text or not line_prices:
+                        continue
+                    line_action = "accept" if "Accept the offer" in text else "counter"
+                    lines.append({"product": name, "action": line_action, "price": int(line_prices[-1]),
+                                  "message": f"For {name}, I can offer ₹{line_prices[-1]} per quintal."})
+                reply = json.dumps({"lines": lines}, ensure_ascii=False)
+            elif fmt:
+                reply = json.dumps({"action": action, "price": int(price), "message": reply}, ensure_ascii=False)
+            size = _MODEL_SIZE.search(body.get("model", ""))
+            scaled = latency * (float(size.group(1)) / 8 if size else 1.0)
+            with gpu:
+                time.sleep(max(0.0, random.gauss(scaled, scaled * jitter)))
+            payload = json.dumps({"message": {"role": "assistant", "content": reply}, "done": True}).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client hung up, e.g. a cancelled hedge request
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ---------------------------
+# CLIENTS
+# ---------------------------
+class HttpClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.local = threading.local()
+
+    def _session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def request(self, method: str, path: str, body=None):
+        response = self._session().request(method, self.base_url + path, json=body, timeout=600)
+        return response.status_code, response.json() if "json" in response.headers.get("Content-Type", "") else None
+
+
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.app = flask_app
+
+    def request(self, method: str, path: str, body=None):
+        response = self.app.test_client().open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+# ---------------------------
+# LOAD GENERATION
+# ---------------------------
+def parse_mix(spec: str, default: list) -> list:
+    """'Coffee:3,Turmeric:1' -> weighted list; empty -> uniform over `default`."""
+    if not spec:
+        return [(name, 1.0) for name in default]
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def pick(mix: list) -> str:
+    names, weights = zip(*mix)
+    return random.choices(names, weights=weights)[0]
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_level(client, concurrency: int, duration: float, rate: float, mixes: dict, health_ratio: float) -> dict:
+    """Run one load level; closed-loop at `concurrency`, or open-loop Poisson arrivals if `rate` is set."""
+    records = []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def one_request():
+        if random.random() < health_ratio:
+            endpoint, method, path, body = "health", "GET", "/health", None
+        else:
+            endpoint, method, path = "negotiate", "POST", "/negotiate?fields=summary"
+            body = {
+                "product": pick(mixes["products"]),
+                "buyerPersona": pick(mixes["buyer"]),
+                "sellerPersona": pick(mixes["seller"])
+            }
+        start = time.time()
+        try:
+            status, payload = client.request(method, path, body)
+            error = status >= 400
+        except Exception:
+            status, payload, error = None, None, True
+        summary = (payload or {}).get("summary", {}) if isinstance(payload, dict) else {}
+        with lock:
+            records.append({
+                "endpoint": endpoint,
+                "latency": time.time() - start,
+                "error": error,
+                "status": status,
+                "endReason": summary.get("endReason"),
+                "degradedRounds": summary.get("degradedRounds", 0),
+                "deal": summary.get("endReason") == "deal"
+            })
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if rate:
+            in_flight = threading.Semaphore(concurrency)
+
+            def bounded():
+                try:
+                    one_request()
+                finally:
+                    in_flight.release()
+
+            dropped = 0
+            next_arrival = time.time()
+            while next_arrival < deadline:
+                time.sleep(max(0.0, next_arrival - time.time()))
+                if in_flight.acquire(blocking=False):
+                    executor.submit(bounded)
+                else:
+                    dropped += 1
+                next_arrival += random.expovariate(rate)
+        else:
+            dropped = 0
+
+            def worker():
+                while time.time() < deadline:
+                    one_request()
+
+            for _ in range(concurrency):
+                executor.submit(worker)
+    elapsed = time.time() - started
+    return summarize_level(records, concurrency, elapsed, dropped)
+
+
+def summarize_level(records: list, concurrency: int, elapsed: float, dropped: int = 0) -> dict:
+    by_endpoint = defaultdict(list)
+    for record in records:
+        by_endpoint[record["endpoint"]].append(record)
+
+    report = {"concurrency": concurrency, "elapsed": round(elapsed, 2), "dropped": dropped, "endpoints": {}}
+    for endpoint, rows in by_endpoint.items():
+        latencies = [r["latency"] for r in rows if not r["error"]]
+        report["endpoints"][endpoint] = {
+            "requests": len(rows),
+            "throughput": round(len(rows) / elapsed, 3) if elapsed else None,
+            "errorRate": round(sum(r["error"] for r in rows) / len(rows), 4),
+            "p50": _round(percentile(latencies, 50)),
+            "p90": _round(percentile(latencies, 90)),
+            "p95": _round(percentile(latencies, 95)),
+            "p99": _round(percentile(latencies, 99)),
+        }
+    negotiations = by_endpoint.get("negotiate", [])
+    if negotiations:
+        report["timeouts"] = sum(r["endReason"] == "timeout" for r in negotiations)
+        report["rejected"] = sum(r["status"] == 429 for r in negotiations)
+        report["dealRate"] = round(sum(r["deal"] for r in negotiations) / len(negotiations), 4)
+        report["degradedRounds"] = sum(r["degradedRounds"] or 0 for r in negotiations)
+    return report
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def print_report(levels: list):
+    print(f"\n{'conc':>5} {'req/s':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'timeouts':>9} {'429s':>6} {'deal%':>6}")
+    for level in levels:
+        stats = level["endpoints"].get("negotiate", {})
+        print(f"{level['concurrency']:>5} {stats.get('throughput') or 0:>8.3f} {100 * stats.get('errorRate', 0):>6.1f} "
+              f"{stats.get('p50') or 0:>8.2f} {stats.get('p95') or 0:>8.2f} {stats.get('p99') or 0:>8.2f} "
+              f"{level.get('timeouts', 0):>9} {level.get('rejected', 0):>6} {100 * level.get('dealRate', 0):>6.1f}")
+    first_timeout = next((level["concurrency"] for level in levels if level.get("timeouts")), None)
+    if first_timeout:
+        print(f"\n⏳ max_duration fallback first fired at concurrency {first_timeout}.")
+    else:
+        print("\n✅ No max_duration fallbacks at the tested concurrency levels.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the negotiation service")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running server")
+    target.add_argument("--in-process", action="store_true", help="Drive app.py through Flask's test client")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sweep", help="Comma-separated concurrency levels, e.g. 1,2,4,8")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per level")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate (requests/s); concurrency caps in-flight")
+    parser.add_argument("--products", help="Weighted mix, e.g. 'Coffee:3,Turmeric:1'")
+    parser.add_argument("--buyer-personas", help="Weighted buyer persona mix")
+    parser.add_argument("--seller-personas", help="Weighted seller persona mix")
+    parser.add_argument("--health-ratio", type=float, default=0.0, help="Fraction of requests sent to /health")
+    parser.add_argument("--stub-llm", action="store_true", help="Start a stand-in Ollama backend")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Stub seconds per LLM call")
+    parser.add_argument("--llm-slots", type=int, default=1, help="Stub concurrent inference slots")
+    parser.add_argument("--hedge", action="store_true", help="In-process only: enable hedged LLM requests")
+    parser.add_argument("--max-duration", type=float, help="In-process only: override the 180s negotiation budget")
+    parser.add_argument("--log-file", help="In-process only: negotiation log (default: a temporary file)")
+    parser.add_argument("--json", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    if args.stub_llm:
+        _, stub_url = start_stub_llm(args.llm_latency, slots=args.llm_slots)
+        print(f"🧪 Stand-in LLM at {stub_url} ({args.llm_latency}s/call, {args.llm_slots} slot(s))")
+        if args.url:
+            print("   Start the server with OLLAMA_URL set to this address for it to be used.")
+
+    if args.in_process:
+        import llm_api
+        if args.stub_llm:
+            llm_api.OLLAMA_URL = stub_url
+            # Size admission control for the stub's capacity, as NEGOTIATOR_LLM_SLOTS would for Ollama
+            os.environ.setdefault("NEGOTIATOR_LLM_SLOTS", str(args.llm_slots))
+        llm_api.hedger.enabled = llm_api.hedger.enabled or args.hedge
+        from negotiation_engine import logger
+        # Keep load-test negotiations out of the tracked data/negotiation_log.txt
+        logger.LOG_FILE = args.log_file or os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "negotiation_log.txt")
+        print(f"📝 Negotiation log: {logger.LOG_FILE}")
+        import app as service
+        if args.max_duration:
+            service.MAX_NEGOTIATION_SECONDS = args.max_duration
+        client = InProcessClient(service.app)
+        products = [p["name"] for p in service.products_data]
+    else:
+        client = HttpClient(args.url)
+        products = ["Coffee"]
+
+    mixes = {
+        "products": parse_mix(args.products, products),
+        "buyer": parse_mix(args.buyer_personas, PERSONAS_BUYER),
+        "seller": parse_mix(args.seller_personas, SELLER_PERSONAS),
+    }
+    levels = [int(c) for c in args.sweep.split(",")] if args.sweep else [args.concurrency]
+
+    reports = []
+    for concurrency in levels:
+        print(f"🚀 Level concurrency={concurrency} for {args.duration:.0f}s ...")
+        reports.append(run_level(client, concurrency, args.duration, args.rate, mixes, args.health_ratio))
+    print_report(reports)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os
+import threading
 from datetime import datetime
 
 LOG_FILE = "data/negotiation_log.txt"
+_log_lock = threading.Lock()  # concurrent negotiations must not interleave entries
 
 def log_round(context, buyer_persona, seller_persona, rounds):
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
+    with _log_lock, open(LOG_FILE, "a", encoding="utf-8") as f:
         # Start of log entry with timestamp
         f.write(f"--- Negotiation [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ---\n")
         
@@ -0,0 +1,332 @@
+"""Marketplace (mandi) mode: many buyers and sellers per commodity, matched through an order book.
+
+Each commodity has a continuous order book. Buyers bid their budget (the
+highest seller quote they will accept) and sellers ask their acceptance
+threshold (the lowest buyer offer they will take). Every tick newly arrived
+agents post their quotes. The highest bid is then paired with the lowest ask
+for as long as the two are within `band` of each other, and all pairs
+matched in the tick negotiate bilaterally at the same time.
+
+Agents that fail to close go back into the book with their quotes moved
+toward the last clearing price. An agent that has failed `max_attempts`
+times leaves the market. Agents still resting in the book concede a little
+every tick, up to their budget ceiling or ask floor. The clearing price per tick is the volume-weighted
+price of that tick's deals.
+
+Engines for the bilateral negotiations:
+  vector  rule-only fast path: the whole tick is one simulator.simulate() call
+          over compact agent state, which keeps 10k+ agents on one machine cheap
+  agents  every pair plays a NegotiationSession with the real agents and a rule-only seller
+  llm     as agents, with LLM seller replies, `concurrency` pairs at a time
+
+In the agents and llm engines the agents' own persona rules set their limits,
+so per-agent budgets only steer matching, not the negotiation itself.
+
+    python -m negotiation_engine.marketplace --buyers 5000 --sellers 5000 --products Coffee,Turmeric
+    python -m negotiation_engine.marketplace --buyers 40 --sellers 40 --engine llm --concurrency 8
+"""
+import argparse
+import heapq
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from agents.seller_agent import SELLER_PERSONAS
+from negotiation_engine.simulator import DEFAULT_PARAMS, PERSONAS, persona_margin_pct
+
+MARKET_BAND = 0.10          # pair a bid and an ask when ask <= bid * (1 + band)
+MAX_ATTEMPTS = 3            # failed negotiations before an agent leaves the market
+BUDGET_SPREAD = 0.04        # std-dev of buyer budgets around their persona target
+MARGIN_SPREAD = 0.5         # seller margins and acceptance thresholds vary by +/- this share
+REPRICE_STEP = 0.5          # share of the gap to the clearing price closed after a failed negotiation
+BUDGET_CEILING = 1.08       # a buyer never stretches its budget beyond this multiple of its first one
+ASK_FLOOR = 0.95            # nor does a seller accept less than this multiple of the market price
+IMPATIENCE = 0.01           # share by which unmatched agents concede every tick they rest in the book
+
+
+class MarketBuyer:
+    __slots__ = ("id", "persona", "target", "ceiling", "attempts")
+
+    def __init__(self, id: int, persona: str, target: float):
+        self.id = id
+        self.persona = persona
+        self.target = target          # accepts seller quotes at or below this
+        self.ceiling = target * BUDGET_CEILING
+        self.attempts = 0
+
+
+class MarketSeller:
+    __slots__ = ("id", "persona", "min_margin", "accept_ratio", "attempts")
+
+    def __init__(self, id: int, persona: str, min_margin: float, accept_ratio: float):
+        self.id = id
+        self.persona = persona
+        self.min_margin = min_margin      # sets the opening quote
+        self.accept_ratio = accept_ratio  # accepts buyer offers at or above base * accept_ratio
+        self.attempts = 0
+
+
+class OrderBook:
+    """Bids and asks for one commodity; heaps keyed on price, then arrival order."""
+
+    def __init__(self, product: dict, band: float = MARKET_BAND):
+        self.product = product
+        self.base = float(product["base_market_price"])
+        self.band = band
+        self.bids = []   # (-target, seq, buyer)
+        self.asks = []   # (threshold, seq, seller)
+        self._seq = itertools.count()
+        self.trades = 0
+        self.volume = 0.0
+        self.last_price = None
+        self.price_path = []   # (tick, clearing price)
+
+    def post_bid(self, buyer: MarketBuyer):
+        heapq.heappush(self.bids, (-buyer.target, next(self._seq), buyer))
+
+    def post_ask(self, seller: MarketSeller):
+        heapq.heappush(self.asks, (self.base * seller.accept_ratio, next(self._seq), seller))
+
+    def match(self) -> list:
+        """Pop every best bid / best ask pair within the band."""
+        pairs = []
+        while self.bids and self.asks and self.asks[0][0] <= -self.bids[0][0] * (1 + self.band):
+            pairs.append((heapq.heappop(self.bids)[2], heapq.heappop(self.asks)[2]))
+        return pairs
+
+    def clear(self, tick: int, prices: list):
+        if prices:
+            self.last_price = sum(prices) / len(prices)
+            self.price_path.append((tick, round(self.last_price, 2)))
+            self.trades += len(prices)
+            self.volume += sum(prices)
+
+    def drift(self) -> bool:
+        """Resting agents concede a little each tick; True if any quote moved."""
+        moved = False
+        for _, _, buyer in self.bids:
+            target = min(buyer.ceiling, buyer.target * (1 + IMPATIENCE))
+            moved |= target > buyer.target
+            buyer.target = target
+        for _, _, seller in self.asks:
+            ratio = max(ASK_FLOOR, seller.accept_ratio - IMPATIENCE)
+            moved |= ratio < seller.accept_ratio
+            seller.accept_ratio = ratio
+        self.bids = [(-buyer.target, seq, buyer) for _, seq, buyer in self.bids]
+        self.asks = [(self.base * seller.accept_ratio, seq, seller) for _, seq, seller in self.asks]
+        heapq.heapify(self.bids)
+        heapq.heapify(self.asks)
+        return moved
+
+    def reprice(self, buyer: MarketBuyer = None, seller: MarketSeller = None):
+        """Move a failed agent's quote toward the clearing price (or one step without one) and re-post it."""
+        if buyer is not None:
+            buyer.attempts += 1
+            if buyer.attempts < MAX_ATTEMPTS:
+                reference = self.last_price if self.last_price and self.last_price > buyer.target else buyer.target * 1.04
+                buyer.target = min(buyer.ceiling, buyer.target + REPRICE_STEP * (reference - buyer.target))
+                self.post_bid(buyer)
+        if seller is not None:
+            seller.attempts += 1
+            if seller.attempts < MAX_ATTEMPTS:
+                ratio = seller.accept_ratio
+                reference = self.last_price / self.base if self.last_price and self.last_price < self.base * ratio else ratio - 0.06
+                seller.accept_ratio = max(ASK_FLOOR, ratio - REPRICE_STEP * (ratio - reference))
+                seller.min_margin *= 1 - REPRICE_STEP / 2
+                self.post_ask(seller)
+
+
+# ---------------------------
+# BILATERAL NEGOTIATION ENGINES
+# ---------------------------
+def negotiate_vector(book: OrderBook, pairs: list, max_rounds: int) -> list:
+    """All of a tick's pairs in one vectorized simulator run; returns (deal, price, rounds) per pair."""
+    from negotiation_engine.simulator import simulate
+
+    n = len(pairs)
+    product = book.product
+    params = {key: np.full(n, value, dtype=float) for key, value in DEFAULT_PARAMS.items()}
+    params.update({
+        "base_price": np.full(n, book.base),
+        "grade_a": np.full(n, product.get("quality_grade") == "A"),
+        "export_grade": np.full(n, bool(product.get("attributes", {}).get("export_grade"))),
+        "target": np.array([float(int(buyer.target)) for buyer, _ in pairs]),
+        "min_margin": np.array([seller.min_margin for _, seller in pairs]),
+        "accept_ratio": np.array([seller.accept_ratio for _, seller in pairs]),
+    })
+    results = simulate(params, max_rounds=max_rounds)
+    return [(bool(deal), float(price) if deal else None, int(rounds))
+            for deal, price, rounds in zip(results["deal"], results["final_price"], results["rounds"])]
+
+
+def negotiate_agents(book: OrderBook, pairs: list, max_rounds: int, rule_only: bool, concurrency: int) -> list:
+    """Each pair as a NegotiationSession with the real agents."""
+    from agents.buyer_agent import BuyerAgent
+    from agents.seller_agent import SellerAgent
+    from negotiation_engine.session import NegotiationSession, build_context
+
+    def play(pair):
+        buyer, seller = pair
+        product = book.product
+        context = build_context(product)
+        context["Base Market Price"] = book.base
+        session = NegotiationSession(
+            context, BuyerAgent(persona=buyer.persona, adaptive=False),
+            SellerAgent(persona=seller.persona, min_margin=seller.min_margin, rule_only=rule_only),
+            max_rounds=max_rounds, min_rounds=1
+        )
+        session.start(f"What’s your offer for {context['Order Size (kg)']}kg of {context['name']}?")
+        for _ in session.turns():
+            pass
+        deal = session.status == "deal" and session.final_price is not None
+        return deal, float(session.final_price) if deal else None, session.round_num
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="marketplace") as executor:
+        return list(executor.map(play, pairs))
+
+
+# ---------------------------
+# MARKET
+# ---------------------------
+class Marketplace:
+    def __init__(self, products: list, buyers: int, sellers: int, engine: str = "vector", concurrency: int = 8,
+                 arrival_ticks: int = 10, max_ticks: int = 50, max_rounds: int = 15, band: float = MARKET_BAND,
+                 seed: int = None):
+        if engine not in ("vector", "agents", "llm"):
+            raise ValueError(f"Unknown engine '{engine}'.")
+        self.engine = engine
+        self.concurrency = concurrency
+        self.arrival_ticks = max(1, arrival_ticks)
+        self.max_ticks = max(max_ticks, self.arrival_ticks)
+        self.max_rounds = max_rounds
+        self.rng = np.random.default_rng(seed)
+        self.books = {p["name"]: OrderBook(p, band) for p in products}
+        self.arrivals = self._spawn(products, buyers, sellers)
+        self.negotiations = 0
+        self.rounds = 0
+
+    def _spawn(self, products: list, buyers: int, sellers: int) -> list:
+        """Agents spread evenly over commodities, each arriving at a random tick."""
+        rng, names = self.rng, [p["name"] for p in products]
+        margins = {persona: persona_margin_pct(persona) for persona in PERSONAS}
+        arrivals = []
+        for i in range(buyers):
+            book = self.books[names[i % len(names)]]
+            persona = PERSONAS[rng.integers(len(PERSONAS))]
+            target = book.base * (1 - margins[persona] * 0.05) * rng.normal(1, BUDGET_SPREAD)
+            arrivals.append((int(rng.integers(self.arrival_ticks)), book, MarketBuyer(i, persona, target)))
+        for i in range(sellers):
+            book = self.books[names[i % len(names)]]
+            spread = rng.uniform(1 - MARGIN_SPREAD, 1 + MARGIN_SPREAD, 2)
+            seller = MarketSeller(i, SELLER_PERSONAS[rng.integers(len(SELLER_PERSONAS))],
+                                  DEFAULT_PARAMS["min_margin"] * spread[0],
+                                  1 + (DEFAULT_PARAMS["accept_ratio"] - 1) * spread[1])
+            arrivals.append((int(rng.integers(self.arrival_ticks)), book, seller))
+        arrivals.sort(key=lambda arrival: arrival[0])
+        return arrivals
+
+    def negotiate(self, book: OrderBook, pairs: list) -> list:
+        if self.engine == "vector":
+            return negotiate_vector(book, pairs, self.max_rounds)
+        return negotiate_agents(book, pairs, self.max_rounds, self.engine == "agents", self.concurrency)
+
+    def run(self) -> dict:
+        started = time.time()
+        pending = iter(self.arrivals)
+        next_arrival = next(pending, None)
+        ticks = 0
+        for tick in range(self.max_ticks):
+            while next_arrival is not None and next_arrival[0] <= tick:
+                _, book, agent = next_arrival
+                if isinstance(agent, MarketBuyer):
+                    book.post_bid(agent)
+                else:
+                    book.post_ask(agent)
+                next_arrival = next(pending, None)
+
+            matched = 0
+            for book in self.books.values():
+                pairs = book.match()
+                if not pairs:
+                    continue
+                matched += len(pairs)
+                prices = []
+                for (buyer, seller), (deal, price, rounds) in zip(pairs, self.negotiate(book, pairs)):
+                    self.rounds += rounds
+                    if deal:
+                        prices.append(price)
+                    else:
+                        book.reprice(buyer, seller)
+                book.clear(tick, prices)
+            self.negotiations += matched
+            ticks = tick + 1
+            moved = [book.drift() for book in self.books.values()]
+            if not matched and next_arrival is None and not any(moved):
+                break
+        return self.report(time.time() - started, ticks)
+
+    def report(self, elapsed: float, ticks: int) -> dict:
+        commodities = {}
+        for name, book in self.books.items():
+            commodities[name] = {
+                "marketPrice": book.base,
+                "deals": book.trades,
+                "clearingPrice": round(book.volume / book.trades, 2) if book.trades else None,
+                "lastPrice": round(book.last_price, 2) if book.last_price else None,
+                "restingBids": len(book.bids),
+                "restingAsks": len(book.asks),
+                "pricePath": book.price_path[-10:]
+            }
+        deals = sum(c["deals"] for c in commodities.values())
+        return {
+            "engine": self.engine,
+            "agents": len(self.arrivals),
+            "ticks": ticks,
+            "negotiations": self.negotiations,
+            "deals": deals,
+            "meanRounds": round(self.rounds / self.negotiations, 2) if self.negotiations else None,
+            "elapsed": round(elapsed, 3),
+            "dealsPerSecond": round(deals / elapsed, 1) if elapsed else None,
+            "negotiationsPerSecond": round(self.negotiations / elapsed, 1) if elapsed else None,
+            "commodities": commodities
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a mandi: many buyers and sellers per commodity")
+    parser.add_argument("--buyers", type=int, default=5000)
+    parser.add_argument("--sellers", type=int, default=5000)
+    parser.add_argument("--products", help="Comma-separated product names (default: all)")
+    parser.add_argument("--engine", choices=["vector", "agents", "llm"], default="vector")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel negotiations for the agents/llm engines")
+    parser.add_argument("--arrival-ticks", type=int, default=10, help="Ticks over which agents arrive")
+    parser.add_argument("--max-ticks", type=int, default=50)
+    parser.add_argument("--band", type=float, default=MARKET_BAND)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    with open("products.json", "r") as f:
+        products = json.load(f)
+    if args.products:
+        wanted = [name.strip() for name in args.products.split(",")]
+        products = [p for p in products if p["name"] in wanted]
+
+    market = Marketplace(products, args.buyers, args.sellers, engine=args.engine, concurrency=args.concurrency,
+                         arrival_ticks=args.arrival_ticks, max_ticks=args.max_ticks, band=args.band, seed=args.seed)
+    report = market.run()
+    print(f"🏪 {report['agents']:,} agents, {report['negotiations']:,} negotiations, {report['deals']:,} deals "
+          f"in {report['elapsed']:.2f}s ({report['dealsPerSecond']} deals/s, {report['ticks']} ticks)")
+    for name, c in report["commodities"].items():
+        print(f"   {name}: {c['deals']} deals, clearing ₹{c['clearingPrice']} (market ₹{c['marketPrice']:.0f}), "
+              f"resting {c['restingBids']} bids / {c['restingAsks']} asks")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""Memory instrumentation for negotiations, and a budget harness for sizing workers.
+
+A negotiation keeps its transcript, the buyer's offer history and intent log, a
+copy of the product context and finally the response JSON. footprint() measures
+that retained size per negotiation. The app measures every
+NEGOTIATOR_MEMORY_SAMPLE_EVERY-th /negotiate (the walk over the object graph is
+not free) and reports the distribution and the worker's peak RSS under /stats "memory".
+NEGOTIATOR_TRACEMALLOC=1 also starts tracemalloc in the worker and adds traced
+bytes and the top allocation sites.
+
+The harness runs N negotiations at a given concurrency under tracemalloc. It
+reports the traced bytes retained per negotiation, the per-session footprints,
+the extra working memory per concurrent negotiation, how a session grows with
+rounds and the peak RSS. It exits with status 1 when a session goes over the
+budget:
+
+    python -m negotiation_engine.memory --negotiations 200 --concurrency 8 --rule-only --budget-kb 256
+    python -m negotiation_engine.memory --negotiations 40 --concurrency 4 --stub-llm --llm-latency 0.05
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+SESSION_MEMORY_BUDGET_KB = float(os.environ.get("NEGOTIATOR_SESSION_MEMORY_BUDGET_KB", 256))
+TRACEMALLOC_ENABLED = os.environ.get("NEGOTIATOR_TRACEMALLOC", "0") == "1"
+TRACEMALLOC_FRAMES = 5
+METRICS_WINDOW = 200     # recent measured negotiations used for the reported percentiles
+SAMPLE_EVERY = max(1, int(os.environ.get("NEGOTIATOR_MEMORY_SAMPLE_EVERY", 10)))
+# Shared with every session rather than owned by one (the persona_params singleton, the
+# trace registry's tracer, the warm-up cache), so not counted in its footprint
+SHARED_ATTRIBUTES = {"tracer", "opening_cache", "param_source"}
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                  threading.Thread)
+
+
+# ---------------------------
+# MEASUREMENT
+# ---------------------------
+def footprint(*objects) -> int:
+    """Bytes held by `objects` and everything they reference, each object counted once."""
+    seen, stack, total = set(), list(objects), 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            total += sys.getsizeof(obj.__dict__)
+            stack.extend(value for key, value in vars(obj).items() if key not in SHARED_ATTRIBUTES)
+        elif hasattr(obj, "__slots__"):
+            stack.extend(getattr(obj, slot) for slot in obj.__slots__ if hasattr(obj, slot))
+    return total
+
+
+def rss_bytes():
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (the worker), or None without the resource module."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024   # macOS reports bytes, Linux KiB
+
+
+def top_allocations(limit: int = 5, snapshot=None, baseline=None) -> list:
+    """Largest traced allocation sites, or their growth since `baseline`."""
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = snapshot or tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.compare_to(baseline, "lineno") if baseline else snapshot.statistics("lineno")
+    return [{"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "bytes": getattr(stat, "size_diff", stat.size), "blocks": getattr(stat, "count_diff", stat.count)}
+            for stat in stats[:limit]]
+
+
+class MemoryMonitor:
+    def __init__(self, budget_kb: float = SESSION_MEMORY_BUDGET_KB, trace: bool = TRACEMALLOC_ENABLED,
+                 sample_every: int = SAMPLE_EVERY):
+        self.budget = int(budget_kb * 1024)
+        self.sample_every = sample_every
+        self.sizes = deque(maxlen=METRICS_WINDOW)
+        self.counters = {"negotiations": 0, "sampled": 0, "overBudget": 0}
+        self._lock = threading.Lock()
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def record(self, *objects):
+        """Count one finished negotiation (e.g. its session and response payload).
+
+        Every `sample_every`-th one is measured; returns its bytes, or None when it was not.
+        """
+        with self._lock:
+            self.counters["negotiations"] += 1
+            if (self.counters["negotiations"] - 1) % self.sample_every:
+                return None
+        size = footprint(*objects)
+        with self._lock:
+            self.sizes.append(size)
+            self.counters["sampled"] += 1
+            self.counters["overBudget"] += size > self.budget
+        return size
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = sorted(self.sizes)
+            counters = dict(self.counters)
+        traced = None
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            traced = {"currentBytes": current, "peakBytes": peak, "top": top_allocations()}
+        return {
+            "rssBytes": rss_bytes(),
+            "peakRssBytes": peak_rss_bytes(),
+            "budgetBytes": self.budget,
+            "sampleEvery": self.sample_every,
+            **counters,
+            "negotiationBytesP50": _percentile(sizes, 0.50),
+            "negotiationBytesP95": _percentile(sizes, 0.95),
+            "negotiationBytesMax": sizes[-1] if sizes else None,
+            "tracemalloc": traced
+        }
+
+
+def _percentile(ordered: list, q: float):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+memory_monitor = MemoryMonitor()
+
+
+# ---------------------------
+# HARNESS
+# ---------------------------
+def new_session(product: dict, buyer_persona: str, seller_persona: str, rule_only: bool):
+    from agents.buyer_agent import BuyerAgent
+    from agents.seller_agent import SellerAgent
+    from negotiation_engine.session import NegotiationSession, build_context
+
+    context = build_context(product)
+    session = NegotiationSession(context, BuyerAgent(persona=buyer_persona),
+                                 SellerAgent(persona=seller_persona, rule_only=rule_only))
+    session.start(f"What’s your offer for {context['Order Size (kg)']}kg of {context['name']}?")
+    return session
+
+
+def payload_for(session) -> dict:
+    """The parts of the /negotiate response that are built from the session."""
+    payload = {"context": session.context, "messages": session.messages, "summary": session.summary()}
+    payload["encoded"] = json.dumps(payload, ensure_ascii=False)
+    return payload
+
+
+def play(product: dict, buyer_persona: str, seller_persona: str, rule_only: bool) -> tuple:
+    session = new_session(product, buyer_persona, seller_persona, rule_only)
+    for _ in session.turns():
+        pass
+    return session, payload_for(session)
+
+
+def growth_by_round(product: dict, buyer_persona: str, seller_persona: str, rule_only: bool) -> list:
+    """Session footprint after each round of one negotiation."""
+    session = new_session(product, buyer_persona, seller_persona, rule_only)
+    sizes = []
+    while session.is_open:
+        round_num = session.round_num
+        session.step()
+        if session.round_num != round_num or not session.is_open:
+            sizes.append({"round": round_num, "bytes": footprint(session)})
+    return sizes
+
+
+def run_harness(products: list, buyer_personas: list, seller_personas: list, negotiations: int,
+                concurrency: int, rule_only: bool, budget: int) -> dict:
+    jobs = [(products[i % len(products)], buyer_personas[i % len(buyer_personas)],
+             seller_personas[i % len(seller_personas)]) for i in range(negotiations)]
+    play(*jobs[0], rule_only)   # imports, regexes and module caches are not per-session memory
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    gc.collect()
+    baseline = tracemalloc.take_snapshot()
+    base_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="memory-harness") as executor:
+        finished = list(executor.map(lambda job: play(*job, rule_only), jobs))   # kept alive until measured
+    elapsed = time.time() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    top = top_allocations(8, baseline=baseline)
+
+    sizes = sorted(footprint(session, payload) for session, payload in finished)
+    rounds = [session.round_num for session, _ in finished]
+    del finished
+    growth = growth_by_round(*jobs[0], rule_only)
+    per_round = ((growth[-1]["bytes"] - growth[0]["bytes"]) / (len(growth) - 1)) if len(growth) > 1 else None
+
+    retained = (current - base_bytes) / negotiations
+    report = {
+        "negotiations": negotiations,
+        "concurrency": concurrency,
+        "elapsed": round(elapsed, 2),
+        "meanRounds": round(sum(rounds) / len(rounds), 2),
+        # Traced bytes still held per finished negotiation (session, agents, payload and its JSON)
+        "retainedBytesPerNegotiation": int(retained),
+        # Working memory above what is retained (prompts, LLM responses, encoding), per negotiation running at once
+        "transientBytesPerConcurrent": int(max(0, peak - current) / concurrency),
+        "sessionBytesP50": _percentile(sizes, 0.50),
+        "sessionBytesP95": _percentile(sizes, 0.95),
+        "sessionBytesMax": sizes[-1],
+        "bytesPerRound": int(per_round) if per_round is not None else None,
+        "growth": growth,
+        "rssBytes": rss_bytes(),
+        "peakRssBytes": peak_rss_bytes(),
+        "topAllocations": top,
+        "budgetBytes": budget,
+    }
+    report["overBudget"] = retained > budget or sizes[-1] > budget
+    return report
+
+
+def print_report(report: dict):
+    kb = lambda value: f"{value / 1024:.1f} KiB" if value is not None else "-"
+    print(f"\n🧠 {report['negotiations']} negotiations at concurrency {report['concurrency']} "
+          f"({report['meanRounds']} rounds on average, {report['elapsed']}s)")
+    print(f"   retained per negotiation: {kb(report['retainedBytesPerNegotiation'])}   "
+          f"transient per concurrent negotiation: {kb(report['transientBytesPerConcurrent'])}")
+    print(f"   session footprint p50/p95/max: {kb(report['sessionBytesP50'])} / {kb(report['sessionBytesP95'])} / "
+          f"{kb(report['sessionBytesMax'])}   growth: {kb(report['bytesPerRound'])} per round")
+    print(f"   worker RSS: {kb(report['rssBytes'])} (peak {kb(report['peakRssBytes'])})")
+    for site in report["topAllocations"]:
+        print(f"     {site['bytes'] / 1024:+9.1f} KiB  {site['blocks']:+7d} blocks  {site['site']}")
+    verdict = "❌ over" if report["overBudget"] else "✅ within"
+    print(f"{verdict} the per-session budget of {kb(report['budgetBytes'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per negotiation and check it against a budget")
+    parser.add_argument("--negotiations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--products", help="Comma-separated product names (default: all)")
+    parser.add_argument("--buyer-personas", default="Diplomatic,Assertive,Strategic,Balanced")
+    parser.add_argument("--seller-personas", default="Analytical,Aggressive")
+    parser.add_argument("--budget-kb", type=float, default=SESSION_MEMORY_BUDGET_KB,
+                        help="Fail when a session retains more than this")
+    parser.add_argument("--rule-only", action="store_true", help="Seller answers without the LLM")
+    parser.add_argument("--stub-llm", action="store_true", help="Use the load test's stand-in Ollama backend")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub seconds per LLM call")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    if args.stub_llm:
+        import llm_api
+        from negotiation_engine.loadtest import start_stub_llm
+        _, llm_api.OLLAMA_URL = start_stub_llm(args.llm_latency, slots=args.concurrency)
+
+    with open("products.json", "r") as f:
+        products = json.load(f)
+    if args.products:
+        names = {name.strip() for name in args.products.split(",")}
+        products = [p for p in products if p["name"] in names]
+    report = run_harness(products, args.buyer_personas.split(","), args.seller_personas.split(","),
+                         args.negotiations, args.concurrency, args.rule_only, int(args.budget_kb * 1024))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if report["overBudget"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Structured LLM offers: JSON schema, validation and rendering back to transcript text.
+
+The rest of the app reads prices from "₹NNNNN per quintal", so a validated offer
+is rendered with its price in exactly that form whatever notation the model used.
+"""
+import re
+
+OFFER_ACTIONS = ["offer", "counter", "accept", "walk_away", "inquiry"]
+PRICED_ACTIONS = {"offer", "counter", "accept"}
+
+# Passed to Ollama as `format`, so decoding is constrained to this shape
+OFFER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": OFFER_ACTIONS},
+        "price": {"type": ["integer", "null"], "description": "Rupees per quintal"},
+        "message": {"type": "string"}
+    },
+    "required": ["action", "price", "message"]
+}
+
+OFFER_FORMAT_HINT = (
+    "Reply only with JSON: {\"action\": one of " + ", ".join(OFFER_ACTIONS) +
+    ", \"price\": whole rupees per quintal or null, \"message\": what you say to the buyer}."
+)
+
+# "₹17500", "Rs. 17,500/quintal", "INR 1,05,000 per quintal"
+LOOSE_PRICE = re.compile(r"(?:₹|\bRs\.?|\bINR)\s*([\d,]+(?:\.\d+)?)(?:\s*(?:/|per)\s*quintal)?", re.IGNORECASE)
+
+# A price this far from the market price is a parsing or generation error, not an offer
+PRICE_SANITY_RANGE = (0.5, 2.0)
+
+
+def parse_price(value):
+    """Int rupees from an int/float or a string such as '17,500' or '₹1,05,000'; None if unusable."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value)) if value > 0 else None
+    if isinstance(value, str):
+        match = LOOSE_PRICE.search(value) or re.search(r"([\d,]+(?:\.\d+)?)", value)
+        if match:
+            digits = match.group(1).replace(",", "")
+            try:
+                return parse_price(float(digits))
+            except ValueError:
+                return None
+    return None
+
+
+def validate_offer(data, base_price=None):
+    """Return (offer, None) for a usable reply, or (None, reason) for the repair prompt."""
+    if not isinstance(data, dict):
+        return None, "the reply must be a JSON object"
+    action = str(data.get("action", "")).strip().lower().replace(" ", "_")
+    if action not in OFFER_ACTIONS:
+        return None, f"action must be one of {', '.join(OFFER_ACTIONS)}"
+    message = data.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return None, "message must be a non-empty string"
+    price = parse_price(data.get("price"))
+    if price is None:
+        price = parse_price(message)
+    if action in PRICED_ACTIONS and price is None:
+        return None, f"a '{action}' needs a numeric price in rupees per quintal"
+    if price is not None and base_price:
+        low, high = PRICE_SANITY_RANGE
+        if not low * base_price <= price <= high * base_price:
+            return None, f"price {price} is implausible for a market price of {base_price:.0f} per quintal"
+    return {"action": action, "price": price, "message": message.strip()}, None
+
+
+def render_offer(offer: dict) -> str:
+    """Offer message with its price written as '₹NNNNN per quintal'."""
+    message, price = offer["message"], offer["price"]
+    if price is None:
+        return message
+    canonical = f"₹{price} per quintal"
+    if canonical in message:
+        return message
+    match = LOOSE_PRICE.search(message)
+    if match and parse_price(match.group(0)) == price:
+        return message[:match.start()] + canonical + message[match.end():]
+    return f"{message.rstrip()} ({canonical})"
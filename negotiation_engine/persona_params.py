@@ -0,0 +1,73 @@
+"""Tunable negotiation thresholds for BuyerAgent and SellerAgent.
+
+The defaults are the values the agents were hand-written with. A parameter file
+(written by `python -m negotiation_engine.tuner`) overrides any of them, either for
+every persona ("default") or for one persona:
+
+    {"buyer": {"default": {"discount": 0.87}, "Assertive": {"margin_pct": 1.0, "max_counters": 5}},
+     "seller": {"default": {"accept_ratio": 1.08}}}
+
+The file is data/persona_params.json, or NEGOTIATOR_PERSONA_PARAMS.
+"""
+import json
+import os
+
+PERSONA_PARAMS_FILE = os.environ.get("NEGOTIATOR_PERSONA_PARAMS", os.path.join("data", "persona_params.json"))
+
+BUYER_DEFAULTS = {
+    "margin_pct": 0.01,          # target = base * (1 - margin_pct * 0.05)
+    "discount": 0.87,            # counter = seller quote * discount ...
+    "soft_discount": 0.85,       # ... or this once the seller is softening
+    "floor_ratio": 0.90,         # never counter below target * floor_ratio
+    "max_counters": 7,           # walk away after this many counters above target
+    "convergence_tolerance": 0.05,  # offers this close for 3 rounds: settle at the midpoint or walk away
+}
+BUYER_PERSONA_DEFAULTS = {
+    "Aggressive": {"margin_pct": 1.0},
+    "Assertive": {"margin_pct": 1.0, "convergence_tolerance": 0.03},   # holds out longer before splitting
+    "Analytical": {"margin_pct": 0.80},
+    "Strategic": {"margin_pct": 0.80, "convergence_tolerance": 0.04},
+    "Balanced": {"margin_pct": 0.70, "convergence_tolerance": 0.05},
+    "Diplomatic": {"margin_pct": 0.69, "convergence_tolerance": 0.06},
+    "Wildcard": {"margin_pct": 0.75},
+    "Adaptive": {"margin_pct": 0.70},
+}
+SELLER_DEFAULTS = {
+    "min_margin": 0.10,          # opening margin over market, plus 5% each for grade A and export grade
+    "accept_ratio": 1.10,        # accept buyer offers >= base * accept_ratio
+    "early_inflation": 0.15,     # counter = buyer offer * (1 + inflation) up to inflation_switch_round
+    "late_inflation": 0.05,
+    "inflation_switch_round": 8,
+    "seller_walk_round": 12,     # after this round walk away from offers below base * seller_walk_ratio
+    "seller_walk_ratio": 1.05,
+    "stalemate_rounds": 2,       # buyer offers moving less than stalemate_move this many rounds in a row ...
+    "stalemate_move": 0.01,      # ... switch the seller to late_inflation for the rest (0 rounds: never)
+}
+INT_PARAMS = {"max_counters", "inflation_switch_round", "seller_walk_round", "stalemate_rounds"}
+
+
+class PersonaParams:
+    def __init__(self, overrides: dict = None):
+        overrides = overrides or {}
+        self.buyer_overrides = overrides.get("buyer", {})
+        self.seller_overrides = overrides.get("seller", {})
+
+    def buyer(self, persona: str) -> dict:
+        return {**BUYER_DEFAULTS, **BUYER_PERSONA_DEFAULTS.get(persona, {}),
+                **self.buyer_overrides.get("default", {}), **self.buyer_overrides.get(persona, {})}
+
+    def seller(self, persona: str = None) -> dict:
+        return {**SELLER_DEFAULTS, **self.seller_overrides.get("default", {}),
+                **self.seller_overrides.get(persona, {})}
+
+
+def load_persona_params(path: str = PERSONA_PARAMS_FILE) -> PersonaParams:
+    """Parameters from `path`, or the built-in defaults when there is no such file."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return PersonaParams(json.load(f))
+    except FileNotFoundError:
+        return PersonaParams()
+
+
+persona_params = load_persona_params()
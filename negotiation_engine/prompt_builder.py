@@ -0,0 +1,82 @@
+import math
+import re
+
+# Per-role prompt budgets in (estimated) tokens
+TOKEN_BUDGETS = {
+    "seller": 200,  # includes the ~40-token JSON format hint
+    "buyer": 160,
+    "agent": 240,
+}
+
+_PIECES = re.compile(r"\d+|[A-Za-z]+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local estimate of llama3 token count.
+
+    Words cost one token per ~4 letters, numbers one per 3 digits (llama3 splits
+    digits that way) and every other symbol, emoji included, one token.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text or ""):
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+def shorten_quote(message: str, max_tokens: int = 40) -> str:
+    """Keep the sentence carrying a ₹ price (if any) and cap the rest at `max_tokens`."""
+    sentences = re.split(r"(?<=[.!?])\s+", message.strip())
+    priced = [s for s in sentences if "₹" in s]
+    text = " ".join(priced) if priced else message
+    words = text.split()
+    while words and estimate_tokens(" ".join(words)) > max_tokens:
+        words.pop(0)
+    return " ".join(words)
+
+
+class PromptBuilder:
+    """Assembles a prompt from named sections and trims it to the role's token budget.
+
+    Each section has a priority (higher = more important) and optional shorter
+    variants. While the prompt is over budget the lowest-priority section that can
+    still shrink is replaced by its next variant; optional sections are finally dropped.
+    Required sections can shrink but are never dropped.
+    """
+
+    def __init__(self, role: str, budget: int = None):
+        self.role = role
+        self.budget = budget or TOKEN_BUDGETS.get(role, TOKEN_BUDGETS["agent"])
+        self.sections = []
+        self.trimmed = []
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False, shorter: list = None):
+        if text:
+            variants = [text] + [v for v in (shorter or []) if v]
+            if not required:
+                variants.append("")
+            self.sections.append({"name": name, "priority": priority, "variants": variants, "level": 0})
+        return self
+
+    def _text(self) -> str:
+        parts = [s["variants"][s["level"]] for s in self.sections]
+        return " ".join(p.strip() for p in parts if p)
+
+    def build(self):
+        """Return (prompt, estimated_tokens)."""
+        text = self._text()
+        tokens = estimate_tokens(text)
+        while tokens > self.budget:
+            candidates = [s for s in self.sections if s["level"] < len(s["variants"]) - 1]
+            if not candidates:
+                break
+            section = min(candidates, key=lambda s: s["priority"])
+            section["level"] += 1
+            self.trimmed.append(section["name"])
+            text = self._text()
+            tokens = estimate_tokens(text)
+        return text, tokens
@@ -0,0 +1,153 @@
+"""Price-bucketed reuse of seller replies.
+
+Seller prompts for the same persona, product and decision differ only in their
+numbers. A reply the LLM wrote for one round is therefore stored as a template
+whose prices are slots:
+
+    "Given the quality, ₹17250 per quintal is my best price for your 100kg."
+    -> "Given the quality, ₹{price} per quintal is my best price for your {quantity}kg."
+
+It is then re-rendered with the next round's computed numbers. Templates are
+keyed by persona, product, model, decision and the decision instruction with its
+numbers replaced by placeholders. A reply is stored only if every number in it
+could be slotted, so a template never carries a stale price.
+
+NEGOTIATOR_REPLY_REUSE is the share of rounds that are answered from a stored
+template when one exists (default 0, off). The rest still call the LLM, and
+their replies are added to a small rotating pool per key so replies stay varied.
+
+    NEGOTIATOR_REPLY_REUSE=0.8 python app.py
+"""
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+
+from negotiation_engine.offers import render_offer, validate_offer
+
+REPLY_REUSE_RATIO = float(os.environ.get("NEGOTIATOR_REPLY_REUSE", 0))
+TEMPLATES_PER_KEY = 4    # variants kept per key; the oldest is replaced
+MAX_KEYS = 2000          # least recently used keys are dropped beyond this
+
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+# Slot order decides ties, e.g. an accepted price equal to the buyer's offer is the reply {price}
+SLOTS = ("price", "offer", "market", "quantity")
+
+
+def canonical(text: str) -> str:
+    """`text` with every number replaced by '#'."""
+    return NUMBER.sub("#", text)
+
+
+def _number(token: str):
+    try:
+        return float(token.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def to_template(message: str, values: dict):
+    """`message` with each number that matches a slot value (within ₹1) replaced by that slot.
+
+    Returns None when some number matches no slot.
+    """
+    known = [(slot, values[slot]) for slot in SLOTS if values.get(slot) is not None]
+    parts, last = [], 0
+    for match in NUMBER.finditer(message):
+        number = _number(match.group(0))
+        slot = next((slot for slot, value in known if number is not None and abs(number - value) <= 1), None)
+        if slot is None:
+            return None
+        parts.append(message[last:match.start()].replace("{", "{{").replace("}", "}}"))
+        parts.append("{" + slot + "}")
+        last = match.end()
+    parts.append(message[last:].replace("{", "{{").replace("}", "}}"))
+    return "".join(parts)
+
+
+class ReplyTemplates:
+    def __init__(self, ratio: float = REPLY_REUSE_RATIO, per_key: int = TEMPLATES_PER_KEY,
+                 max_keys: int = MAX_KEYS, seed: int = None):
+        self.ratio = ratio
+        self.per_key = per_key
+        self.max_keys = max_keys
+        self.templates = OrderedDict()   # key -> list of (action, template), most recently used key last
+        self.counters = {"hits": 0, "misses": 0, "stored": 0, "unslotted": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ratio > 0
+
+    @staticmethod
+    def key(persona: str, product: str, model: str, decision: str, instruction: str) -> tuple:
+        return persona, product, model, decision, canonical(instruction)
+
+    def reuse(self, key: tuple, values: dict, base_price=None):
+        """A reply rendered from a stored template for `key`, or None to call the LLM this round."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            variants = self.templates.get(key)
+            if not variants or self._random.random() >= self.ratio:
+                self.counters["misses"] += 1
+                return None
+            self.templates.move_to_end(key)
+            action, template = self._random.choice(variants)
+        rendered = {slot: int(round(value)) for slot, value in values.items() if value is not None}
+        try:
+            message = template.format(**rendered)
+        except KeyError:   # the template needs a number this round doesn't have
+            self._count("misses")
+            return None
+        offer, error = validate_offer({"action": action, "price": rendered.get("price"), "message": message},
+                                      base_price)
+        if offer is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return render_offer(offer)
+
+    def store(self, key: tuple, offer: dict, values: dict):
+        """Keep the LLM's validated `offer` as a template for later rounds with the same key."""
+        if not self.enabled:
+            return
+        # The LLM may have quoted its own price instead of the computed one; both fill {price}
+        template = to_template(offer["message"], values) or (
+            to_template(offer["message"], {**values, "price": offer["price"]}) if offer["price"] else None)
+        with self._lock:
+            if template is None:
+                self.counters["unslotted"] += 1
+                return
+            variants = self.templates.setdefault(key, [])
+            self.templates.move_to_end(key)
+            if (offer["action"], template) in variants:
+                return
+            variants.append((offer["action"], template))
+            if len(variants) > self.per_key:
+                variants.pop(0)
+            self.counters["stored"] += 1
+            while len(self.templates) > self.max_keys:
+                self.templates.popitem(last=False)
+
+    def reset(self):
+        """Forget every stored template and zero the counters."""
+        with self._lock:
+            self.templates.clear()
+            self.counters = dict.fromkeys(self.counters, 0)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {"ratio": self.ratio, "keys": len(self.templates),
+                    "templates": sum(len(v) for v in self.templates.values()), **self.counters,
+                    "hitRate": round(self.counters["hits"] / lookups, 4) if lookups else None}
+
+
+reply_templates = ReplyTemplates()
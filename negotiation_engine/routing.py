@@ -0,0 +1,236 @@
+"""Per-role model routing.
+
+Every LLM call picks its model from a routing table. The first rule whose
+`role`, `round` and `persona` all match wins; a missing field matches anything
+and a list matches any of its values. Round types are the seller's decisions
+(opening, counter, accept, walk_away, inquiry) plus "basket" for a basket's
+batched seller call and "chat" for BaseAgent.
+
+    {"default": "llama3:8b",
+     "rules": [{"role": "seller", "persona": "Wildcard", "model": "llama3:8b"},
+               {"role": "seller", "round": ["counter", "accept", "walk_away"], "model": "llama3.2:1b"}]}
+
+NEGOTIATOR_ROUTING selects a preset by name or a JSON file with such a table.
+The benchmark plays the same negotiations under several tables and reports LLM
+latency against how often the replies parsed as valid offers:
+
+    python -m negotiation_engine.routing --tables llama3-8b,small-rounds --products Coffee,Cardamom --runs 3
+    python -m negotiation_engine.routing --tables llama3-8b,small-all --stub-llm --llm-latency 0.2
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from llm_api import DEFAULT_MODEL, model_stats, structured_stats
+
+SMALL_MODEL = os.environ.get("NEGOTIATOR_SMALL_MODEL", "llama3.2:1b")
+
+ROUTING_PRESETS = {
+    # Everything on the default model
+    "llama3-8b": {"default": DEFAULT_MODEL, "rules": []},
+    # The seller's later rounds only restate a price the code has computed; openings
+    # and the free-form Wildcard persona keep the larger model
+    "small-rounds": {
+        "default": DEFAULT_MODEL,
+        "rules": [
+            {"role": "seller", "persona": "Wildcard", "model": DEFAULT_MODEL},
+            {"role": "seller", "round": ["counter", "accept", "walk_away", "inquiry"], "model": SMALL_MODEL}
+        ]
+    },
+    "small-all": {"default": SMALL_MODEL, "rules": []},
+}
+
+
+def load_table(spec: str) -> dict:
+    """A preset name or the path of a JSON routing table."""
+    if spec in ROUTING_PRESETS:
+        return ROUTING_PRESETS[spec]
+    with open(spec, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    if not isinstance(table.get("rules", []), list):
+        raise ValueError(f"Routing table {spec} must have a 'rules' list.")
+    return table
+
+
+def _matches(value, wanted) -> bool:
+    if wanted is None:
+        return True
+    if isinstance(wanted, list):
+        return value in wanted
+    return value == wanted
+
+
+class ModelRouter:
+    def __init__(self, table: dict = None, name: str = None):
+        self._lock = threading.Lock()
+        self.use(table or ROUTING_PRESETS["llama3-8b"], name or (None if table else "llama3-8b"))
+
+    def use(self, table: dict, name: str = None):
+        with self._lock:
+            self.name = name or "custom"
+            self.default = table.get("default", DEFAULT_MODEL)
+            self.rules = list(table.get("rules", []))
+            self.routed = {}
+
+    def model_for(self, role: str, round_type: str = None, persona: str = None, count: bool = True) -> str:
+        """The model for this call; with count=False the caller calls count() once the LLM is really called."""
+        with self._lock:
+            model = next((rule["model"] for rule in self.rules
+                          if _matches(role, rule.get("role")) and _matches(round_type, rule.get("round"))
+                          and _matches(persona, rule.get("persona"))), self.default)
+        if count:
+            self.count(role, round_type, model)
+        return model
+
+    def count(self, role: str, round_type: str, model: str):
+        with self._lock:
+            key = f"{role}:{round_type}"
+            self.routed.setdefault(key, {}).setdefault(model, 0)
+            self.routed[key][model] += 1
+
+    def models(self) -> list:
+        """Every model the table can route to, default first."""
+        with self._lock:
+            models = [self.default] + [rule["model"] for rule in self.rules]
+        return list(dict.fromkeys(models))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"table": self.name, "default": self.default, "rules": len(self.rules),
+                    "routed": {key: dict(models) for key, models in self.routed.items()}}
+
+
+def router_from_env() -> ModelRouter:
+    spec = os.environ.get("NEGOTIATOR_ROUTING")
+    if not spec:
+        return ModelRouter()
+    return ModelRouter(load_table(spec), name=spec)
+
+
+router = router_from_env()
+
+
+# ---------------------------
+# BENCHMARK
+# ---------------------------
+def _snapshot() -> dict:
+    return {model: dict(stats) for model, stats in model_stats.items()}, dict(structured_stats)
+
+
+def _delta(before: dict, after: dict) -> dict:
+    return {key: after[key] - before.get(key, 0) for key in after}
+
+
+def run_table(name: str, table: dict, products: list, seller_personas: list, buyer_persona: str, runs: int) -> dict:
+    """Play runs x products x seller personas negotiations with `table` routing the seller's calls.
+
+    Every table starts with no stored reply templates and an empty latency window, so
+    one table's replies and slow calls don't carry over into the next.
+    """
+    from agents.buyer_agent import BuyerAgent
+    from agents.seller_agent import SellerAgent
+    from llm_api import latency_tracker
+    from negotiation_engine.reply_templates import reply_templates
+    from negotiation_engine.session import NegotiationSession, build_context
+
+    router.use(table, name)
+    reply_templates.reset()
+    latency_tracker.reset()
+    models_before, structured_before = _snapshot()
+    durations, deals, modes = [], 0, {}
+    for _ in range(runs):
+        for product in products:
+            for persona in seller_personas:
+                context = build_context(product)
+                session = NegotiationSession(context, BuyerAgent(persona=buyer_persona, adaptive=False),
+                                             SellerAgent(persona=persona))
+                started = time.time()
+                session.start(f"What’s your offer for {context['Order Size (kg)']}kg of {context['name']}?")
+                for message in session.turns():
+                    if message["sender"] == "Seller":
+                        modes[message.get("mode")] = modes.get(message.get("mode"), 0) + 1
+                durations.append(time.time() - started)
+                deals += session.status == "deal"
+
+    models_after, structured_after = _snapshot()
+    per_model, calls, seconds = {}, 0, 0.0
+    for model, stats in models_after.items():
+        delta = _delta(models_before.get(model, {}), stats)
+        if delta["calls"]:
+            per_model[model] = {"calls": delta["calls"], "meanSeconds": round(delta["seconds"] / delta["calls"], 3)}
+            calls += delta["calls"]
+            seconds += delta["seconds"]
+    structured = _delta(structured_before, structured_after)
+    ordered = sorted(durations)
+    return {
+        "table": name,
+        "negotiations": len(durations),
+        "llmCalls": calls,
+        "meanCallSeconds": round(seconds / calls, 3) if calls else None,
+        "p50NegotiationSeconds": round(ordered[len(ordered) // 2], 3) if ordered else None,
+        "p95NegotiationSeconds": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3) if ordered else None,
+        # Parsed on the first try / after the repair retry, over all structured seller requests
+        "parseFirstTry": round((structured["calls"] - structured["repaired"] - structured["failed"]) / structured["calls"], 4)
+        if structured["calls"] else None,
+        "parseSuccess": round((structured["calls"] - structured["failed"]) / structured["calls"], 4)
+        if structured["calls"] else None,
+        "sellerRounds": modes,  # by reply mode; "rule" = no valid offer after the repair, "degraded" = over the SLO, "template" = reused reply
+        "dealRate": round(deals / len(durations), 4) if durations else None,
+        "models": per_model
+    }
+
+
+def _pct(value) -> str:
+    return f"{100 * value:.1f}" if value is not None else "-"
+
+
+def print_benchmark(results: list):
+    print(f"\n{'table':<16} {'neg':>4} {'calls':>6} {'call s':>7} {'p50 s':>7} {'p95 s':>7} {'parse1':>7} {'parse':>7} {'deal%':>6}")
+    for r in results:
+        print(f"{r['table']:<16} {r['negotiations']:>4} {r['llmCalls']:>6} {r['meanCallSeconds'] or 0:>7.3f} "
+              f"{r['p50NegotiationSeconds'] or 0:>7.2f} {r['p95NegotiationSeconds'] or 0:>7.2f} "
+              f"{_pct(r['parseFirstTry']):>7} {_pct(r['parseSuccess']):>7} {_pct(r['dealRate']):>6}")
+        for model, stats in r["models"].items():
+            print(f"    {model}: {stats['calls']} calls, {stats['meanSeconds']:.3f}s mean")
+        print(f"    seller rounds by mode: {r['sellerRounds']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model routing tables on the same negotiations")
+    parser.add_argument("--tables", default="llama3-8b,small-rounds",
+                        help="Comma-separated preset names or JSON table paths")
+    parser.add_argument("--products", default="Coffee", help="Comma-separated product names")
+    parser.add_argument("--seller-personas", default="Analytical,Aggressive")
+    parser.add_argument("--buyer-persona", default="Diplomatic")
+    parser.add_argument("--runs", type=int, default=2, help="Repeats of every product x persona pair per table")
+    parser.add_argument("--stub-llm", action="store_true", help="Use the load test's stand-in Ollama backend")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stub seconds per LLM call")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    if args.stub_llm:
+        import llm_api
+        from negotiation_engine.loadtest import start_stub_llm
+        _, llm_api.OLLAMA_URL = start_stub_llm(args.llm_latency)
+
+    with open("products.json", "r") as f:
+        products = {p["name"]: p for p in json.load(f)}
+    selected = [products[name.strip()] for name in args.products.split(",")]
+
+    results = []
+    for spec in args.tables.split(","):
+        print(f"🏁 Routing table {spec} ...")
+        results.append(run_table(spec, load_table(spec), selected, args.seller_personas.split(","),
+                                 args.buyer_persona, args.runs))
+    print_benchmark(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    # Run from the imported module so the agents and the benchmark share one router
+    from negotiation_engine.routing import main as benchmark_main
+    benchmark_main()
@@ -0,0 +1,249 @@
+"""Headless negotiation engine shared by the web app, sessions, baskets and the CLI.
+
+A NegotiationSession alternates seller and buyer turns. step() plays exactly one
+turn: the agent for that side answers, or a human's text is passed in. turns()
+plays agent-only negotiations to the end. All round rules live here, namely
+deal keywords, the minimum-round block, walk-aways, accepts and the round/time
+limits. Flask, the CLI prompts, streaming and batch runs only do I/O around it.
+"""
+import re
+import time
+import uuid
+
+from negotiation_engine.trace import NULL_TRACER
+
+DEAL_KEYWORDS = ["finalize", "agreed", "let's proceed", "deal", "confirmed", "move forward"]
+# The one price pattern for chat text; 4-7 digits covers ₹1000 up to ₹99,99,999 per quintal
+PRICE_PATTERN = re.compile(r"₹(\d{4,7})\s*per\s*quintal", re.IGNORECASE)
+SELLER_PREFIX = "📣 "
+BUYER_PREFIX = "🛒 "
+
+
+def find_price(text: str):
+    """The first "₹N per quintal" price in `text`, ignoring commas and markdown bold; None if there is none."""
+    if not text:
+        return None
+    match = PRICE_PATTERN.search(text.replace(",", "").replace("**", "").replace("—", ""))
+    return int(match.group(1)) if match else None
+
+
+def build_context(product: dict) -> dict:
+    """Negotiation context for a products.json record; a copy, so concurrent negotiations don't share state."""
+    context = dict(product)
+    context["Order Size (kg)"] = context.get("quantity", 100)
+    context["Product Type"] = context.get("category", context["name"])
+    context["Origin"] = context.get("origin", "")
+    context["Base Market Price"] = context.get("base_market_price", 0)
+    context["Attributes"] = context.get("attributes", {})
+    context["Quality Grade"] = context.get("quality_grade", "")
+    return context
+
+
+class NegotiationSession:
+    def __init__(self, context: dict, buyer, seller, max_rounds: int = 15, min_rounds: int = 4,
+                 max_seconds: float = None, tracer=NULL_TRACER, opening_cache=None, session_id: str = None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.context = context
+        self.product = context.get("name", context.get("Product"))
+        self.buyer = buyer
+        self.seller = seller
+        self.max_rounds = max_rounds
+        self.min_rounds = min_rounds
+        self.max_seconds = max_seconds
+        self.opening_cache = opening_cache  # (product, persona) -> precomputed (reply, mode) or None
+        self.set_tracer(tracer)
+
+        self.messages = []
+        self.round_num = 1
+        self.next_speaker = "seller"
+        self.status = "open"      # open | deal | walkaway | fallback
+        self.end_reason = None    # deal | walkaway | max_rounds | timeout
+        self.opening_price = None
+        self.final_price = None
+        self.buyer_offer = None
+        self.degraded_rounds = 0
+        self.revision = 0          # bumped by SessionStore.save; stale copies can't be saved over newer ones
+        self.created_at = time.time()
+
+    def set_tracer(self, tracer):
+        self.tracer = self.buyer.tracer = self.seller.tracer = tracer
+
+    # ---------------------------
+    # TURNS
+    # ---------------------------
+    def start(self, opening_message: str = None) -> list:
+        """Record the buyer's opening inquiry; without one the seller opens unprompted."""
+        if opening_message:
+            self.messages.append({"sender": "Buyer", "text": opening_message})
+        return list(self.messages)
+
+    @property
+    def is_open(self) -> bool:
+        return self.status == "open"
+
+    def step(self, text: str = None, mode: str = None, rendered: str = None) -> list:
+        """Play the next turn and return the messages it added.
+
+        `text` is a human's message for the side whose turn it is; without it the
+        agent answers. `rendered` is the seller agent's reply for a turn it planned
+        with plan_turn() but was worded outside the session (e.g. a basket's batched
+        LLM call). It is recorded with `mode` and closed by the same accept rule as
+        the agent's own replies.
+        """
+        if not self.is_open:
+            raise ValueError(f"Negotiation already ended ({self.status}).")
+        start = len(self.messages)
+        if self.next_speaker == "seller":
+            self._seller_turn(text, mode, rendered)
+        else:
+            self._buyer_turn(text)
+        return self.messages[start:]
+
+    def turns(self):
+        """Yield each new message while agents play both sides to the end."""
+        yield from self.messages
+        while self.is_open:
+            yield from self.step()
+
+    def last_text(self, sender: str) -> str:
+        return next((m["text"] for m in reversed(self.messages) if m["sender"] == sender), "")
+
+    def _seller_turn(self, text, mode, rendered=None):
+        buyer_text = self.last_text("Buyer").removeprefix(BUYER_PREFIX) or "What’s your offer?"
+        started = time.time()
+        message = {"sender": "Seller"}
+        if text is not None:
+            reply = text
+        elif rendered is not None:
+            reply = rendered
+            message["mode"] = mode or self.seller.last_reply_mode
+        else:
+            cached = self.opening_cache(self.product, self.seller.persona) if (
+                self.opening_cache and self.round_num == 1) else None
+            reply = self.seller.replay(*cached) if cached else self.seller.respond(buyer_text, self.context)
+            message["mode"] = self.seller.last_reply_mode
+            message["promptTokens"] = self.seller.last_prompt_tokens
+        message["text"] = f"{SELLER_PREFIX}{reply}"
+        self.messages.append(message)
+        if message.get("mode") == "degraded":
+            self.degraded_rounds += 1
+        self.tracer.emit("seller_reply", round=self.round_num, mode=message.get("mode", "human"),
+                         ms=round((time.time() - started) * 1000, 1))
+
+        if self.opening_price is None:
+            self.opening_price = find_price(reply)
+        self.next_speaker = "buyer"
+
+        if text is not None and text.strip().lower() == "accept" and self.buyer_offer:
+            self._close_deal(self.buyer_offer)
+        elif text is not None and "walk away" in text.lower():
+            self._end("walkaway", "🚪 Seller walked away — negotiation ended.")
+        elif text is None and self.seller.accepted and self.buyer_offer and self.round_num >= self.min_rounds:
+            # Agent replies, rendered ones included, close at the accepted offer. `accepted` describes
+            # this turn only, so an accept blocked by min_rounds doesn't carry over
+            self._close_deal(self.buyer_offer)
+
+    def _buyer_turn(self, text):
+        seller_text = self.last_text("Seller").removeprefix(SELLER_PREFIX)
+        if text is not None:
+            reply = text
+            self.buyer_offer = find_price(text) or self.buyer_offer
+        else:
+            reply = self.buyer.respond(seller_text, self.context)
+            if self.buyer.buyer_offer_history:
+                self.buyer_offer = self.buyer.buyer_offer_history[-1]
+        if self.buyer_offer:
+            self.context["Buyer Offer"] = self.buyer_offer
+        self.messages.append({"sender": "Buyer", "text": f"{BUYER_PREFIX}{reply}"})
+        self.tracer.emit("buyer_reply", round=self.round_num, offer=self.buyer_offer,
+                         converged=self.buyer.converged, walkAway=self.buyer.walk_away_triggered)
+        self.next_speaker = "seller"
+
+        if self.buyer.walk_away_triggered or "walk away" in reply.lower():
+            self._end("walkaway", "🚪 Buyer walked away — negotiation ended.")
+            return
+        if text is not None and text.strip().lower() == "accept":
+            self._close_deal(find_price(seller_text))
+            return
+        if any(kw in reply.lower() for kw in DEAL_KEYWORDS) or any(kw in seller_text.lower() for kw in DEAL_KEYWORDS):
+            if self.round_num < self.min_rounds:
+                self.messages.append({"sender": "System",
+                                      "text": f"⛔ Deal attempt blocked — minimum {self.min_rounds} rounds required."})
+                self.tracer.emit("deal_blocked", round=self.round_num)
+            else:
+                self._close_deal(self.last_price())
+                return
+        self._next_round()
+
+    def _next_round(self):
+        self.round_num += 1
+        if self.round_num > self.max_rounds:
+            self.round_num = self.max_rounds
+            self._fallback("max_rounds")
+        elif self.max_seconds is not None and time.time() - self.created_at >= self.max_seconds:
+            self._fallback("timeout")
+
+    # ---------------------------
+    # OUTCOMES
+    # ---------------------------
+    def last_price(self):
+        """Most recent price quoted by either side."""
+        for msg in reversed(self.messages):
+            if msg["sender"] in ("Buyer", "Seller"):
+                price = find_price(msg["text"])
+                if price:
+                    return price
+        return None
+
+    def stop(self, reason: str = "timeout") -> list:
+        """End an open negotiation from outside (e.g. a shared deadline) and return the added messages."""
+        start = len(self.messages)
+        if self.is_open:
+            self._fallback(reason)
+        return self.messages[start:]
+
+    def _close_deal(self, price):
+        self.final_price = price
+        self.buyer.settled(price)
+        self._end("deal", "🤝 Deal reached — negotiation ended.")
+
+    def _fallback(self, reason: str):
+        self.final_price = self.last_price()
+        self._end(reason, "⏳ Fallback triggered — negotiation ended.")
+
+    def _end(self, reason: str, text: str):
+        self.status = "fallback" if reason in ("max_rounds", "timeout") else reason
+        self.end_reason = reason
+        self.messages.append({"sender": "System", "text": text})
+        if self.status != "walkaway":
+            self.buyer.log_regret(self.final_price, float(self.context.get("Base Market Price") or 0))
+        self.tracer.emit("end", reason=reason, rounds=self.round_num, finalPrice=self.final_price)
+
+    def summary(self) -> dict:
+        market = self.context.get("Base Market Price") or 0
+        summary = {
+            "openingPrice": self.opening_price,
+            "finalPrice": self.final_price,
+            "marketPrice": market,
+            "buyerPersona": self.buyer.personality["personality_type"],
+            "sellerPersona": self.seller.persona,
+            "totalRounds": self.round_num,
+            "walkedAway": self.status == "walkaway",
+            "endReason": self.end_reason,
+            "degradedRounds": self.degraded_rounds,
+            "promptTokens": self.seller.prompt_tokens_total
+        }
+        if self.status == "walkaway":
+            summary.update({"finalPrice": None, "margin": None, "marginType": "Walkaway", "regret": False})
+            return summary
+
+        margin = market - self.final_price if self.final_price else 0
+        seller_margin = self.final_price - market * 0.9 if self.final_price else 0  # Assuming 90% as seller's base
+        summary.update({
+            "margin": abs(round(margin, 2)),
+            "marginType": "Profit" if margin > 0 else "Loss",
+            "buyerProfitPercent": round(margin / market * 100, 2) if market else 0,
+            "sellerProfitPercent": round(seller_margin / market * 100, 2) if market else 0,
+            "regret": self.buyer.regret_flag
+        })
+        return summary
@@ -0,0 +1,310 @@
+"""Compact, versioned serialization of NegotiationSession state plus an LRU session store.
+
+Agents are flattened into positional arrays (field order is the schema), boolean
+flags are packed into one int and the transcript uses one-letter sender codes.
+The result is JSON-encoded and zlib-compressed, so an idle session costs a few
+hundred bytes and can be resumed by any worker that can read the blob. The
+product context is not stored; it is rebuilt from the product name on load.
+"""
+import json
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:   # Windows: saves are still serialized within one worker
+    fcntl = None
+
+from agents.buyer_agent import BuyerAgent
+from agents.seller_agent import SellerAgent
+from negotiation_engine.session import NegotiationSession
+
+STATE_VERSION = 4
+REVISION_INDEX = 14   # position of the session's revision in the state array
+LOCK_STRIPES = 64
+
+BUYER_FLAGS = ("walk_away_triggered", "regret_flag", "suspect_inflation", "softening_detected", "converged",
+               "adaptive", "midpoint_offered")
+INTENT_CODES = {"acceptance": "a", "counter_offer": "c", "inquiry": "i"}
+INTENT_NAMES = {code: name for name, code in INTENT_CODES.items()}
+SENDER_CODES = {"Buyer": "B", "Seller": "S", "System": "Y"}
+SENDER_NAMES = {code: name for name, code in SENDER_CODES.items()}
+
+
+def _pack_flags(obj, names) -> int:
+    return sum(1 << i for i, name in enumerate(names) if getattr(obj, name))
+
+
+def _unpack_flags(obj, names, bits: int):
+    for i, name in enumerate(names):
+        setattr(obj, name, bool(bits & (1 << i)))
+
+
+def dump_buyer(buyer: BuyerAgent) -> list:
+    return [
+        buyer.personality["personality_type"],
+        buyer.max_rounds,
+        buyer.round_num,
+        buyer.target_price,
+        buyer.last_offer_from_seller,
+        buyer.counter_attempts,
+        buyer.market_price,
+        buyer.llm_calls_saved,
+        _pack_flags(buyer, BUYER_FLAGS),
+        buyer.seller_offer_history,
+        buyer.buyer_offer_history,
+        "".join(INTENT_CODES.get(intent, "i") for _, intent in buyer.intent_log),
+        buyer.negotiation_outcome,
+    ]
+
+
+def load_buyer(state: list) -> BuyerAgent:
+    (persona, max_rounds, round_num, target_price, last_offer, counter_attempts, market_price,
+     calls_saved, flags, seller_history, buyer_history, intents, outcome) = state
+    buyer = BuyerAgent(persona=persona, max_rounds=max_rounds)
+    buyer.round_num = round_num
+    buyer.target_price = target_price
+    buyer.last_offer_from_seller = last_offer
+    buyer.counter_attempts = counter_attempts
+    buyer.market_price = market_price
+    buyer.llm_calls_saved = calls_saved
+    _unpack_flags(buyer, BUYER_FLAGS, flags)
+    buyer.seller_offer_history = list(seller_history)
+    buyer.buyer_offer_history = list(buyer_history)
+    # Buyer rounds are sequential, so the round number is implied by position
+    buyer.intent_log = [(i + 1, INTENT_NAMES[code]) for i, code in enumerate(intents)]
+    buyer.negotiation_outcome = dict(outcome)
+    return buyer
+
+
+def dump_seller(seller: SellerAgent) -> list:
+    return [seller.persona, seller.min_margin, seller.max_rounds, seller.current_round,
+            int(seller.accepted), seller.last_reply_mode, int(seller.rule_only), seller.prompt_tokens_total,
+            seller.last_buyer_offer, seller.stalled_rounds, int(seller.conceding)]
+
+
+def load_seller(state: list) -> SellerAgent:
+    (persona, min_margin, max_rounds, current_round, accepted, mode, rule_only, prompt_tokens,
+     last_buyer_offer, stalled_rounds, conceding) = state
+    seller = SellerAgent(persona=persona, min_margin=min_margin, max_rounds=max_rounds, rule_only=bool(rule_only))
+    seller.current_round = current_round
+    seller.accepted = bool(accepted)
+    seller.last_reply_mode = mode
+    seller.prompt_tokens_total = prompt_tokens
+    seller.last_buyer_offer = last_buyer_offer
+    seller.stalled_rounds = stalled_rounds
+    seller.conceding = bool(conceding)
+    return seller
+
+
+def dump_messages(messages: list) -> list:
+    return [[SENDER_CODES.get(m["sender"], m["sender"]), m["text"]] + ([m["mode"]] if "mode" in m else [])
+            for m in messages]
+
+
+def load_messages(rows: list) -> list:
+    messages = []
+    for row in rows:
+        msg = {"sender": SENDER_NAMES.get(row[0], row[0]), "text": row[1]}
+        if len(row) > 2:
+            msg["mode"] = row[2]
+        messages.append(msg)
+    return messages
+
+
+def session_to_bytes(session: NegotiationSession) -> bytes:
+    state = [
+        STATE_VERSION, session.session_id, session.product, round(session.created_at, 3), session.status,
+        session.end_reason, session.round_num, session.next_speaker[0], session.max_rounds, session.min_rounds,
+        session.opening_price, session.final_price, session.buyer_offer, session.degraded_rounds, session.revision,
+        dump_buyer(session.buyer), dump_seller(session.seller), dump_messages(session.messages)
+    ]
+    return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def session_from_bytes(blob: bytes, context_factory) -> NegotiationSession:
+    """Restore a paused session; `context_factory(product_name)` rebuilds its product context."""
+    state = json.loads(zlib.decompress(blob).decode("utf-8"))
+    if state[0] != STATE_VERSION:
+        raise ValueError(f"Unsupported session state version {state[0]} (expected {STATE_VERSION}).")
+    (_, session_id, product, created_at, status, end_reason, round_num, next_speaker, max_rounds, min_rounds,
+     opening_price, final_price, buyer_offer, degraded_rounds, revision, buyer_state, seller_state, messages) = state
+    context = context_factory(product)
+    if buyer_offer:
+        context["Buyer Offer"] = buyer_offer
+    session = NegotiationSession(context, load_buyer(buyer_state), load_seller(seller_state),
+                                 max_rounds=max_rounds, min_rounds=min_rounds, session_id=session_id)
+    session.created_at = created_at
+    session.status = status
+    session.end_reason = end_reason
+    session.round_num = round_num
+    session.next_speaker = "seller" if next_speaker == "s" else "buyer"
+    session.opening_price = opening_price
+    session.final_price = final_price
+    session.buyer_offer = buyer_offer
+    session.degraded_rounds = degraded_rounds
+    session.revision = revision
+    session.messages = load_messages(messages)
+    return session
+
+
+def _revision(blob: bytes) -> int:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))[REVISION_INDEX]
+
+
+class StaleSession(Exception):
+    """The session was saved by another request since this copy was loaded."""
+
+
+class SessionExpired(Exception):
+    """The session existed but was evicted or deleted."""
+
+
+class SessionStore:
+    """Serialized sessions, either in an in-memory LRU or in `spill_dir`.
+
+    With `spill_dir`, every save writes the session's file and every load reads
+    it, so the file is the one copy. Several workers pointed at the same
+    directory can then pause a session on one worker and resume it on another.
+    Without it, sessions live in this worker only, and the least recently used
+    ones are dropped beyond `max_sessions`. Loading a recently dropped session
+    raises SessionExpired.
+
+    Each save bumps session.revision. A save from a copy older than the stored
+    one raises StaleSession, so two concurrent steps can't overwrite each
+    other's rounds. Saves of one session are serialized by a lock, which is
+    also a file lock shared with other workers where fcntl is available.
+    """
+
+    def __init__(self, context_factory, max_sessions: int = 10000, spill_dir: str = None):
+        self.context_factory = context_factory
+        self.max_sessions = max_sessions
+        self.spill_dir = spill_dir
+        self._sessions = OrderedDict()   # session id -> blob, without spill_dir
+        self._evicted = OrderedDict()    # recently dropped session ids, to tell expired from unknown
+        self._lock = threading.Lock()
+        self._session_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{session_id}.bin")
+
+    def _session_lock(self, session_id: str):
+        return self._session_locks[hash(session_id) % LOCK_STRIPES]
+
+    def _read(self, session_id: str):
+        if self.spill_dir:
+            try:
+                with open(self._spill_path(session_id), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        with self._lock:
+            blob = self._sessions.get(session_id)
+            if blob is not None:
+                self._sessions.move_to_end(session_id)
+            return blob
+
+    def _write(self, session_id: str, blob: bytes):
+        if self.spill_dir:
+            with tempfile.NamedTemporaryFile(dir=self.spill_dir, prefix=f"{session_id}.", suffix=".tmp",
+                                             delete=False) as f:
+                f.write(blob)
+            os.replace(f.name, self._spill_path(session_id))
+            return
+        with self._lock:
+            self._sessions[session_id] = blob
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                self._evicted[evicted] = True
+            while len(self._evicted) > self.max_sessions:
+                self._evicted.popitem(last=False)
+
+    def save(self, session: NegotiationSession):
+        with self._session_lock(session.session_id), self._file_lock(session.session_id):
+            stored = self._read(session.session_id)
+            if stored is None and session.revision:
+                raise SessionExpired(session.session_id)
+            if stored is not None and _revision(stored) != session.revision:
+                raise StaleSession(session.session_id)
+            session.revision += 1
+            try:
+                self._write(session.session_id, session_to_bytes(session))
+            except Exception:
+                session.revision -= 1
+                raise
+
+    def load(self, session_id: str):
+        """The stored session, or None if it was never stored here; raises SessionExpired if it was dropped."""
+        blob = self._read(session_id)
+        if blob is None:
+            with self._lock:
+                if session_id in self._evicted:
+                    raise SessionExpired(session_id)
+            return None
+        return session_from_bytes(blob, self.context_factory)
+
+    def delete(self, session_id: str):
+        with self._session_lock(session_id), self._file_lock(session_id):
+            with self._lock:
+                self._sessions.pop(session_id, None)
+                self._evicted.pop(session_id, None)
+            if self.spill_dir and os.path.exists(self._spill_path(session_id)):
+                os.remove(self._spill_path(session_id))
+        if self.spill_dir and fcntl is not None:
+            try:
+                os.remove(self._spill_path(session_id) + ".lock")
+            except FileNotFoundError:
+                pass
+
+    def _file_lock(self, session_id: str):
+        if not self.spill_dir or fcntl is None:
+            return _NO_LOCK
+        return _FileLock(self._spill_path(session_id) + ".lock")
+
+    def stats(self) -> dict:
+        if self.spill_dir:
+            sizes = [entry.stat().st_size for entry in os.scandir(self.spill_dir) if entry.name.endswith(".bin")]
+        else:
+            with self._lock:
+                sizes = [len(blob) for blob in self._sessions.values()]
+        return {
+            "sessions": len(sizes),
+            "maxSessions": None if self.spill_dir else self.max_sessions,
+            "bytes": sum(sizes),
+            "avgBytes": round(sum(sizes) / len(sizes), 1) if sizes else 0
+        }
+
+
+class _FileLock:
+    """An exclusive flock on `path`, shared by every worker using the same spill directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_LOCK = _NoLock()
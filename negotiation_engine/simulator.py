@@ -0,0 +1,329 @@
+"""Vectorized simulator for the rule-based buyer/seller price dynamics.
+
+Each row of the parameter arrays is one negotiation trajectory. The round loop
+mirrors BuyerAgent.respond and SellerAgent.respond with the LLM taken out: the
+seller is assumed to quote exactly the price its decision logic computes
+(optionally perturbed by `price_noise` to mimic the LLM drifting from it).
+The buyer's convergence midpoint and the seller's stalemate concession are
+included. Buyer persona switching on seller tone and the session's minimum-round
+block are not modelled.
+
+Run a sample sweep with `python -m negotiation_engine.simulator`. `--check`
+plays every product x buyer persona x seller persona with the rule-only agents
+and exits 1 when their deal rate falls below MIN_DEAL_RATE, which catches an
+agent change that leaves the two sides unable to agree. It also exits 1 when
+simulate() ends any product x persona negotiation differently from the agents,
+so the tuner keeps scoring the rules the agents actually follow.
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+
+from agents.buyer_agent import BuyerAgent
+from agents.seller_agent import SELLER_PERSONAS
+from negotiation_engine.persona_params import BUYER_DEFAULTS, SELLER_DEFAULTS
+
+# The agents' built-in thresholds (see persona_params.py); margin and tolerance come from the persona columns
+PERSONA_COLUMNS = ("margin_pct", "convergence_tolerance")
+DEFAULT_PARAMS = {key: value for key, value in {**BUYER_DEFAULTS, **SELLER_DEFAULTS}.items()
+                  if key not in PERSONA_COLUMNS}
+
+PERSONAS = ["Assertive", "Strategic", "Balanced", "Diplomatic"]
+MIN_DEAL_RATE = 0.5
+CONVERGENCE_WINDOW = 3   # BuyerAgent.detect_convergence's window
+
+
+def persona_margin_pct(persona: str) -> float:
+    return BuyerAgent(persona=persona).get_margin_pct_for_persona()
+
+
+def persona_tolerance(persona: str) -> float:
+    return BuyerAgent(persona=persona).get_convergence_tolerance()
+
+
+def build_grid(products: list, personas: list = None, repeats: int = 1, **sweeps) -> dict:
+    """Cartesian product of products x personas x swept parameters, as column arrays.
+
+    `sweeps` maps a DEFAULT_PARAMS key to a list of values to try, e.g.
+    build_grid(products, discount=[0.85, 0.87, 0.90]).
+    """
+    personas = personas or PERSONAS
+    sweep_keys = list(sweeps.keys())
+    sweep_values = [np.asarray(sweeps[k], dtype=float) for k in sweep_keys]
+
+    product_idx = np.arange(len(products))
+    persona_idx = np.arange(len(personas))
+    axes = [product_idx, persona_idx] + [np.arange(len(v)) for v in sweep_values] + [np.arange(repeats)]
+    mesh = [m.ravel() for m in np.meshgrid(*axes, indexing="ij")]
+
+    base = np.array([p["base_market_price"] for p in products], dtype=float)
+    grade_a = np.array([p.get("quality_grade") == "A" for p in products])
+    export = np.array([bool(p.get("attributes", {}).get("export_grade")) for p in products])
+    margins = np.array([persona_margin_pct(p) for p in personas], dtype=float)
+    tolerances = np.array([persona_tolerance(p) for p in personas], dtype=float)
+
+    grid = {
+        "product": mesh[0],
+        "persona": mesh[1],
+        "base_price": base[mesh[0]],
+        "grade_a": grade_a[mesh[0]],
+        "export_grade": export[mesh[0]],
+        "buyer_margin_pct": margins[mesh[1]],
+        "convergence_tolerance": tolerances[mesh[1]],
+    }
+    n = len(mesh[0])
+    for key, default in DEFAULT_PARAMS.items():
+        grid[key] = np.full(n, default, dtype=float)
+    for i, key in enumerate(sweep_keys):
+        grid[key] = sweep_values[i][mesh[2 + i]]
+    return grid
+
+
+def simulate(params: dict, max_rounds: int = 15, price_noise: float = 0.0, seed: int = None) -> dict:
+    """Run every row of `params` to completion and return per-row outcome arrays."""
+    rng = np.random.default_rng(seed)
+    base = params["base_price"]
+    n = len(base)
+
+    seller_margin = params["min_margin"] + 0.05 * params["grade_a"] + 0.05 * params["export_grade"]
+    # An explicit per-row buyer target (e.g. a marketplace buyer's own budget) overrides the persona one
+    target = params["target"] if "target" in params else np.floor(base * (1 - params["buyer_margin_pct"] * 0.05))
+
+    tolerance = params["convergence_tolerance"] if "convergence_tolerance" in params else np.full(
+        n, BUYER_DEFAULTS["convergence_tolerance"])
+
+    seller_price = np.round(base * (1 + seller_margin))   # opening quote, as the seller renders it
+    prev_price = np.full(n, np.nan)
+    counters = np.zeros(n)
+    softening = np.zeros(n, dtype=bool)
+    # Last CONVERGENCE_WINDOW seller quotes and buyer offers, for BuyerAgent.detect_convergence
+    seller_hist = np.full((n, CONVERGENCE_WINDOW), np.nan)
+    buyer_hist = np.full((n, CONVERGENCE_WINDOW), np.nan)
+    # SellerAgent.track_stalemate
+    last_offer = np.full(n, np.nan)
+    stalled = np.zeros(n)
+    conceding = np.zeros(n, dtype=bool)
+    converged = np.zeros(n, dtype=bool)
+
+    active = np.ones(n, dtype=bool)
+    deal = np.zeros(n, dtype=bool)
+    buyer_walked = np.zeros(n, dtype=bool)
+    seller_walked = np.zeros(n, dtype=bool)
+    final_price = np.full(n, np.nan)
+    opening_price = seller_price.copy()
+    rounds = np.full(n, max_rounds)
+
+    for rnd in range(1, max_rounds + 1):
+        if not active.any():
+            break
+        if price_noise:
+            seller_price = np.where(active, np.floor(seller_price * (1 + rng.normal(0, price_noise, n))), seller_price)
+
+        # Buyer detection flags are sticky, as in BuyerAgent
+        has_prev = ~np.isnan(prev_price)
+        softening |= active & has_prev & (seller_price <= prev_price * 0.97)
+        prev_price = np.where(active, seller_price, prev_price)
+        seller_hist = np.where(active[:, None], np.column_stack([seller_hist[:, 1:], seller_price]), seller_hist)
+
+        # Buyer accepts
+        accept = active & (seller_price <= target) & (rnd >= 2)
+        deal |= accept
+        final_price = np.where(accept, seller_price, final_price)
+        rounds = np.where(accept, rnd, rounds)
+        active &= ~accept
+
+        # Buyer walks away
+        walk = active & (counters >= params["max_counters"]) & (seller_price > target)
+        buyer_walked |= walk
+        rounds = np.where(walk, rnd, rounds)
+        active &= ~walk
+
+        # Gap within tolerance for the whole window: the buyer proposes the midpoint if it lies between the
+        # seller's acceptance floor and market, and walks otherwise
+        with np.errstate(invalid="ignore"):
+            close = np.abs(seller_hist - buyer_hist) / seller_hist <= tolerance[:, None]
+        converge = active & close.all(axis=1)
+        midpoint = np.floor((seller_price + buyer_hist[:, -1]) / 2)
+        walk = converge & ((midpoint > base) | (midpoint < base * params["accept_ratio"]))
+        converged |= walk
+        buyer_walked |= walk
+        rounds = np.where(walk, rnd, rounds)
+        active &= ~walk
+
+        # Buyer counters
+        factor = np.where(softening, params["soft_discount"], params["discount"])
+        buyer_offer = np.maximum(np.floor(seller_price * factor), np.floor(target * params["floor_ratio"]))
+        buyer_offer = np.where(converge, midpoint, buyer_offer)
+        counters += active
+        buyer_hist = np.where(active[:, None], np.column_stack([buyer_hist[:, 1:], buyer_offer]), buyer_hist)
+
+        # The seller concedes once the buyer's offer has stopped moving
+        with np.errstate(invalid="ignore"):
+            barely_moved = np.abs(buyer_offer - last_offer) / last_offer < params["stalemate_move"]
+        has_last = ~np.isnan(last_offer)
+        stalled = np.where(active & has_last, np.where(barely_moved, stalled + 1, 0), stalled)
+        conceding |= active & (params["stalemate_rounds"] > 0) & (stalled >= params["stalemate_rounds"])
+        last_offer = np.where(active, buyer_offer, last_offer)
+
+        # Seller decision
+        seller_accept = active & (buyer_offer >= base * params["accept_ratio"])
+        deal |= seller_accept
+        converged |= seller_accept & converge   # the seller took the midpoint
+        final_price = np.where(seller_accept, buyer_offer, final_price)
+        rounds = np.where(seller_accept, rnd, rounds)
+        active &= ~seller_accept
+
+        seller_round = rnd + 1  # the seller's opening quote used its first round
+        seller_walk = active & (seller_round > params["seller_walk_round"]) & (buyer_offer < base * params["seller_walk_ratio"])
+        seller_walked |= seller_walk
+        rounds = np.where(seller_walk, rnd, rounds)
+        active &= ~seller_walk
+
+        early = (seller_round <= params["inflation_switch_round"]) & ~conceding
+        rate = np.where(early, params["early_inflation"], params["late_inflation"])
+        seller_price = np.where(active, np.floor(buyer_offer * (1 + rate)), seller_price)
+
+    buyer_walked |= active  # ran out of rounds
+    return {
+        "deal": deal,
+        "rounds": rounds,
+        "final_price": final_price,
+        "opening_price": opening_price,
+        "buyer_walked": buyer_walked,
+        "seller_walked": seller_walked,
+        "converged": converged,
+    }
+
+
+def summarize(params: dict, results: dict, group_by: str = None) -> list:
+    """Deal rate, rounds and final price distribution, overall or per value of a params column."""
+    if group_by is None:
+        groups = [("all", np.ones(len(results["deal"]), dtype=bool))]
+    else:
+        keys = np.unique(params[group_by])
+        groups = [(k.item(), params[group_by] == k) for k in keys]
+
+    rows = []
+    for key, mask in groups:
+        deals = results["deal"][mask]
+        finals = results["final_price"][mask][deals]
+        ratio = finals / params["base_price"][mask][deals]
+        row = {
+            "group": key,
+            "n": int(mask.sum()),
+            "dealRate": round(float(deals.mean()), 4) if mask.any() else 0.0,
+            "meanRounds": round(float(results["rounds"][mask].mean()), 2) if mask.any() else None,
+            "roundsP50": float(np.percentile(results["rounds"][mask], 50)) if mask.any() else None,
+            "sellerWalkRate": round(float(results["seller_walked"][mask].mean()), 4) if mask.any() else 0.0,
+        }
+        if finals.size:
+            p10, p50, p90 = np.percentile(ratio, [10, 50, 90])
+            row.update({
+                "finalToMarketP10": round(float(p10), 4),
+                "finalToMarketP50": round(float(p50), 4),
+                "finalToMarketP90": round(float(p90), 4),
+            })
+        rows.append(row)
+    return rows
+
+
+def play_agents(product: dict, persona: str, seller_persona: str = "Analytical", params=None):
+    """One rule-only BuyerAgent/SellerAgent session, played to the end; `params` is a PersonaParams."""
+    from agents.seller_agent import SellerAgent
+    from negotiation_engine.session import NegotiationSession, build_context
+
+    context = build_context(product)
+    session = NegotiationSession(context, BuyerAgent(persona=persona, adaptive=False, params=params),
+                                 SellerAgent(persona=seller_persona, rule_only=True, params=params))
+    session.start(f"What’s your offer for {context['Order Size (kg)']}kg of {context['name']}?")
+    for _ in session.turns():
+        pass
+    return session
+
+
+def agent_outcomes(products: list, personas: list = None, seller_personas: list = None, params=None) -> dict:
+    """Deal rate, rounds, prices and margins of the rule-only agents over every product x persona pair.
+
+    Margins are per negotiation, so a walk-away counts as 0: (market - price) / market for the
+    buyer and the reverse for the seller.
+    """
+    rounds, deal_rounds, ratios = [], [], []
+    pairs = list(itertools.product(products, personas or PERSONAS, seller_personas or SELLER_PERSONAS))
+    for product, persona, seller_persona in pairs:
+        session = play_agents(product, persona, seller_persona, params)
+        rounds.append(session.round_num)
+        if session.status == "deal" and session.final_price:
+            deal_rounds.append(session.round_num)
+            ratios.append(session.final_price / session.context["Base Market Price"])
+    return {
+        "n": len(pairs),
+        "dealRate": round(len(ratios) / len(pairs), 4) if pairs else 0.0,
+        "meanRounds": round(sum(rounds) / len(rounds), 2) if rounds else None,
+        "roundsPerDeal": round(sum(deal_rounds) / len(deal_rounds), 2) if deal_rounds else None,
+        "finalToMarketP50": round(float(np.median(ratios)), 4) if ratios else None,
+        "buyerMargin": round(sum(1 - r for r in ratios) / len(pairs), 5) if pairs else 0.0,
+        "sellerMargin": round(sum(r - 1 for r in ratios) / len(pairs), 5) if pairs else 0.0,
+    }
+
+
+def parity(products: list, personas: list = None) -> list:
+    """Product x persona pairs where simulate() and the rule-only agents end differently."""
+    personas = personas or PERSONAS
+    grid = build_grid(products, personas)
+    results = simulate(grid)
+    mismatches = []
+    for i in range(len(grid["base_price"])):
+        product, persona = products[grid["product"][i]], personas[grid["persona"][i]]
+        session = play_agents(product, persona)
+        agents = (session.status == "deal", session.round_num, session.final_price if session.status == "deal" else None)
+        sim = (bool(results["deal"][i]), int(results["rounds"][i]),
+               int(results["final_price"][i]) if results["deal"][i] else None)
+        if agents != sim:
+            mismatches.append({"product": product["name"], "persona": persona, "agents": agents, "simulated": sim})
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the rule-based price dynamics, or check the agents' deal rate")
+    parser.add_argument("--check", action="store_true", help="Fail when the rule-only agents rarely reach a deal")
+    parser.add_argument("--min-deal-rate", type=float, default=MIN_DEAL_RATE)
+    args = parser.parse_args()
+
+    with open("products.json", "r") as f:
+        products = json.load(f)
+
+    if args.check:
+        agents = agent_outcomes(products)
+        print(f"🤝 rule-only agents: {agents}")
+        mismatches = parity(products)
+        for mismatch in mismatches:
+            print(f"⚠️  simulator differs from the agents: {mismatch}")
+        if agents["dealRate"] < args.min_deal_rate:
+            print(f"❌ deal rate {agents['dealRate']:.2%} is below {args.min_deal_rate:.0%}")
+            sys.exit(1)
+        if mismatches:
+            print(f"❌ simulate() disagrees with the agents on {len(mismatches)} negotiations")
+            sys.exit(1)
+        print(f"✅ deal rate at or above {args.min_deal_rate:.0%}; simulate() matches the agents")
+        return
+
+    grid = build_grid(
+        products,
+        repeats=500,
+        discount=np.linspace(0.80, 0.95, 16),
+        accept_ratio=np.linspace(1.00, 1.15, 16),
+    )
+    start = time.time()
+    results = simulate(grid, price_noise=0.02, seed=7)
+    elapsed = time.time() - start
+    print(f"⚡ Simulated {len(grid['base_price']):,} negotiations in {elapsed:.2f}s")
+    for row in summarize(grid, results, group_by="discount"):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Per-negotiation event tracing.
+
+Agents and runners record structured events on a Tracer instead of printing.
+Events go into a bounded ring buffer (the oldest fall off) and, when sinks are
+configured, are handed to one background thread that writes them out, so the
+negotiation loop never blocks on stdout or disk. If that thread falls behind,
+events are dropped from the sink queue; they are still kept in the ring buffer.
+
+    NEGOTIATOR_TRACE_SINKS=stdout,jsonl:data/trace.jsonl python app.py
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+TRACE_CAPACITY = 256          # events kept per negotiation
+TRACE_RETAIN = int(os.environ.get("NEGOTIATOR_TRACE_RETAIN", 500))  # negotiations kept for /debug/trace
+SINK_QUEUE_SIZE = 10000
+
+
+# ---------------------------
+# SINKS
+# ---------------------------
+class StdoutSink:
+    """Human-readable lines; events with a `text` field print just the text.
+
+    With `text_only` the sink acts as a console: events without text are skipped.
+    """
+
+    def __init__(self, stream=None, prefix: bool = True, text_only: bool = False):
+        self.stream = stream or sys.stdout
+        self.prefix = prefix
+        self.text_only = text_only
+
+    def write(self, trace_id: str, event: dict):
+        text = event.get("text")
+        if text is None:
+            if self.text_only:
+                return
+            fields = " ".join(f"{k}={v}" for k, v in event.items() if k not in ("t", "event"))
+            text = f"{event['event']} {fields}".strip()
+        if self.prefix:
+            text = f"[{trace_id[:8]} +{event['t']:.2f}s] {text}"
+        self.stream.write(text + "\n")
+        self.stream.flush()
+
+
+class JsonlSink:
+    """One JSON object per event, appended to `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, trace_id: str, event: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"trace": trace_id, **event}, ensure_ascii=False, default=str) + "\n")
+
+
+def sinks_from_env(spec: str = None) -> list:
+    """'stdout,jsonl:path' -> sink objects."""
+    spec = os.environ.get("NEGOTIATOR_TRACE_SINKS", "") if spec is None else spec
+    sinks = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, arg = part.partition(":")
+        if kind == "stdout":
+            sinks.append(StdoutSink())
+        elif kind == "jsonl" and arg:
+            sinks.append(JsonlSink(arg))
+    return sinks
+
+
+class SinkDispatcher:
+    """Single background writer shared by all tracers."""
+
+    def __init__(self, maxsize: int = SINK_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-sinks", daemon=True)
+                    self._thread.start()
+
+    def submit(self, sinks: list, trace_id: str, event: dict):
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait((sinks, trace_id, event))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            sinks, trace_id, event = self.queue.get()
+            for sink in sinks:
+                try:
+                    sink.write(trace_id, event)
+                except Exception:
+                    pass  # a broken sink must never take the writer thread down
+            self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued event has been written."""
+        if self._thread is not None:
+            self.queue.join()
+
+
+dispatcher = SinkDispatcher()
+
+
+# ---------------------------
+# TRACERS
+# ---------------------------
+class Tracer:
+    def __init__(self, trace_id: str = None, capacity: int = TRACE_CAPACITY, sinks: list = None, **meta):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.meta = meta
+        self.sinks = list(sinks or [])
+        self.events = deque(maxlen=capacity)
+        self.started_at = time.time()
+        self.total = 0
+
+    def emit(self, event: str, **fields):
+        record = {"t": round(time.time() - self.started_at, 4), "event": event, **fields}
+        self.events.append(record)
+        self.total += 1
+        if self.sinks:
+            dispatcher.submit(self.sinks, self.trace_id, record)
+
+    def snapshot(self) -> dict:
+        events = list(self.events)
+        return {
+            "traceId": self.trace_id,
+            "meta": self.meta,
+            "startedAt": self.started_at,
+            "events": events,
+            "overwritten": self.total - len(events)
+        }
+
+
+class NullTracer:
+    """Default for agents used outside a traced negotiation."""
+    trace_id = None
+
+    def emit(self, event: str, **fields):
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
+class TraceRegistry:
+    """The most recent `retain` tracers, looked up by id for /debug/trace."""
+
+    def __init__(self, retain: int = TRACE_RETAIN, sinks: list = None):
+        self.retain = retain
+        self.sinks = sinks_from_env() if sinks is None else sinks
+        self._tracers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, trace_id: str = None, **meta) -> Tracer:
+        tracer = Tracer(trace_id, sinks=self.sinks, **meta)
+        with self._lock:
+            self._tracers[tracer.trace_id] = tracer
+            while len(self._tracers) > self.retain:
+                self._tracers.popitem(last=False)
+        return tracer
+
+    def get(self, trace_id: str):
+        with self._lock:
+            return self._tracers.get(trace_id)
+
+    def get_or_start(self, trace_id: str, **meta) -> Tracer:
+        return self.get(trace_id) or self.start(trace_id, **meta)
+
+    def stats(self) -> dict:
+        with self._lock:
+            retained = len(self._tracers)
+        return {"retained": retained, "sinkQueue": dispatcher.queue.qsize(), "sinkDropped": dispatcher.dropped}
+
+
+trace_registry = TraceRegistry()
@@ -0,0 +1,283 @@
+"""Offline tuner for the agents' negotiation thresholds.
+
+Candidates are scored with the vectorized simulator, i.e. against the rule-only
+seller and buyer, across every product. The score combines three things:
+
+    score = w_deal * deal rate - w_rounds * rounds per deal / max rounds + w_margin * margin per negotiation
+
+Margin is the tuned side's: (market - price) / market for buyers and the reverse
+for sellers. Buyer thresholds are tuned per persona against the current seller.
+Seller thresholds are tuned once against all buyer personas. `--side both` tunes
+the seller first, then the buyers against the tuned seller.
+
+The search is a coarse grid, then successive halving. The best grid points and
+random candidates are scored on a few repeats, the top 1/eta go on to eta times
+as many repeats, and this continues until one candidate is left. Candidates are
+scored in a process pool.
+
+The simulator leaves out parts of a real session, such as the minimum-round
+block. So the last few candidates are played again as rule-only
+NegotiationSessions (simulator.agent_outcomes) and rescored. The best of them is
+merged into the persona parameter file the agents load (see persona_params.py),
+but only if it beats the current parameters there and keeps the deal rate at or
+above simulator.MIN_DEAL_RATE. Otherwise the current parameters are kept.
+
+    python -m negotiation_engine.tuner --side both --workers 4
+    python -m negotiation_engine.tuner --side buyer --personas Assertive,Diplomatic --method halving --candidates 243
+"""
+import argparse
+import copy
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from negotiation_engine.persona_params import INT_PARAMS, PERSONA_PARAMS_FILE, PersonaParams, load_persona_params
+from negotiation_engine.simulator import MIN_DEAL_RATE, PERSONAS, agent_outcomes, simulate
+
+SEARCH_SPACE = {
+    "buyer": {
+        "margin_pct": (0.4, 1.2),
+        "discount": (0.80, 0.95),
+        "soft_discount": (0.78, 0.93),
+        "floor_ratio": (0.80, 0.98),
+        "max_counters": (3, 12),
+        "convergence_tolerance": (0.02, 0.08),
+    },
+    "seller": {
+        "min_margin": (0.05, 0.20),
+        "accept_ratio": (1.00, 1.15),
+        "early_inflation": (0.05, 0.20),
+        "late_inflation": (0.02, 0.10),
+        "inflation_switch_round": (4, 12),
+        "seller_walk_round": (8, 15),
+        "seller_walk_ratio": (1.00, 1.10),
+        "stalemate_rounds": (1, 6),
+        "stalemate_move": (0.0, 0.03),
+    },
+}
+DEFAULT_WEIGHTS = {"deal": 1.0, "rounds": 0.2, "margin": 2.0}
+MAX_ROUNDS = 15
+PRICE_NOISE = 0.02   # the LLM seller drifts a little from the computed price
+FINALISTS = 5        # candidates confirmed with the rule-only agents
+AGENT_SELLER_PERSONAS = ["Analytical"]   # seller persona only changes the rule-only reply wording
+
+
+# ---------------------------
+# SCORING (runs in the worker processes)
+# ---------------------------
+def evaluate(side: str, candidate: dict, baseline: dict, products: list, personas: list, repeats: int,
+             weights: dict, seed: int) -> dict:
+    """Simulate products x personas x repeats with `candidate` applied to `side`; return metrics and score.
+
+    `baseline` holds {"buyer": {persona: params}, "seller": params} for everything not being tuned.
+    """
+    rows = list(itertools.product(range(len(products)), range(len(personas)), range(repeats)))
+    product_idx = np.array([r[0] for r in rows])
+    persona_idx = np.array([r[1] for r in rows])
+    base = np.array([p["base_market_price"] for p in products], dtype=float)[product_idx]
+
+    buyer = [{**baseline["buyer"][p], **(candidate if side == "buyer" else {})} for p in personas]
+    seller = {**baseline["seller"], **(candidate if side == "seller" else {})}
+    params = {
+        "base_price": base,
+        "grade_a": np.array([p.get("quality_grade") == "A" for p in products])[product_idx],
+        "export_grade": np.array([bool(p.get("attributes", {}).get("export_grade")) for p in products])[product_idx],
+        "buyer_margin_pct": np.array([b["margin_pct"] for b in buyer], dtype=float)[persona_idx],
+    }
+    for key in ("discount", "soft_discount", "floor_ratio", "max_counters", "convergence_tolerance"):
+        params[key] = np.array([b[key] for b in buyer], dtype=float)[persona_idx]
+    for key, value in seller.items():
+        params[key] = np.full(len(rows), value, dtype=float)
+
+    results = simulate(params, max_rounds=MAX_ROUNDS, price_noise=PRICE_NOISE, seed=seed)
+    deals = results["deal"]
+    deal_rate = float(deals.mean())
+    rounds_per_deal = float(results["rounds"][deals].mean()) if deals.any() else float(MAX_ROUNDS)
+    gain = (base - results["final_price"]) / base if side == "buyer" else (results["final_price"] - base) / base
+    margin = float(np.where(deals, gain, 0.0).mean())   # per negotiation, so a walk-away counts as 0
+    return _metrics(deal_rate, rounds_per_deal, margin, weights)
+
+
+def _metrics(deal_rate: float, rounds_per_deal: float, margin: float, weights: dict) -> dict:
+    score = weights["deal"] * deal_rate - weights["rounds"] * rounds_per_deal / MAX_ROUNDS + weights["margin"] * margin
+    return {"score": round(score, 5), "dealRate": round(deal_rate, 4), "roundsPerDeal": round(rounds_per_deal, 2),
+            "margin": round(margin, 5)}
+
+
+def with_candidate(overrides: dict, side: str, candidate: dict, personas: list) -> dict:
+    """A copy of the parameter file `overrides` with `candidate` merged in for `side`."""
+    merged = copy.deepcopy(overrides)
+    if side == "seller":
+        merged["seller"]["default"] = {**merged["seller"].get("default", {}), **candidate}
+    else:
+        for persona in personas:
+            merged["buyer"][persona] = {**merged["buyer"].get(persona, {}), **candidate}
+    return merged
+
+
+def evaluate_agents(side: str, candidate: dict, overrides: dict, products: list, personas: list,
+                    weights: dict) -> dict:
+    """Score `candidate` like evaluate(), but by playing rule-only NegotiationSessions."""
+    params = PersonaParams(with_candidate(overrides, side, candidate, personas))
+    outcome = agent_outcomes(products, personas, AGENT_SELLER_PERSONAS, params=params)
+    margin = outcome["buyerMargin" if side == "buyer" else "sellerMargin"]
+    return _metrics(outcome["dealRate"], outcome["roundsPerDeal"] or float(MAX_ROUNDS), margin, weights)
+
+
+# ---------------------------
+# SEARCH
+# ---------------------------
+def _clean(candidate: dict) -> dict:
+    return {k: int(round(v)) if k in INT_PARAMS else round(float(v), 4) for k, v in candidate.items()}
+
+
+def grid_candidates(space: dict, points: int) -> list:
+    axes = [np.linspace(low, high, points) for low, high in space.values()]
+    return [_clean(dict(zip(space, values))) for values in itertools.product(*axes)]
+
+
+def random_candidates(space: dict, n: int, rng) -> list:
+    return [_clean({k: rng.uniform(low, high) for k, (low, high) in space.items()}) for _ in range(n)]
+
+
+class Tuner:
+    def __init__(self, products: list, weights: dict = None, workers: int = None, seed: int = 0):
+        self.products = products
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.evaluations = 0
+
+    def score_all(self, executor, side: str, candidates: list, baseline: dict, personas: list, repeats: int) -> list:
+        futures = [executor.submit(evaluate, side, candidate, baseline, self.products, personas, repeats,
+                                   self.weights, self.seed) for candidate in candidates]
+        self.evaluations += len(futures)
+        return [(future.result(), candidate) for future, candidate in zip(futures, candidates)]
+
+    def search(self, executor, side: str, baseline: dict, personas: list, method: str = "both",
+               grid_points: int = 3, candidates: int = 81, repeats: int = 10, eta: int = 3) -> tuple:
+        """Return the best FINALISTS (metrics, candidate) pairs for `side`, best first."""
+        space = SEARCH_SPACE[side]
+        current = baseline["seller"] if side == "seller" else baseline["buyer"][personas[0]]
+        pool = [_clean({k: current[k] for k in space})]   # the current parameters always compete
+
+        if method in ("grid", "both"):
+            scored = self.score_all(executor, side, grid_candidates(space, grid_points), baseline, personas, repeats)
+            scored.sort(key=lambda item: item[0]["score"], reverse=True)
+            if method == "grid":
+                return scored[:FINALISTS]
+            pool += [candidate for _, candidate in scored[:max(1, candidates // eta)]]
+        pool += random_candidates(space, max(0, candidates - len(pool)), self.rng)
+
+        # Successive halving: keep the best 1/eta and give them eta times the repeats
+        finalists = []
+        while True:
+            scored = self.score_all(executor, side, pool, baseline, personas, repeats)
+            scored.sort(key=lambda item: item[0]["score"], reverse=True)
+            if len(pool) == 1:
+                # The winner first, then the runners-up of the last rung that had any
+                return scored + [item for item in finalists if item[1] != scored[0][1]][:FINALISTS - 1]
+            finalists = scored[:FINALISTS]
+            pool = [candidate for _, candidate in scored[:max(1, math.ceil(len(pool) / eta))]]
+            repeats *= eta
+
+    def confirm(self, side: str, finalists: list, overrides: dict, personas: list) -> tuple:
+        """Rescore `finalists` with the agents; return (candidate, before, after), candidate None to keep the file's."""
+        before = evaluate_agents(side, {}, overrides, self.products, personas, self.weights)
+        scored = [(evaluate_agents(side, candidate, overrides, self.products, personas, self.weights), candidate)
+                  for _, candidate in finalists]
+        after, best = max(scored, key=lambda item: item[0]["score"])
+        if after["score"] <= before["score"] or after["dealRate"] < min(MIN_DEAL_RATE, before["dealRate"]):
+            return None, before, after
+        return best, before, after
+
+
+def baseline_params(params, personas: list) -> dict:
+    return {"buyer": {p: params.buyer(p) for p in personas}, "seller": params.seller()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune BuyerAgent/SellerAgent thresholds with the rule-only simulator")
+    parser.add_argument("--side", choices=["buyer", "seller", "both"], default="buyer")
+    parser.add_argument("--personas", default=",".join(PERSONAS), help="Buyer personas to tune / play against")
+    parser.add_argument("--method", choices=["grid", "halving", "both"], default="both")
+    parser.add_argument("--grid-points", type=int, default=3, help="Values per parameter in the coarse grid")
+    parser.add_argument("--candidates", type=int, default=81, help="Candidates entering successive halving")
+    parser.add_argument("--repeats", type=int, default=10, help="Simulations per product/persona in the first rung")
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--weights", help="e.g. 'deal=1,rounds=0.2,margin=2'")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--params", default=PERSONA_PARAMS_FILE, help="Parameter file to start from and update")
+    parser.add_argument("--out", help="Where to write the tuned file (default: --params)")
+    args = parser.parse_args()
+
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (args.weights or "").split(",")):
+        key, _, value = part.partition("=")
+        weights[key.strip()] = float(value)
+
+    with open("products.json", "r") as f:
+        products = json.load(f)
+    personas = [p.strip() for p in args.personas.split(",")]
+    try:
+        with open(args.params, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except FileNotFoundError:
+        overrides = {}
+    overrides.setdefault("buyer", {})
+    overrides.setdefault("seller", {})
+
+    tuner = Tuner(products, weights, args.workers, args.seed)
+    search = dict(method=args.method, grid_points=args.grid_points, candidates=args.candidates,
+                  repeats=args.repeats, eta=args.eta)
+    report = {}
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=tuner.workers) as executor:
+        if args.side in ("seller", "both"):
+            baseline = baseline_params(load_persona_params(args.params), personas)
+            before = evaluate("seller", {}, baseline, products, personas, args.repeats * 9, weights, args.seed)
+            finalists = tuner.search(executor, "seller", baseline, personas, **search)
+            best, agents_before, agents_after = tuner.confirm("seller", finalists, overrides, personas)
+            report["seller"] = {"before": before, "agentsBefore": agents_before, "agentsAfter": agents_after}
+            if best is None:
+                print(f"⏸️  seller: no candidate beat the current parameters with the agents ({agents_before} vs {agents_after})")
+            else:
+                after = evaluate("seller", best, baseline, products, personas, args.repeats * 9, weights, args.seed)
+                overrides = with_candidate(overrides, "seller", best, personas)
+                report["seller"].update({"after": after, "params": best})
+                print(f"🏷️  seller: {before} -> {after}; agents {agents_before} -> {agents_after}")
+        if args.side in ("buyer", "both"):
+            tuned = PersonaParams(overrides)   # includes a seller tuned just above
+            for persona in personas:
+                baseline = baseline_params(tuned, [persona])
+                before = evaluate("buyer", {}, baseline, products, [persona], args.repeats * 9, weights, args.seed)
+                finalists = tuner.search(executor, "buyer", baseline, [persona], **search)
+                best, agents_before, agents_after = tuner.confirm("buyer", finalists, overrides, [persona])
+                report[persona] = {"before": before, "agentsBefore": agents_before, "agentsAfter": agents_after}
+                if best is None:
+                    print(f"⏸️  {persona}: no candidate beat the current parameters with the agents "
+                          f"({agents_before} vs {agents_after})")
+                    continue
+                after = evaluate("buyer", best, baseline, products, [persona], args.repeats * 9, weights, args.seed)
+                overrides = with_candidate(overrides, "buyer", best, [persona])
+                report[persona].update({"after": after, "params": best})
+                print(f"🛒 {persona}: {before} -> {after}; agents {agents_before} -> {agents_after}")
+
+    overrides["tuning"] = {"weights": weights, "evaluations": tuner.evaluations,
+                           "elapsed": round(time.time() - started, 2), "report": report}
+    out = args.out or args.params
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(overrides, f, indent=2)
+    print(f"✅ {tuner.evaluations} evaluations in {overrides['tuning']['elapsed']}s; wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+from llm_api import preload_model
+from agents.seller_agent import SELLER_PERSONAS, SellerAgent
+from negotiation_engine.routing import router
+
+WARMUP_ENABLED = os.environ.get("NEGOTIATOR_WARMUP", "0") == "1"
+WARMUP_RETRY_SECONDS = 30.0   # wait after a failed warm-up before trying again
+
+
+class WarmupState:
+    """Background warm-up: loads the model, then precomputes each opening seller turn.
+
+    A failed warm-up is retried every WARMUP_RETRY_SECONDS; until one succeeds the
+    worker reports not ready.
+    """
+
+    def __init__(self, retry_seconds=WARMUP_RETRY_SECONDS):
+        self.status = "disabled"   # disabled -> running -> ready | failed (-> running again)
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.attempts = 0
+        self.retry_seconds = retry_seconds
+        self.opening_turns = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, products, build_context, opening_message, personas=None):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.status = "running"
+            self.started_at = time.time()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(products, build_context, opening_message, personas or SELLER_PERSONAS),
+                name="negotiator-warmup",
+                daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, products, build_context, opening_message, personas):
+        while True:
+            self.attempts += 1
+            self.status = "running"
+            try:
+                self._warm(products, build_context, opening_message, personas)
+                self.error = None
+                self.status = "ready"
+                self.finished_at = time.time()
+                return
+            except Exception as e:
+                self.error = str(e)
+                self.status = "failed"
+                self.finished_at = time.time()
+            time.sleep(self.retry_seconds)
+
+    def _warm(self, products, build_context, opening_message, personas):
+        for model in router.models():
+            preload_model(model)
+        for product in products:
+            for persona in personas:
+                context = build_context(product)
+                seller = SellerAgent(persona=persona)
+                reply = seller.respond(opening_message(context), context)
+                if seller.last_reply_mode != "llm":
+                    continue   # never serve a degraded or rule fallback reply as a warmed-up opening
+                with self._lock:
+                    self.opening_turns[(product["name"], persona)] = (reply, seller.last_reply_mode)
+
+    def opening_turn(self, product_name: str, persona: str):
+        """(reply, mode) precomputed for this opening, or None."""
+        with self._lock:
+            return self.opening_turns.get((product_name, persona))
+
+    def ready(self) -> bool:
+        # Without warm-up there is nothing to wait for; a failed one is retried before serving
+        return self.status in ("disabled", "ready")
+
+    def report(self) -> dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 2)
+        return {
+            "status": self.status,
+            "ready": self.ready(),
+            "openingTurns": len(self.opening_turns),
+            "elapsed": elapsed,
+            "attempts": self.attempts,
+            "error": self.error
+        }
+
+
+warmup_state = WarmupState()
@@ -1,8 +1,24 @@
-import ollama
-import re
+import argparse
+import csv
+import json
+import sys
 import time
-from datetime import datetime, timedelta
-from llm_api import ask_llama3
+from concurrent.futures import ThreadPoolExecutor
+from agents.buyer_agent import BuyerAgent
+from agents.seller_agent import SellerAgent
+from negotiation_engine.session import BUYER_PREFIX, SELLER_PREFIX, NegotiationSession, find_price
+from negotiation_engine.trace import StdoutSink, Tracer, dispatcher, sinks_from_env
+
+# Set by --quiet: suppresses per-round console output in batch runs
+QUIET = False
+# Diagnostic sinks (--trace / NEGOTIATOR_TRACE_SINKS); offers still reach the console unless quiet
+TRACE_SINKS = []
+CONSOLE = StdoutSink(prefix=False, text_only=True)
+
+def start_trace(console=True, **meta):
+    """Tracer for one negotiation; console output goes through it so the loop never blocks on stdout."""
+    sinks = TRACE_SINKS + ([CONSOLE] if console and not QUIET else [])
+    return Tracer(sinks=sinks, **meta)
 
 # Embedded product data
 PRODUCTS = [
@@ -101,316 +117,6 @@ class Product:
     def __str__(self):
         return f"{self.name} ({self.category}, {self.quality_grade} grade, {self.origin}, ₹{self.base_market_price}/quintal)"
 
-# Base Agent class
-class BaseAgent:
-    def __init__(self, persona, role):
-        self.persona = persona
-        self.role = role  # 'buyer' or 'seller'
-
-    def get_context_summary(self, context):
-        summary = f"{context['Product']} - {context.get('Variety', '')} ({context['Quality Grade']} grade) from {context['Origin']},"
-        for key in context.keys():
-            if key not in summary and key not in ["Price (INR/kg)", "Total Price (INR)"]:
-                if isinstance(context[key], str) and context[key] not in summary:
-                    summary += f" {key}: {context[key]},"
-        return summary.strip(',')
-
-    def respond(self, message, context):
-        system_prompt = PERSONA_TEMPLATES.get(self.persona, "You are a negotiator.") + f" You are playing the role of a {self.role}."
-        try:
-            return ask_llama3(f"Context: {self.get_context_summary(context)}\n{message}", system_prompt=system_prompt)
-        except Exception as e:
-            return f"[ERROR] LLaMA Response Failed: {e}"
-
-# Buyer Agent class
-class BuyerAgent:
-    def __init__(self, persona="Diplomatic"):
-        self.personality = {"personality_type": persona}
-        self.round_num = 0
-        self.target_price = None
-        self.last_offer_from_seller = None
-        self.counter_attempts = 0
-        self.walk_away_triggered = False
-        self.regret_flag = False
-        self.seller_offer_history = []
-        self.suspect_inflation = False
-        self.softening_detected = False
-        self.intent_log = []
-        self.negotiation_outcome = {}
-
-    def extract_price(self, msg: str) -> int:
-        # Remove commas, markdown, and extra characters
-        msg = msg.replace(',', '').replace('**', '').replace('—', '').strip()
-        match = re.search(r"₹(\d{4,5})\s*per\s*quintal", msg, re.IGNORECASE)
-        return int(match.group(1)) if match else None
-
-    def classify_buyer_intent(self, msg: str) -> str:
-        msg = msg.lower()
-        if any(kw in msg for kw in ["accept", "deal", "finalize", "proceed", "confirmed", "we agree", "let's proceed"]):
-            if any(phrase in msg for phrase in ["would you", "could you", "consider", "can you"]):
-                return "counter_offer"
-            return "acceptance"
-        elif any(kw in msg for kw in ["consider", "can you", "would you", "is it possible", "negotiate", "revisit", "revise"]):
-            return "counter_offer"
-        else:
-            return "inquiry"
-
-    def detect_seller_style(self, text: str) -> str:
-        text = text.lower()
-        if "exclusive deal" in text or "premium" in text or "won’t find better" in text:
-            return "Aggressive"
-        elif "market rate" in text or "value" in text or "current pricing" in text:
-            return "Analytical"
-        elif "discount" in text or "flexible" in text or "bulk order" in text:
-            return "Collaborative"
-        else:
-            return "Neutral"
-
-    def switch_persona(self, seller_text: str):
-        if self.personality["personality_type"] != "Adaptive":
-            return
-        style_to_persona = {
-            "Aggressive": "Assertive",
-            "Analytical": "Strategic",
-            "Collaborative": "Diplomatic",
-            "Neutral": "Balanced"
-        }
-        seller_style = self.detect_seller_style(seller_text)
-        new_persona = style_to_persona.get(seller_style, "Diplomatic")
-        if new_persona != self.personality["personality_type"]:
-            print(f"🔄 Switching buyer persona from {self.personality['personality_type']} to {new_persona} based on seller tone.")
-            self.personality["personality_type"] = new_persona
-
-    def get_margin_pct_for_persona(self) -> float:
-        persona_margins = {
-            "Aggressive": 1.0,
-            "Assertive": 1.0,
-            "Analytical": 0.80,
-            "Strategic": 0.80,
-            "Balanced": 0.70,
-            "Diplomatic": 0.69,
-            "Wildcard": 0.75,
-            "Adaptive": 0.70
-        }
-        return persona_margins.get(self.personality["personality_type"], 0.01)
-
-    def get_margin_for_persona(self, product_name=None) -> int:
-        base_margin = int(self.get_margin_pct_for_persona() * (self.last_offer_from_seller or 0))
-        if product_name and product_name.lower() in ["cardamom", "mango", "saffron"]:
-            base_margin += 50
-        return base_margin
-
-    def should_regret_deal(self, final_price: int, market_price: int) -> bool:
-        return final_price > market_price
-
-    def log_regret(self, final_price: int, market_price: float):
-        if final_price and self.should_regret_deal(final_price, market_price):
-            self.regret_flag = True
-            self.negotiation_outcome["regret_reason"] = (
-                f"Accepted ₹{final_price} > market price ₹{int(market_price)}"
-            )
-        else:
-            self.regret_flag = False
-
-    def detect_inflation_pattern(self):
-        if len(self.seller_offer_history) >= 2:
-            prev = self.seller_offer_history[-2]
-            curr = self.seller_offer_history[-1]
-            if prev and curr and curr > prev:
-                delta_pct = (curr - prev) / prev
-                if delta_pct >= 0.10:
-                    self.suspect_inflation = True
-
-    def detect_softening(self):
-        if len(self.seller_offer_history) >= 2:
-            prev = self.seller_offer_history[-2]
-            curr = self.seller_offer_history[-1]
-            if prev and curr and curr < prev:
-                drop_pct = (prev - curr) / prev
-                if drop_pct >= 0.03:
-                    self.softening_detected = True
-
-    def get_persona_tone_prefix(self) -> str:
-        tone_map = {
-            "Aggressive": "Firmly,",
-            "Assertive": "Frankly speaking,",
-            "Analytical": "Based on market analysis,",
-            "Strategic": "Considering the bigger picture,",
-            "Balanced": "Keeping all factors in mind,",
-            "Diplomatic": "With utmost respect and cooperation,",
-            "Wildcard": "Let’s shake things up,",
-            "Adaptive": "With careful consideration,"
-        }
-        return tone_map.get(self.personality["personality_type"], "")
-
-    def respond(self, message: str, context: dict) -> str:
-        self.round_num += 1
-        seller_price = self.extract_price(message)
-        self.last_offer_from_seller = seller_price
-
-        product = context.get("Product", "unknown product")
-        origin = context.get("Origin", context.get("Market", ""))
-        base_price = context.get("Base Market Price", None)
-
-        if self.round_num == 1 and base_price:
-            target_reduction = self.get_margin_pct_for_persona() * 0.05
-            self.target_price = int(base_price * (1 - target_reduction))
-
-        self.switch_persona(message)
-
-        if seller_price:
-            self.seller_offer_history.append(seller_price)
-            self.detect_inflation_pattern()
-            self.detect_softening()
-
-        buyer_intent = self.classify_buyer_intent(message)
-        self.intent_log.append((self.round_num, buyer_intent))
-        print(f"🧠 Buyer Intent Detected (Round {self.round_num}): {buyer_intent} (💭 Thinking...)")
-
-        if self.round_num >= 20:
-            self.walk_away_triggered = True
-            return f"{self.get_persona_tone_prefix()} we’ve reached 20 rounds without a deal. 🚪 Walking away."
-
-        if seller_price is not None:
-            if seller_price <= self.target_price and self.round_num >= 2:
-                self.negotiation_outcome["final_price"] = seller_price
-                return f"{self.get_persona_tone_prefix()} this price of ₹{seller_price} per quintal ensures profit. 💰 Deal finalized!"
-
-            if self.counter_attempts >= 7 and seller_price > self.target_price:
-                self.walk_away_triggered = True
-                return f"{self.get_persona_tone_prefix()} your price of ₹{seller_price} remains unprofitable. 🚪 Walking away."
-
-            discount_factor = 0.85 if self.softening_detected else 0.87
-            counter_offer = max(int(seller_price * discount_factor), self.target_price * 0.90)
-            self.counter_attempts += 1
-
-            if self.suspect_inflation:
-                return f"{self.get_persona_tone_prefix()} I’ve noticed a price increase. Let’s settle at ₹{counter_offer} per quintal. 📉"
-            elif self.softening_detected:
-                return f"{self.get_persona_tone_prefix()} I appreciate your flexibility. Can we close at ₹{counter_offer} per quintal? 💡"
-            else:
-                return f"{self.get_persona_tone_prefix()} your price of ₹{seller_price} is above our target. Please consider ₹{counter_offer} per quintal. 📈"
-
-        return f"{self.get_persona_tone_prefix()} we value your offer, but could you share a competitive rate? 🤔"
-
-    def respond_to_buyer(self, seller_offer: int, round_num: int) -> tuple[int, str, bool]:
-        context = {"Base Market Price": self.target_price}
-        message = f"Your offer is ₹{seller_offer} per quintal." if seller_offer else "No offer yet."
-        response_text = self.respond(message, context)
-        price = self.extract_price(response_text) if self.extract_price(response_text) else seller_offer
-        is_deal = "deal" in response_text.lower() or "accept" in response_text.lower()
-        return price, response_text, is_deal
-
-# Seller Agent class
-class SellerAgent:
-    def __init__(self, persona="Analytical", min_margin=0.10, max_rounds=20):
-        self.persona = persona
-        self.min_margin = min_margin
-        self.max_rounds = max_rounds
-        self.current_round = 0
-        self.accepted = False
-
-    def detect_buyer_style(self, text: str) -> str:
-        text = text.lower()
-        if "firm" in text or "final" in text or "no lower" in text:
-            return "Aggressive"
-        elif "market" in text or "fair" in text or "value" in text:
-            return "Analytical"
-        elif "compromise" in text or "meet halfway" in text or "reasonable" in text:
-            return "Collaborative"
-        else:
-            return "Neutral"
-
-    def switch_persona(self, buyer_text: str):
-        if self.persona != "Adaptive":
-            return
-        style_to_persona = {
-            "Aggressive": "Assertive",
-            "Analytical": "Strategic",
-            "Collaborative": "Diplomatic",
-            "Neutral": "Balanced"
-        }
-        buyer_style = self.detect_buyer_style(buyer_text)
-        new_persona = style_to_persona.get(buyer_style, "Analytical")
-        if new_persona != self.persona:
-            print(f"🔄 Switching seller persona from {self.persona} to {new_persona} based on buyer tone.")
-            self.persona = new_persona
-
-    def respond(self, message: str, context: dict) -> str:
-        self.current_round += 1
-        self.switch_persona(message)
-
-        product = context.get("Product", "unknown product")
-        variety = context.get("Variety", "")
-        origin = context.get("Origin", context.get("Market", ""))
-        order_size = context.get("Order Size (kg)", 100)
-        base_price = context.get("Base Market Price", None)
-        quality = context.get("Quality Grade", "")
-        attributes = context.get("Attributes", {})
-        buyer_offer = context.get("Buyer Offer", None)
-
-        margin = self.min_margin
-        if quality == "A":
-            margin += 0.05
-        if attributes.get("export_grade"):
-            margin += 0.05
-
-        attr_summary = ", ".join([f"{k}: {v}" for k, v in attributes.items()]) if attributes else "no special attributes"
-
-        system_prompt = (
-            f"You are an {self.persona} seller offering {order_size}kg of {quality} grade {product} ({variety}) "
-            f"from {origin}. The product has {attr_summary}."
-        )
-
-        prompt = ""
-        if self.current_round >= self.max_rounds:
-            self.accepted = False
-            prompt = "After 20 rounds, no agreement has been reached. Politely walk away from the deal."
-        elif base_price and buyer_offer:
-            target_price = base_price * (1 + margin)
-            accept_threshold = base_price * 1.10
-
-            if buyer_offer >= accept_threshold:
-                self.accepted = True
-                prompt += (
-                    f"The buyer has offered ₹{buyer_offer:.0f}, which meets your acceptance threshold of ₹{accept_threshold:.0f}. "
-                    "Accept the offer confidently."
-                )
-            elif self.current_round > 12 and buyer_offer < base_price * 1.05:
-                prompt += (
-                    f"The buyer has repeatedly offered below ₹{base_price * 1.05:.0f} even after 12 rounds. "
-                    "Politely walk away from the deal."
-                )
-            else:
-                inflation_rate = 0.15 if self.current_round <= 8 else 0.05
-                counter_offer = int(buyer_offer * (1 + inflation_rate))
-                prompt += (
-                    f"The buyer has offered ₹{buyer_offer:.0f}. Counter with ₹{counter_offer:.0f} "
-                    f"based on a {int(inflation_rate * 100)}% inflation strategy. "
-                )
-        elif base_price:
-            target_price = base_price * (1 + margin)
-            prompt += f"Based on market price ₹{base_price:.0f}, your target price is ₹{target_price:.0f} per quintal. "
-
-        prompt += (
-            f"The buyer says: '{message}'. "
-            "Respond with a smart price offer or counter-offer. Be concise and confident."
-        )
-
-        return ask_llama3(prompt, system_prompt=system_prompt)
-
-    def reset(self):
-        self.current_round = 0
-        self.accepted = False
-
-# Logger function
-def log_round(round_num, buyer_msg, seller_msg, buyer_offer, seller_offer):
-    print(f"\n=== Round {round_num} ===")
-    print(f"Buyer: {buyer_msg}")
-    print(f"Seller: {seller_msg}")
-    print(f"Buyer Offer: ₹{buyer_offer if buyer_offer else 'N/A'} per quintal")
-    print(f"Seller Offer: ₹{seller_offer if seller_offer else 'N/A'} per quintal")
-
 # Load products from embedded data
 def load_products():
     try:
@@ -481,91 +187,14 @@ def select_persona(role):
         except ValueError:
             print("Please enter a valid number.")
 
-# Negotiation for human buyer vs AI seller
-def run_human_buyer_negotiation(buyer_persona, product, buyer_budget=20000, seller_min=16000):
-    buyer_agent = BuyerAgent(persona=buyer_persona)
-    seller_agent = SellerAgent(persona="Analytical")
-    buyer_agent.target_price = product.base_market_price * (1 - buyer_agent.get_margin_pct_for_persona() * 0.05)
-    
-    context = {
-        "Product": product.name,
-        "Origin": product.origin,
-        "Order Size (kg)": product.quantity,
-        "Quality Grade": product.quality_grade,
-        "Base Market Price": product.base_market_price,
-        "Attributes": product.attributes
-    }
-    
-    # Seller opens
-    seller_reply = seller_agent.respond("What’s your offer?", context)
-    seller_offer = buyer_agent.extract_price(seller_reply)
-    print(f"📣 Seller offers: {seller_reply}")
-    
-    result = {
-        "deal_made": False,
-        "final_price": None,
-        "rounds": 0,
-        "opening_price": seller_offer,
-        "market_price": product.base_market_price,
-        "walk_away": False
-    }
-    
-    for round_num in range(1, 21):
-        if buyer_agent.walk_away_triggered or seller_agent.accepted:
-            result["rounds"] = round_num
-            result["walk_away"] = buyer_agent.walk_away_triggered
-            break
-        
-        # Human buyer's turn
-        while True:
-            human_input = input("Enter your response (e.g., 'I offer ₹15000 per quintal', 'accept', or 'walk away'): ")
-            if human_input.lower() in ["accept", "walk away"] or buyer_agent.extract_price(human_input):
-                break
-            print("⚠️ Invalid input. Please use format: 'I offer ₹XXXXX per quintal', 'accept', or 'walk away'.")
-        
-        if "walk away" in human_input.lower():
-            buyer_agent.walk_away_triggered = True
-            result["rounds"] = round_num
-            result["walk_away"] = True
-            break
-        if "accept" in human_input.lower():
-            if seller_offer:
-                result["deal_made"] = True
-                result["final_price"] = seller_offer
-                result["rounds"] = round_num
-                break
-        
-        buyer_offer = buyer_agent.extract_price(human_input)
-        context["Buyer Offer"] = buyer_offer if buyer_offer else seller_offer
-        log_round(round_num, human_input, seller_reply, buyer_offer, seller_offer)
-        
-        # Seller responds
-        seller_reply = seller_agent.respond(human_input, context)
-        seller_offer = buyer_agent.extract_price(seller_reply)
-        print(f"📣 Seller offers: {seller_reply}")
-        
-        if "accept" in seller_reply.lower() and seller_offer:
-            result["deal_made"] = True
-            result["final_price"] = seller_offer
-            result["rounds"] = round_num
-            break
-        
-        result["rounds"] = round_num
-    
-    if round_num == 20 and not result["deal_made"]:
-        buyer_agent.walk_away_triggered = True
-        result["walk_away"] = True
-        print("🚪 Buyer walked away: No deal after 20 rounds.")
-    
-    return result
+# ---------------------------
+# NEGOTIATION RUNNERS (I/O around the shared NegotiationSession engine)
+# ---------------------------
+CLI_MAX_ROUNDS = 20
 
-# Negotiation for human seller vs AI buyer
-def run_human_seller_negotiation(seller_persona, product, buyer_budget=20000, seller_min=16000):
-    buyer_agent = BuyerAgent(persona=seller_persona)  # Buyer persona is selected
-    seller_agent = SellerAgent(persona="Analytical")  # Seller is human, so AI seller uses Analytical
-    buyer_agent.target_price = product.base_market_price * (1 - buyer_agent.get_margin_pct_for_persona() * 0.05)
-    
-    context = {
+def product_context(product):
+    return {
+        "name": product.name,
         "Product": product.name,
         "Origin": product.origin,
         "Order Size (kg)": product.quantity,
@@ -573,156 +202,212 @@ def run_human_seller_negotiation(seller_persona, product, buyer_budget=20000, se
         "Base Market Price": product.base_market_price,
         "Attributes": product.attributes
     }
-    
-    # Human seller opens
+
+def new_session(product, buyer_persona, seller_persona="Analytical", rule_only=False, console=True, **meta):
+    buyer = BuyerAgent(persona=buyer_persona, adaptive=buyer_persona == "Adaptive", max_rounds=CLI_MAX_ROUNDS)
+    seller = SellerAgent(persona=seller_persona, max_rounds=CLI_MAX_ROUNDS, rule_only=rule_only)
+    tracer = start_trace(console=console, product=product.name, buyerPersona=buyer_persona,
+                         sellerPersona=seller_persona, **meta)
+    return NegotiationSession(product_context(product), buyer, seller, max_rounds=CLI_MAX_ROUNDS, min_rounds=1,
+                              tracer=tracer)
+
+def format_message(message, human_role=None):
+    text = message["text"]
+    if message["sender"] == "Seller":
+        who = "Seller (You)" if human_role == "seller" else "Seller"
+        return f"📣 {who} offers: {text.removeprefix(SELLER_PREFIX)}"
+    if message["sender"] == "Buyer":
+        who = "Buyer (You)" if human_role == "buyer" else "Buyer"
+        return f"🛒 {who} offers: {text.removeprefix(BUYER_PREFIX)}"
+    return text
+
+def read_human_turn(prompt, opening=False):
+    example = "'I offer ₹XXXXX per quintal'" if opening else "'I offer ₹XXXXX per quintal', 'accept', or 'walk away'"
     while True:
-        human_input = input("Enter your opening offer (e.g., 'I offer ₹18000 per quintal'): ")
-        seller_offer = buyer_agent.extract_price(human_input)
-        if seller_offer:
-            break
-        print("⚠️ Invalid offer. Please use format: 'I offer ₹XXXXX per quintal'.")
-    print(f"📣 Seller (You) offers: {human_input}")
-    
-    result = {
-        "deal_made": False,
-        "final_price": None,
-        "rounds": 0,
-        "opening_price": seller_offer,
-        "market_price": product.base_market_price,
-        "walk_away": False
+        human_input = input(prompt).strip()
+        if find_price(human_input) or (not opening and human_input.lower() in ["accept", "walk away"]):
+            return human_input
+        print(f"⚠️ Invalid input. Please use format: {example}.")
+
+def session_result(session):
+    deal_made = session.status == "deal"
+    return {
+        "deal_made": deal_made,
+        "final_price": session.final_price if deal_made else None,
+        "rounds": session.round_num,
+        "opening_price": session.opening_price,
+        "market_price": session.context["Base Market Price"],
+        "walk_away": not deal_made,
+        "trace_id": session.tracer.trace_id
     }
-    
-    for round_num in range(1, 21):
-        if buyer_agent.walk_away_triggered:
-            result["rounds"] = round_num
-            result["walk_away"] = True
-            break
-        
-        # Buyer responds
-        buyer_offer, buyer_msg, is_deal = buyer_agent.respond_to_buyer(seller_offer, round_num)
-        print(f"🛒 Buyer offers: {buyer_msg}")
-        
-        if is_deal:
-            result["deal_made"] = True
-            result["final_price"] = buyer_offer
-            result["rounds"] = round_num
-            break
-        
-        log_round(round_num, buyer_msg, human_input, buyer_offer, seller_offer)
-        
-        # Human seller's turn
-        while True:
-            human_input = input("Enter your response (e.g., 'I offer ₹17000 per quintal', 'accept', or 'walk away'): ")
-            if human_input.lower() in ["accept", "walk away"] or buyer_agent.extract_price(human_input):
-                break
-            print("⚠️ Invalid input. Please use format: 'I offer ₹XXXXX per quintal', 'accept', or 'walk away'.")
-        
-        if "walk away" in human_input.lower():
-            buyer_agent.walk_away_triggered = True
-            result["rounds"] = round_num
-            result["walk_away"] = True
-            break
-        if "accept" in human_input.lower():
-            if buyer_offer:
-                result["deal_made"] = True
-                result["final_price"] = buyer_offer
-                result["rounds"] = round_num
-                break
-        
-        seller_offer = buyer_agent.extract_price(human_input)
-        print(f"📣 Seller (You) offers: {human_input}")
-        result["rounds"] = round_num
-    
-    if round_num == 20 and not result["deal_made"]:
-        buyer_agent.walk_away_triggered = True
-        result["walk_away"] = True
-        print("🚪 Buyer walked away: No deal after 20 rounds.")
-    
-    return result
+
+# Negotiation for human buyer vs AI seller
+def run_human_buyer_negotiation(buyer_persona, product):
+    session = new_session(product, buyer_persona, console=False, mode="human_buyer")
+    session.start("What’s your offer?")
+    while session.is_open:
+        if session.next_speaker == "buyer":
+            text = read_human_turn("Enter your response (e.g., 'I offer ₹15000 per quintal', 'accept', or 'walk away'): ")
+            new_messages = session.step(text)[1:]  # the human's own line is already on screen
+        else:
+            new_messages = session.step()
+        for message in new_messages:
+            print(format_message(message, human_role="buyer"))
+    return session_result(session)
+
+# Negotiation for human seller vs AI buyer
+def run_human_seller_negotiation(buyer_persona, product):
+    session = new_session(product, buyer_persona, console=False, mode="human_seller")
+    session.start()
+    while session.is_open:
+        if session.next_speaker == "seller":
+            opening = not session.messages
+            text = read_human_turn(
+                "Enter your opening offer (e.g., 'I offer ₹18000 per quintal'): " if opening else
+                "Enter your response (e.g., 'I offer ₹17000 per quintal', 'accept', or 'walk away'): ",
+                opening=opening
+            )
+            new_messages = session.step(text)
+        else:
+            new_messages = session.step()
+        for message in new_messages:
+            print(format_message(message, human_role="seller"))
+    return session_result(session)
 
 # Autonomous negotiation (BuyerAgent vs SellerAgent)
-def run_autonomous_negotiation(buyer_persona, product, buyer_budget=20000, seller_min=16000):
-    buyer_agent = BuyerAgent(persona=buyer_persona)
-    seller_agent = SellerAgent(persona="Analytical")
-    buyer_agent.target_price = product.base_market_price * (1 - buyer_agent.get_margin_pct_for_persona() * 0.05)
-    
-    context = {
-        "Product": product.name,
-        "Origin": product.origin,
-        "Order Size (kg)": product.quantity,
-        "Quality Grade": product.quality_grade,
-        "Base Market Price": product.base_market_price,
-        "Attributes": product.attributes
-    }
-    
-    # Seller opens
-    seller_reply = seller_agent.respond("What’s your offer?", context)
-    print(f"📣 Seller offers: {seller_reply}")
-    
-    # Buyer makes first offer
-    buyer_offer, buyer_msg, is_deal = buyer_agent.respond_to_buyer(buyer_agent.extract_price(seller_reply), 0)
-    print(f"🛒 Buyer offers: {buyer_msg}")
-    
-    result = {
-        "deal_made": is_deal,
-        "final_price": buyer_offer if is_deal else None,
-        "rounds": 0,
-        "opening_price": buyer_agent.seller_offer_history[0] if buyer_agent.seller_offer_history else None,
-        "market_price": product.base_market_price,
-        "walk_away": False
-    }
-    
-    for round_num in range(1, 21):
-        if result["deal_made"] or buyer_agent.walk_away_triggered or seller_agent.accepted:
-            result["rounds"] = round_num
-            result["walk_away"] = buyer_agent.walk_away_triggered or not seller_agent.accepted
-            break
-        
-        context["Buyer Offer"] = buyer_offer
-        seller_reply = seller_agent.respond(buyer_msg, context)
-        print(f"📣 Seller offers: {seller_reply}")
-        
-        if buyer_agent.extract_price(seller_reply) and "accept" in seller_reply.lower():
-            result["deal_made"] = True
-            result["final_price"] = buyer_agent.extract_price(seller_reply)
-            result["rounds"] = round_num
-            break
-        
-        buyer_offer, buyer_msg, is_deal = buyer_agent.respond_to_buyer(buyer_agent.extract_price(seller_reply), round_num)
-        print(f"🛒 Buyer offers: {buyer_msg}")
-        
-        log_round(round_num, buyer_msg, seller_reply, buyer_offer, buyer_agent.extract_price(seller_reply))
-        
-        result["rounds"] = round_num
-    
-    if round_num == 20 and not result["deal_made"]:
-        result["walk_away"] = True
-        print("🚪 Negotiation ended: No deal after 20 rounds.")
-        result["rounds"] = 20
-    
-    return result
+def run_autonomous_negotiation(buyer_persona, product, seller_persona="Analytical", rule_only=False):
+    session = new_session(product, buyer_persona, seller_persona, rule_only=rule_only, mode="autonomous")
+    session.start("What’s your offer?")
+    for index, message in enumerate(session.turns()):
+        if index:  # the opening inquiry is implied, as in the interactive modes
+            session.tracer.emit("message", sender=message["sender"], text=format_message(message))
+    return session_result(session)
+
+def print_summary(result):
+    print(f"\n📊 Negotiation Summary:")
+    print(f"Deal made: {result['deal_made']}")
+    print(f"Opening price: ₹{result['opening_price'] if result['opening_price'] else 'N/A'} per quintal")
+    print(f"Market price: ₹{result['market_price']} per quintal")
+    print(f"Closed price: ₹{result['final_price'] if result['final_price'] else 'N/A'} per quintal")
+    print(f"Total rounds: {result['rounds']}")
+
+    if result['deal_made'] and result['final_price']:
+        buyer_margin = result['market_price'] - result['final_price']
+        seller_margin = result['final_price'] - (result['market_price'] * 0.9)
+        buyer_profit_percent = (buyer_margin / result['market_price']) * 100 if result['market_price'] else 0
+        seller_profit_percent = (seller_margin / result['market_price']) * 100 if result['market_price'] else 0
+        margin_type = "Profit" if buyer_margin > 0 else "Loss"
+        print(f"Margin for Buyer: ₹{abs(buyer_margin)} ({margin_type}, {buyer_profit_percent:.2f}%) 💸")
+        print(f"Margin for Seller: ₹{abs(seller_margin)} (Profit, {seller_profit_percent:.2f}%) 💰")
+    if result["walk_away"]:
+        print("🚪 Negotiation ended: Walked away due to unprofitable offers or max rounds reached.")
+    print("---")
+
+# ---------------------------
+# NON-INTERACTIVE BATCH MODE
+# ---------------------------
+RESULT_FIELDS = ["run", "product", "buyer_persona", "seller_persona", "deal_made", "final_price",
+                 "rounds", "opening_price", "market_price", "walk_away", "elapsed"]
+
+def find_product(name_or_index: str):
+    products = load_products()
+    if name_or_index.isdigit() and int(name_or_index) < len(products):
+        return products[int(name_or_index)]
+    for product in products:
+        if product.name.lower() == name_or_index.lower():
+            return product
+    raise SystemExit(f"Unknown product '{name_or_index}'. Choose from: {', '.join(p.name for p in products)}")
+
+def run_batch(product, buyer_persona, seller_persona, runs, concurrency, rule_only):
+    """Run `runs` autonomous negotiations on a thread pool and return their result dicts."""
+    def run_one(run_index):
+        start = time.time()
+        result = run_autonomous_negotiation(buyer_persona, product, seller_persona=seller_persona, rule_only=rule_only)
+        result.update({
+            "run": run_index,
+            "product": product.name,
+            "buyer_persona": buyer_persona,
+            "seller_persona": seller_persona,
+            "elapsed": round(time.time() - start, 4)
+        })
+        return result
+
+    if concurrency <= 1:
+        return [run_one(i) for i in range(runs)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run_one, range(runs)))
+
+def write_results(results, output_format, out):
+    if output_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        json.dump(results, out, ensure_ascii=False, indent=2)
+        out.write("\n")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI negotiation agent. Without flags, runs interactively.")
+    parser.add_argument("--product", help="Product name or index from the product list")
+    parser.add_argument("--mode", choices=["human_buyer", "human_seller", "autonomous"])
+    parser.add_argument("--buyer-persona", choices=list(PERSONA_TEMPLATES) + ["Adaptive"])
+    parser.add_argument("--seller-persona", choices=list(PERSONA_TEMPLATES) + ["Adaptive"])
+    parser.add_argument("--runs", type=int, default=1, help="Autonomous runs to execute (batch mode)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Autonomous runs in parallel")
+    parser.add_argument("--output", choices=["json", "csv"], help="Write result dicts in this format")
+    parser.add_argument("--out", help="Output file (default: stdout)")
+    parser.add_argument("--rule-only", action="store_true", help="Seller answers from its pricing rules, no LLM calls")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Suppress per-round console output")
+    parser.add_argument("--trace", help="Diagnostic trace sinks, e.g. 'stdout' or 'jsonl:trace.jsonl'")
+    return parser.parse_args()
 
 # Main function
 if __name__ == "__main__":
+    args = parse_args()
+    QUIET = args.quiet
+    TRACE_SINKS = sinks_from_env(args.trace)
+
+    # Batch mode: everything comes from flags, no prompts
+    if args.output or args.runs > 1:
+        if args.mode not in (None, "autonomous"):
+            raise SystemExit("Batch mode only supports --mode autonomous.")
+        if not args.product:
+            raise SystemExit("Batch mode needs --product.")
+        results = run_batch(
+            find_product(args.product),
+            args.buyer_persona or "Diplomatic",
+            args.seller_persona or "Analytical",
+            args.runs,
+            args.concurrency,
+            args.rule_only
+        )
+        dispatcher.flush()
+        if args.out:
+            with open(args.out, "w", encoding="utf-8", newline="") as f:
+                write_results(results, args.output or "json", f)
+        else:
+            write_results(results, args.output or "json", sys.stdout)
+        sys.exit(0)
+
     # Select product
-    selected_product = select_product()
-    
+    selected_product = find_product(args.product) if args.product else select_product()
+
     # Select negotiation mode
-    mode = select_mode()
-    
+    mode = args.mode or select_mode()
+
     # Select persona based on mode
     if mode == "human_buyer":
-        buyer_persona = select_persona("Buyer")
+        buyer_persona = args.buyer_persona or select_persona("Buyer")
         seller_persona = "Analytical"
     elif mode == "human_seller":
-        buyer_persona = select_persona("Buyer")  # Select persona for AI Buyer
-        seller_persona = select_persona("Seller")  # Select persona for human Seller
+        buyer_persona = args.buyer_persona or select_persona("Buyer")  # Select persona for AI Buyer
+        seller_persona = args.seller_persona or select_persona("Seller")  # Select persona for human Seller
     else:  # autonomous
-        buyer_persona = select_persona("Buyer")
-        seller_persona = "Analytical"
-    
+        buyer_persona = args.buyer_persona or select_persona("Buyer")
+        seller_persona = args.seller_persona or "Analytical"
+
     print(f"\n🌟 === Negotiating for {selected_product.name} === 🌟")
-    
+
     # Run negotiation based on mode
     if mode == "human_buyer":
         print(f"🎉 *** STARTING NEGOTIATION: You as Buyer (Persona: {buyer_persona}) vs AI Seller (Persona: {seller_persona}) *** 🎉")
@@ -732,24 +417,8 @@ if __name__ == "__main__":
         result = run_human_seller_negotiation(buyer_persona, selected_product)  # Pass buyer_persona
     else:  # autonomous
         print(f"🎉 *** STARTING NEGOTIATION: AI Buyer (Persona: {buyer_persona}) vs AI Seller (Persona: {seller_persona}) *** 🎉")
-        result = run_autonomous_negotiation(buyer_persona, selected_product)
-    
-    # Print negotiation summary
-    print(f"\n📊 Negotiation Summary:")
-    print(f"Deal made: {result['deal_made']}")
-    print(f"Opening price: ₹{result['opening_price'] if result['opening_price'] else 'N/A'} per quintal")
-    print(f"Market price: ₹{result['market_price']} per quintal")
-    print(f"Closed price: ₹{result['final_price'] if result['final_price'] else 'N/A'} per quintal")
-    print(f"Total rounds: {result['rounds']}")
-    
-    if result['deal_made'] and result['final_price']:
-        buyer_margin = result['market_price'] - result['final_price']
-        seller_margin = result['final_price'] - (result['market_price'] * 0.9)
-        buyer_profit_percent = (buyer_margin / result['market_price']) * 100 if result['market_price'] else 0
-        seller_profit_percent = (seller_margin / result['market_price']) * 100 if result['market_price'] else 0
-        margin_type = "Profit" if buyer_margin > 0 else "Loss"
-        print(f"Margin for Buyer: ₹{abs(buyer_margin)} ({margin_type}, {buyer_profit_percent:.2f}%) 💸")
-        print(f"Margin for Seller: ₹{abs(seller_margin)} (Profit, {seller_profit_percent:.2f}%) 💰")
-    if result["walk_away"]:
-        print("🚪 Negotiation ended: Walked away due to unprofitable offers or max rounds reached.")
-    print("---")
\ No newline at end of file
+        result = run_autonomous_negotiation(buyer_persona, selected_product, seller_persona=seller_persona, rule_only=args.rule_only)
+
+    # Print negotiation summary once the queued round output is on screen
+    dispatcher.flush()
+    print_summary(result)
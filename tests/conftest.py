@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """Run from the repo root, where products.json and data/ live, like the app and the CLI."""
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def products():
+    import json
+    with open(os.path.join(ROOT, "products.json"), "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def no_llm(monkeypatch):
+    """Answer every seller turn from the computed numbers, as in degraded mode."""
+    import llm_api
+    monkeypatch.setattr(llm_api.latency_tracker, "should_use_llm", lambda: False)
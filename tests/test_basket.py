@@ -0,0 +1,22 @@
+from negotiation_engine.basket import BasketNegotiation
+from negotiation_engine.persona_params import PersonaParams
+from negotiation_engine.session import build_context, find_price
+
+# A seller that accepts the buyer's first counter, and a buyer whose target is well below it,
+# so the buyer would counter again right after the seller's "Deal confirmed"
+EAGER_SELLER = PersonaParams({"seller": {"default": {"accept_ratio": 0.85}},
+                              "buyer": {"default": {"margin_pct": 4.0}}})
+
+
+def test_basket_closes_at_the_offer_the_seller_accepted(products, no_llm):
+    basket = BasketNegotiation([build_context(p) for p in products], min_rounds=1)
+    for line in basket.lines:
+        line.session.seller.param_source = line.session.buyer.param_source = EAGER_SELLER
+    basket.run(lambda context: "What’s your offer?")
+
+    for line in basket.lines:
+        session = line.session
+        accepts = [m["text"] for m in session.messages if m["sender"] == "Seller" and "I accept" in m["text"]]
+        assert session.status == "deal" and accepts, line.name
+        assert session.final_price == find_price(accepts[-1]), line.name
+        assert session.messages[-2]["sender"] == "Seller", "the deal closes on the seller's accept"
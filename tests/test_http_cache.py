@@ -0,0 +1,55 @@
+from data import http_cache
+from data.http_cache import HttpCache
+
+URL = "https://example.com/prices/coffee"
+PAGE = "<table><tr><td>Coffee</td><td>18500</td></tr></table>"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str = "", headers: dict = None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise http_cache.requests.HTTPError(self.status_code)
+
+
+def serve(monkeypatch, *responses):
+    """Answer successive requests.get calls with `responses`; returns the request headers seen."""
+    sent, queue = [], list(responses)
+
+    def get(url, headers=None, timeout=None):
+        sent.append(headers)
+        return queue.pop(0)
+
+    monkeypatch.setattr(http_cache.requests, "get", get)
+    return sent
+
+
+def test_not_modified_serves_the_cached_body_and_rows(monkeypatch, tmp_path):
+    cache = HttpCache(str(tmp_path))
+    validators = {"ETag": '"v1"', "Last-Modified": "Mon, 19 Oct 2026 06:00:00 GMT"}
+    sent = serve(monkeypatch, FakeResponse(200, PAGE, validators), FakeResponse(304))
+    first = cache.fetch(URL)
+    assert first.changed and first.rows is None
+    cache.store_rows(URL, [{"product": "Coffee", "price": 18500}])
+
+    second = cache.fetch(URL)
+    assert sent[1]["If-None-Match"] == '"v1"'
+    assert sent[1]["If-Modified-Since"] == "Mon, 19 Oct 2026 06:00:00 GMT"
+    assert (second.status, second.changed, second.text) == (304, False, PAGE)
+    assert second.rows == [{"product": "Coffee", "price": 18500}]
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".html", ".json"]   # no temp files left behind
+
+
+def test_an_identical_body_is_unchanged(monkeypatch, tmp_path):
+    cache = HttpCache(str(tmp_path))
+    serve(monkeypatch, FakeResponse(200, PAGE), FakeResponse(200, PAGE))
+    cache.fetch(URL)
+    cache.store_rows(URL, [{"product": "Coffee", "price": 18500}])
+
+    again = cache.fetch(URL)
+    assert not again.changed and again.rows == [{"product": "Coffee", "price": 18500}]
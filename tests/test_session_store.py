@@ -0,0 +1,64 @@
+import pytest
+
+from agents.buyer_agent import BuyerAgent
+from agents.seller_agent import SellerAgent
+from negotiation_engine.session import NegotiationSession, build_context
+from negotiation_engine.session_state import SessionExpired, SessionStore, StaleSession
+
+
+@pytest.fixture
+def service(monkeypatch, no_llm):
+    import app
+    monkeypatch.setattr(app, "session_store", SessionStore(app.session_store.context_factory, max_sessions=1))
+    return app
+
+
+def start(service, product="Coffee"):
+    response = service.app.test_client().post("/session", json={"product": product})
+    assert response.status_code == 201
+    return response.get_json()["sessionId"]
+
+
+def test_a_save_from_an_older_copy_is_rejected(products, no_llm, tmp_path):
+    context_factory = lambda name: build_context(next(p for p in products if p["name"] == name))
+    session = NegotiationSession(context_factory("Coffee"), BuyerAgent(), SellerAgent())
+    session.start("What’s your offer?")
+    # Two workers sharing one session directory
+    first, second = (SessionStore(context_factory, spill_dir=str(tmp_path)) for _ in range(2))
+    first.save(session)
+
+    mine, theirs = first.load(session.session_id), second.load(session.session_id)
+    theirs.step()
+    second.save(theirs)
+    mine.step()
+    with pytest.raises(StaleSession):
+        first.save(mine)
+    assert first.load(session.session_id).revision == theirs.revision
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_an_evicted_session_has_expired(service):
+    session_id = start(service)
+    stale = service.session_store.load(session_id)
+    start(service)   # max_sessions=1: evicts the first
+
+    with pytest.raises(SessionExpired):
+        service.session_store.load(session_id)
+    with pytest.raises(SessionExpired):
+        service.session_store.save(stale)
+
+
+def test_step_endpoints_answer_409_and_410(service, monkeypatch):
+    client = service.app.test_client()
+    session_id = start(service)
+    stale = service.session_store.load(session_id)
+    assert client.post(f"/session/{session_id}/step").status_code == 200
+
+    # A concurrent step that loaded the session before the one above saved
+    with monkeypatch.context() as patch:
+        patch.setattr(service.session_store, "load", lambda _: stale)
+        assert client.post(f"/session/{session_id}/step").status_code == 409
+
+    start(service)
+    assert client.get(f"/session/{session_id}").status_code == 410
+    assert client.post(f"/session/{session_id}/step").status_code == 410
@@ -0,0 +1,9 @@
+from negotiation_engine.simulator import MIN_DEAL_RATE, agent_outcomes, parity
+
+
+def test_simulate_ends_every_negotiation_like_the_agents(products):
+    assert parity(products) == []
+
+
+def test_rule_only_agents_reach_deals(products):
+    assert agent_outcomes(products)["dealRate"] >= MIN_DEAL_RATE